@@ -0,0 +1,768 @@
+"""Offline load generator and benchmark for the quiz bot.
+
+Drives FormBot through the real python-telegram-bot Dispatcher with simulated
+users, a stub Telegram bot and a stub Sheets client, so no network access or
+credentials are needed. Telegram and Sheets round trips are simulated with a
+configurable sleep.
+
+Simulated users pick random answers, toggle one to three options on
+multi-select questions, occasionally press Back, and a share of them give a
+disqualifying answer. Each run reports p50/p95/p99 handler latency (time
+spent inside the Dispatcher), end-to-end latency, throughput and the memory
+held per in-progress session. Sessions go through the SQLite session store,
+as in production, unless ``--session-store memory`` is given.
+
+Startup is measured in fresh interpreters: the time to import main, and to
+have FormBot and its Updater ready (cold start) without touching the network.
+
+The webhook mode POSTs synthetic update JSON to the built-in webhook listener
+over local HTTP, measuring end-to-end latency without Telegram.
+
+Results can be saved as JSON and compared against an earlier run; the
+benchmark exits with status 1 when a metric regresses beyond the tolerance.
+
+Examples:
+    python benchmark.py --mode both --users 20
+    python benchmark.py --mode async --users 500 --api-latency 0.05
+    python benchmark.py --mode webhook --users 200
+    python benchmark.py --save baseline.json
+    python benchmark.py --compare baseline.json --tolerance 0.15
+    python benchmark.py --mode threaded --logging queued
+    python benchmark.py --mode threaded --startup-runs 10
+"""
+import os
+import sys
+import json
+import time
+import queue
+import random
+import asyncio
+import logging
+import argparse
+import tempfile
+import itertools
+import threading
+import statistics
+import subprocess
+import tracemalloc
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from telegram import Update, User, Chat, Message, MessageEntity, CallbackQuery
+from telegram.ext import Dispatcher, TypeHandler
+
+import main
+from utils.async_pipeline import AsyncUpdatePipeline
+from utils.webhook_server import WebhookServer
+from utils.keyboards import build_keyboard, decode_callback, DONE_ACTION, BACK_ACTION
+from utils.quiz_schema import QuizSchema
+from utils.rate_limiter import OutboundScheduler, RateLimitedMixin, PRIORITY_NAMES
+from utils.logging_setup import configure_logging
+from utils.session_store import SqliteSessionPersistence
+
+logger = logging.getLogger(__name__)
+
+QUESTIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'questions.json')
+
+# Answers that end the quiz early, by question ID
+DISQUALIFYING_ANSWERS = {
+    'confidentiality': 'No',
+    'enforcement_affiliation': 'Yes',
+    'reporting_role': 'Yes',
+    'mission_alignment': 'Do not agree'
+}
+
+# Metrics compared between runs; everything not listed here is better when lower
+HIGHER_IS_BETTER = ('updates_per_sec', 'completions_per_sec')
+COMPARED_METRICS = HIGHER_IS_BETTER + (
+    'handler_p50', 'handler_p95', 'handler_p99', 'completion_p50', 'completion_p99', 'bytes_per_session', 'unshared_bytes_per_session',
+    'cached_us_per_render', 'import_seconds', 'cold_start_seconds'
+)
+
+# Run in a fresh interpreter by measure_startup; prints the timings as JSON
+STARTUP_SCRIPT = '''
+import json, tempfile, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+class StubSheetsHelper:
+    def append_rows(self, rows):
+        return True
+
+bot = main.FormBot(sheets_helper=StubSheetsHelper(), data_dir=tempfile.mkdtemp(prefix='quizbot-bench-'))
+main.build_updater('123456:BENCHMARK', bot)
+ready = time.perf_counter()
+bot.shutdown()
+print(json.dumps({'import_seconds': imported - started, 'cold_start_seconds': ready - started}))
+'''
+
+class StubBot:
+    """Stands in for telegram.Bot; records messages and sleeps to simulate API latency."""
+
+    username = 'quiz_benchmark_bot'
+    first_name = 'Benchmark'
+    id = 1
+    defaults = None
+
+    def __init__(self, api_latency=0.0):
+        self.api_latency = api_latency
+        self.api_calls = 0
+        self.last_message = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @property
+    def name(self):
+        return f'@{self.username}'
+
+    def _call(self):
+        with self._lock:
+            self.api_calls += 1
+        if self.api_latency:
+            time.sleep(self.api_latency)
+
+    def _message(self, chat_id, text, reply_markup=None, message_id=None):
+        message = Message(
+            message_id or next(self._ids), datetime.now(), Chat(chat_id, 'private'),
+            text=text, reply_markup=reply_markup, bot=self
+        )
+        self.last_message[chat_id] = message
+        return message
+
+    def send_message(self, chat_id, text, reply_markup=None, **kwargs):
+        self._call()
+        return self._message(chat_id, text, reply_markup)
+
+    def edit_message_text(self, text, chat_id=None, message_id=None, reply_markup=None, **kwargs):
+        self._call()
+        return self._message(chat_id, text, reply_markup, message_id)
+
+    def answer_callback_query(self, callback_query_id, **kwargs):
+        self._call()
+        return True
+
+class RateLimitedStubBot(RateLimitedMixin, StubBot):
+    """StubBot whose calls go through an OutboundScheduler, like RateLimitedBot."""
+
+    def __init__(self, api_latency=0.0):
+        super().__init__(api_latency)
+        # callback_query_id -> Future of its answer, until the user has seen it
+        self.answers = {}
+
+    def answer_callback_query(self, callback_query_id, **kwargs):
+        future = super().answer_callback_query(callback_query_id, **kwargs)
+        self.answers[callback_query_id] = future
+        return future
+
+class StubSheetsHelper:
+    """Stands in for SheetsHelper; sleeps once per append call."""
+
+    def __init__(self, api_latency=0.0):
+        self.api_latency = api_latency
+        self.rows = []
+
+    def append_rows(self, rows):
+        if self.api_latency:
+            time.sleep(self.api_latency)
+        self.rows.extend(rows)
+        return True
+
+    def append_row(self, row_data):
+        return self.append_rows([row_data])
+
+    def get_existing_keys(self):
+        return set()
+
+class SimulatedUser:
+    """Walks one user through the quiz by reacting to the bot's last message."""
+
+    _update_ids = itertools.count(1)
+
+    def __init__(self, user_id, bot, rng, schema, back_rate=0.05, disqualify_rate=0.05, max_backs=3):
+        self.user = User(user_id, f'User{user_id}', False, username=f'user{user_id}')
+        self.chat = Chat(user_id, 'private')
+        self.bot = bot
+        self.rng = rng
+        self.schema = schema
+        self.back_rate = back_rate
+        self.backs_left = max_backs
+        self.toggles_left = None
+        self.done = False
+        self.disqualified = False
+        self.back_presses = 0
+        # Question this user answers with a disqualifying option, if any
+        self.disqualify_on = None
+        candidates = [q for q in DISQUALIFYING_ANSWERS if schema.get(q) is not None]
+        if candidates and rng.random() < disqualify_rate:
+            self.disqualify_on = rng.choice(candidates)
+
+    def _message(self, text):
+        entities = [MessageEntity(MessageEntity.BOT_COMMAND, 0, len(text))] if text.startswith('/') else None
+        return Message(
+            next(self._update_ids), datetime.now(), self.chat,
+            from_user=self.user, text=text, entities=entities, bot=self.bot
+        )
+
+    def _question_for(self, text):
+        """Find the question a message asks from its "N. " prefix."""
+        number, _, _ = text.partition('.')
+        try:
+            return self.schema[int(number) - 1]
+        except (ValueError, IndexError):
+            return None
+
+    def first_update(self):
+        return Update(next(self._update_ids), message=self._message('/start'))
+
+    def _pick(self, question, buttons):
+        """Pick an answer button, avoiding disqualifying ones unless this user is meant to give one."""
+        question_id = question.id if question else None
+        bad_answer = DISQUALIFYING_ANSWERS.get(question_id)
+        for button in buttons:
+            if button.text == bad_answer and question_id == self.disqualify_on:
+                return button
+        return self.rng.choice([b for b in buttons if b.text != bad_answer] or buttons)
+
+    def next_update(self):
+        """Build the user's next update, or return None once the quiz is finished."""
+        last = self.bot.last_message.get(self.chat.id)
+        if last is None or last.text.startswith(('Thank you', 'We apologize')):
+            self.done = True
+            self.disqualified = last is not None and last.text.startswith('We apologize')
+            return None
+
+        options, done, back = [], None, None
+        if last.reply_markup:
+            for row in last.reply_markup.inline_keyboard:
+                for button in row:
+                    action = decode_callback(button.callback_data)[2]
+                    if action == DONE_ACTION:
+                        done = button
+                    elif action == BACK_ACTION:
+                        back = button
+                    else:
+                        options.append(button)
+        if not options:
+            return Update(next(self._update_ids), message=self._message('Simulated text response'))
+
+        question = self._question_for(last.text)
+        if back and self.toggles_left is None and self.backs_left > 0 and self.rng.random() < self.back_rate:
+            # Back is only pressed on arriving at a question, before any toggles
+            self.backs_left -= 1
+            self.back_presses += 1
+            pressed = back
+        elif done:
+            if self.toggles_left is None:
+                # Distinct options, so the toggles never cancel out into an empty selection
+                self.toggles_left = self.rng.sample(options, self.rng.randint(1, min(3, len(options))))
+            if self.toggles_left:
+                pressed = self.toggles_left.pop()
+            else:
+                self.toggles_left = None
+                pressed = done
+        else:
+            pressed = self._pick(question, options)
+        query = CallbackQuery(
+            str(next(self._update_ids)), self.user, 'benchmark',
+            message=last, data=pressed.callback_data, bot=self.bot
+        )
+        return Update(next(self._update_ids), callback_query=query)
+
+def build_dispatcher(bot, form_bot, on_processed, on_started=None, persistence=None):
+    """Register FormBot handlers the same way main() does, plus timing hooks."""
+    dp = Dispatcher(bot, queue.Queue(), use_context=True, persistence=persistence)
+    main.register_handlers(dp, form_bot)
+    if on_started is not None:
+        # Runs before the quiz handlers (lower group) for every update
+        dp.add_handler(TypeHandler(Update, lambda update, context: on_started(update)), group=-1)
+    # Runs after the quiz handlers (higher group) for every update
+    dp.add_handler(TypeHandler(Update, lambda update, context: on_processed(update)), group=99)
+    return dp
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list (0.0 when empty)."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+class LoadRun:
+    """Closed-loop load: each user sends its next update once the previous one is processed."""
+
+    def __init__(self, users, api_latency, sheets_latency, seed=1, back_rate=0.05, disqualify_rate=0.05,
+                 rate_limit=False, session_store='sqlite'):
+        if rate_limit:
+            self.bot = RateLimitedStubBot(api_latency)
+            self.bot.scheduler = OutboundScheduler()
+        else:
+            self.bot = StubBot(api_latency)
+        self.data_dir = tempfile.mkdtemp(prefix='quizbot-bench-')
+        self.form_bot = main.FormBot(sheets_helper=StubSheetsHelper(sheets_latency), data_dir=self.data_dir)
+        # The dispatcher persists every session after every update, as build_updater sets it up
+        self.persistence = None
+        if session_store == 'sqlite':
+            self.persistence = SqliteSessionPersistence(os.path.join(self.data_dir, 'sessions.db'))
+        rng = random.Random(seed)
+        schema = self.form_bot.schemas.current
+        self.users = {
+            uid: SimulatedUser(uid, self.bot, rng, schema, back_rate, disqualify_rate)
+            for uid in range(1000, 1000 + users)
+        }
+        self.sent_at = {}
+        self.started_at = {}
+        self.latencies = []
+        self.handler_latencies = []
+        # Handler latency of each user's last update, which finishes the form
+        self.completion_latencies = []
+        self.remaining = users
+        self.finished = threading.Event()
+        self._lock = threading.Lock()
+        self.submit = None
+
+    def send(self, update):
+        self.sent_at[update.update_id] = time.perf_counter()
+        self.submit(update)
+
+    def on_started(self, update):
+        self.started_at[update.update_id] = time.perf_counter()
+
+    def on_processed(self, update):
+        now = time.perf_counter()
+        latency = now - self.sent_at.pop(update.update_id)
+        handler_latency = now - self.started_at.pop(update.update_id)
+        user = self.users[update.effective_user.id]
+        if isinstance(self.bot, RateLimitedStubBot):
+            self.after_delivery(update, user, lambda: self.advance(user, latency, handler_latency))
+        else:
+            self.advance(user, latency, handler_latency)
+
+    def after_delivery(self, update, user, react):
+        """Call ``react`` once the rate-limited bot has sent the update's answer and the user's replies."""
+        query_id = update.callback_query.id if update.callback_query else None
+        waiting = next((
+            future for future in (self.bot.answers.get(query_id), self.bot.scheduler.pending(user.chat.id))
+            if future is not None and not future.done()
+        ), None)
+        if waiting is None:
+            self.bot.answers.pop(query_id, None)
+            react()
+        else:
+            waiting.add_done_callback(lambda _: self.after_delivery(update, user, react))
+
+    def advance(self, user, latency, handler_latency):
+        next_update = user.next_update()
+        with self._lock:
+            self.latencies.append(latency)
+            self.handler_latencies.append(handler_latency)
+            if next_update is None:
+                self.completion_latencies.append(handler_latency)
+                self.remaining -= 1
+                if self.remaining == 0:
+                    self.finished.set()
+                return
+        self.send(next_update)
+
+    def report(self, mode, elapsed):
+        self.form_bot.shutdown()
+        if self.persistence is not None:
+            self.persistence.flush()
+        outbound = {}
+        if isinstance(self.bot, RateLimitedStubBot):
+            self.bot.scheduler.stop()
+            outbound = self.bot.scheduler.get_stats()
+        latencies = sorted(self.latencies)
+        handler_latencies = sorted(self.handler_latencies)
+        completion_latencies = sorted(self.completion_latencies)
+        count = len(latencies)
+        return {
+            'mode': mode,
+            'users': len(self.users),
+            'updates': count,
+            'elapsed': elapsed,
+            'updates_per_sec': count / elapsed if elapsed else 0.0,
+            'completions_per_sec': len(self.users) / elapsed if elapsed else 0.0,
+            'handler_p50': percentile(handler_latencies, 0.50),
+            'handler_p95': percentile(handler_latencies, 0.95),
+            'handler_p99': percentile(handler_latencies, 0.99),
+            'completion_p50': percentile(completion_latencies, 0.50),
+            'completion_p99': percentile(completion_latencies, 0.99),
+            'mean_latency': sum(latencies) / count if count else 0.0,
+            'p99_latency': percentile(latencies, 0.99),
+            'max_latency': latencies[-1] if count else 0.0,
+            'disqualified': sum(user.disqualified for user in self.users.values()),
+            'back_presses': sum(user.back_presses for user in self.users.values()),
+            'api_calls': self.bot.api_calls,
+            'edits_saved': self.form_bot.edits.saved_calls(),
+            'outbound': outbound
+        }
+
+def run_threaded(users, api_latency, sheets_latency, **options):
+    """Production polling mode: the Dispatcher thread handles updates one by one."""
+    run = LoadRun(users, api_latency, sheets_latency, **options)
+    dp = build_dispatcher(run.bot, run.form_bot, run.on_processed, run.on_started, run.persistence)
+    run.submit = dp.update_queue.put
+    thread = threading.Thread(target=dp.start, daemon=True)
+    thread.start()
+    started = time.perf_counter()
+    for user in run.users.values():
+        run.send(user.first_update())
+    run.finished.wait()
+    elapsed = time.perf_counter() - started
+    dp.stop()
+    return run.report('threaded', elapsed)
+
+def run_async(users, api_latency, sheets_latency, concurrency=64, webhook=False, **options):
+    """BOT_MODE=async (or webhook): updates are served by AsyncUpdatePipeline."""
+    run = LoadRun(users, api_latency, sheets_latency, **options)
+    dp = build_dispatcher(run.bot, run.form_bot, run.on_processed, run.on_started, run.persistence)
+    pipeline = AsyncUpdatePipeline(dp, max_concurrency=concurrency, max_pending=users * 2)
+
+    async def drive():
+        await pipeline.start()
+        loop = asyncio.get_running_loop()
+        done = asyncio.Event()
+        server = None
+        if webhook:
+            server = WebhookServer(pipeline, run.bot, port=0)
+            await server.start()
+            client = WebhookClient(server.port, server.path, workers=min(users, 32))
+            run.submit = client.post
+        else:
+            run.submit = lambda update: loop.call_soon_threadsafe(pipeline.submit_nowait, update)
+        run.finished = _ThreadsafeEvent(loop, done)
+        started = time.perf_counter()
+        for user in run.users.values():
+            run.send(user.first_update())
+        await done.wait()
+        elapsed = time.perf_counter() - started
+        if server is not None:
+            client.close()
+            await server.stop()
+        await pipeline.stop()
+        return elapsed
+
+    elapsed = asyncio.run(drive())
+    return run.report('webhook' if webhook else 'async', elapsed)
+
+class WebhookClient:
+    """Posts update JSON to the local webhook listener from a pool of keep-alive connections."""
+
+    def __init__(self, port, path, workers=32):
+        self.port = port
+        self.path = path
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='webhook-client')
+        self.local = threading.local()
+
+    def _post(self, body):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = http.client.HTTPConnection('127.0.0.1', self.port)
+        connection.request('POST', self.path, body=body, headers={'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        response.read()
+        if response.status != 200:
+            logger.warning(f"Webhook answered {response.status}")
+
+    def post(self, update):
+        self.pool.submit(self._post, json.dumps(update.to_dict()))
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+
+class _ThreadsafeEvent:
+    """threading.Event-like wrapper that sets an asyncio.Event from any thread."""
+
+    def __init__(self, loop, event):
+        self.loop = loop
+        self.event = event
+
+    def set(self):
+        self.loop.call_soon_threadsafe(self.event.set)
+
+def deep_sizeof(obj, seen=None):
+    """Approximate the memory held by an object graph (dicts, sequences, __dict__ and __slots__)."""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(key, seen) + deep_sizeof(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif not isinstance(obj, (str, bytes, int, float, bool, type(None))):
+        if hasattr(obj, '__dict__'):
+            size += deep_sizeof(vars(obj), seen)
+        for cls in type(obj).__mro__:
+            for slot in cls.__dict__.get('__slots__', ()):
+                if slot != '__dict__' and hasattr(obj, slot):
+                    size += deep_sizeof(getattr(obj, slot), seen)
+    return size
+
+def measure_session_memory(sessions=200, steps=12, seed=1):
+    """Walk users part way through the quiz and measure the per-user data they leave behind.
+
+    Updates are processed synchronously without simulated latency; only the
+    session state kept by the Dispatcher is measured.
+    """
+    bot = StubBot()
+    form_bot = main.FormBot(sheets_helper=StubSheetsHelper(), data_dir=tempfile.mkdtemp(prefix='quizbot-bench-'))
+    dp = build_dispatcher(bot, form_bot, lambda update: None)
+    rng = random.Random(seed)
+    schema = form_bot.schemas.current
+    for user_id in range(1000, 1000 + sessions):
+        user = SimulatedUser(user_id, bot, rng, schema, back_rate=0.0, disqualify_rate=0.0)
+        update = user.first_update()
+        for _ in range(steps):
+            dp.process_update(update)
+            update = user.next_update()
+            if update is None:
+                break
+    form_bot.shutdown()
+    # Each session points at the schema it is on; the schema itself is not per-session memory
+    sizes = [deep_sizeof(dp.user_data[user_id], {id(schema)}) for user_id in range(1000, 1000 + sessions)]
+    # Objects shared between sessions (or owned by the schema) counted once
+    seen = set()
+    deep_sizeof(schema, seen)
+    shared = sum(deep_sizeof(dp.user_data[user_id], seen) for user_id in range(1000, 1000 + sessions))
+    return {
+        'mode': 'memory',
+        'sessions': sessions,
+        'bytes_per_session': sum(sizes) / len(sizes) if sizes else 0.0,
+        'unshared_bytes_per_session': shared / sessions if sessions else 0.0,
+        'max_session_bytes': max(sizes, default=0)
+    }
+
+def measure_keyboard_rendering(renders=5000):
+    """Compare building each question's keyboard per render with the precompiled cache.
+
+    Bytes per render is the tracemalloc peak above the starting point while
+    rendering and discarding one keyboard at a time.
+    """
+    schema = QuizSchema.from_file(QUESTIONS_PATH)
+    regions = [None] + sorted({r for q in schema for r in q.region_states})
+    cases = [(q.index, region) for q in schema for region in regions]
+
+    def measure(render):
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        for i in range(renders):
+            index, region = cases[i % len(cases)]
+            render(index, region)
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return elapsed / renders * 1e6, peak - baseline
+
+    def rebuild(index, region):
+        question = schema[index]
+        return build_keyboard(question, question.options_for_region(region), index == 0)
+
+    rebuilt_us, rebuilt_bytes = measure(rebuild)
+    cached_us, cached_bytes = measure(schema.keyboards.get)
+    return {
+        'mode': 'keyboards',
+        'renders': renders,
+        'rebuilt_us_per_render': rebuilt_us,
+        'cached_us_per_render': cached_us,
+        'rebuilt_bytes_per_render': rebuilt_bytes,
+        'cached_bytes_per_render': cached_bytes
+    }
+
+def measure_startup(runs=3):
+    """Time importing main and building a ready FormBot and Updater, each in a fresh interpreter.
+
+    Reports the median of ``runs``; process_seconds adds interpreter start-up
+    and shutdown to the cold start.
+    """
+    root = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, SESSION_STORE='memory')
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, '-c', STARTUP_SCRIPT], cwd=root, env=env, capture_output=True, text=True, check=True
+        ).stdout
+        sample = json.loads([line for line in output.splitlines() if line.startswith('{')][-1])
+        sample['process_seconds'] = time.perf_counter() - started
+        samples.append(sample)
+    return {
+        'mode': 'startup',
+        'runs': runs,
+        **{key: statistics.median(sample[key] for sample in samples) for key in samples[0]}
+    }
+
+def print_report(result):
+    if result['mode'] == 'startup':
+        print(
+            f"{result['mode']:>9}: import main {result['import_seconds'] * 1000:.0f} ms | cold start "
+            f"{result['cold_start_seconds'] * 1000:.0f} ms | whole process {result['process_seconds'] * 1000:.0f} ms "
+            f"(median of {result['runs']})"
+        )
+        return
+    if result['mode'] == 'keyboards':
+        print(
+            f"{result['mode']:>9}: rebuilt {result['rebuilt_us_per_render']:.1f} us, "
+            f"{result['rebuilt_bytes_per_render']} bytes per render | cached "
+            f"{result['cached_us_per_render']:.2f} us, {result['cached_bytes_per_render']} bytes per render"
+        )
+        return
+    if result['mode'] == 'memory':
+        print(
+            f"{result['mode']:>9}: {result['sessions']} in-progress sessions | "
+            f"{result['bytes_per_session']:.0f} bytes/session "
+            f"({result['unshared_bytes_per_session']:.0f} not shared) | max {result['max_session_bytes']} bytes"
+        )
+        return
+    print(
+        f"{result['mode']:>9}: {result['users']} users, {result['updates']} updates in "
+        f"{result['elapsed']:.2f}s | {result['updates_per_sec']:.1f} updates/s | "
+        f"{result['completions_per_sec']:.2f} completions/s | handler p50/p95/p99 "
+        f"{result['handler_p50'] * 1000:.1f}/{result['handler_p95'] * 1000:.1f}/"
+        f"{result['handler_p99'] * 1000:.1f} ms | finishing update p50/p99 "
+        f"{result['completion_p50'] * 1000:.1f}/{result['completion_p99'] * 1000:.1f} ms | end-to-end mean {result['mean_latency'] * 1000:.1f} ms, "
+        f"p99 {result['p99_latency'] * 1000:.1f} ms | {result['disqualified']} disqualified, "
+        f"{result['back_presses']} back presses | {result['api_calls']} API calls, "
+        f"{result['edits_saved']} edits saved"
+    )
+    outbound = result['outbound']
+    if outbound:
+        print(
+            f"{'':>9}  outbound queue wait mean/max (ms): "
+            + ', '.join(
+                f"{name} {outbound[f'wait_mean_{name}'] * 1000:.1f}/{outbound[f'wait_max_{name}'] * 1000:.1f}"
+                for name in PRIORITY_NAMES
+            )
+            + f" | {outbound['throttled']} throttled"
+        )
+
+def compare_results(baseline, current, tolerance=0.15):
+    """Compare two runs mode by mode.
+
+    Returns:
+        List of (mode, metric, old, new, change, regressed) tuples, where change
+        is the relative difference and regressed is True when the metric got
+        worse by more than ``tolerance``.
+    """
+    previous = {result['mode']: result for result in baseline}
+    rows = []
+    for result in current:
+        old_result = previous.get(result['mode'])
+        if old_result is None:
+            continue
+        for metric in COMPARED_METRICS:
+            if metric not in result or metric not in old_result:
+                continue
+            old, new = old_result[metric], result[metric]
+            change = (new - old) / old if old else 0.0
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            rows.append((result['mode'], metric, old, new, change, worse > tolerance))
+    return rows
+
+def print_comparison(rows):
+    for mode, metric, old, new, change, regressed in rows:
+        flag = '  REGRESSION' if regressed else ''
+        print(f"{mode:>9} {metric:<20} {old:>12.4f} -> {new:>12.4f} ({change:+.1%}){flag}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=['threaded', 'async', 'webhook', 'both', 'all'], default='both',
+                        help="'both' runs threaded and async, 'all' adds webhook")
+    parser.add_argument('--users', type=int, default=20, help='number of simulated users')
+    parser.add_argument('--api-latency', type=float, default=0.02, help='seconds per Telegram API call')
+    parser.add_argument('--sheets-latency', type=float, default=0.2, help='seconds per Sheets append call')
+    parser.add_argument('--concurrency', type=int, default=64, help='async mode concurrency')
+    parser.add_argument('--back-rate', type=float, default=0.05,
+                        help='chance of pressing Back on arriving at a question')
+    parser.add_argument('--disqualify-rate', type=float, default=0.05,
+                        help='share of users who give a disqualifying answer')
+    parser.add_argument('--rate-limit', action='store_true',
+                        help="pace the stub bot's calls with the outbound scheduler's default limits")
+    parser.add_argument('--session-store', choices=['sqlite', 'memory'], default='sqlite',
+                        help="persist sessions after every update as SESSION_STORE=sqlite does, or not at all")
+    parser.add_argument('--seed', type=int, default=1, help='random seed for the simulated answers')
+    parser.add_argument('--memory-sessions', type=int, default=200,
+                        help='in-progress sessions to measure memory with (0 to skip)')
+    parser.add_argument('--keyboard-renders', type=int, default=5000,
+                        help='keyboard renders to time with and without the cache (0 to skip)')
+    parser.add_argument('--startup-runs', type=int, default=3,
+                        help='fresh interpreters to time import and cold start in (0 to skip)')
+    parser.add_argument('--logging', choices=['off', 'sync', 'queued'], default='off',
+                        help="'off' logs warnings only; 'sync' writes every record on the handler thread "
+                             "as before; 'queued' uses the background listener and DEBUG sampling")
+    parser.add_argument('--log-level', default='DEBUG', help='root level for --logging sync/queued')
+    parser.add_argument('--save', metavar='PATH', help='write the results to a JSON file')
+    parser.add_argument('--compare', metavar='PATH', help='compare against results saved with --save')
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help='relative change that counts as a regression when comparing')
+    return parser.parse_args(argv)
+
+def run_benchmark(args):
+    options = {
+        'seed': args.seed,
+        'back_rate': args.back_rate,
+        'disqualify_rate': args.disqualify_rate,
+        'rate_limit': args.rate_limit,
+        'session_store': args.session_store
+    }
+    results = []
+    if args.mode in ('threaded', 'both', 'all'):
+        results.append(run_threaded(args.users, args.api_latency, args.sheets_latency, **options))
+    if args.mode in ('async', 'both', 'all'):
+        results.append(run_async(args.users, args.api_latency, args.sheets_latency, args.concurrency, **options))
+    if args.mode in ('webhook', 'all'):
+        results.append(run_async(
+            args.users, args.api_latency, args.sheets_latency, args.concurrency, webhook=True, **options
+        ))
+    if args.memory_sessions:
+        results.append(measure_session_memory(args.memory_sessions, seed=args.seed))
+    if args.keyboard_renders:
+        results.append(measure_keyboard_rendering(args.keyboard_renders))
+    if args.startup_runs:
+        results.append(measure_startup(args.startup_runs))
+    return results
+
+def configure_benchmark_logging(mode, level):
+    """Route the bot's logs for a run; sync and queued write a real file and format every console line."""
+    if mode == 'off':
+        # Keep handler logging from dominating the measurement
+        configure_logging(level=logging.WARNING, log_file='', console_stream=sys.stderr)
+        return
+    log_dir = tempfile.mkdtemp(prefix='quizbot-bench-logs-')
+    configure_logging(
+        level=level,
+        log_file=os.path.join(log_dir, 'bot.log'),
+        console_stream=open(os.devnull, 'w'),
+        queued=(mode == 'queued'),
+        debug_sample=10 if mode == 'queued' else 1
+    )
+
+def main_cli(argv=None):
+    args = parse_args(argv)
+    configure_benchmark_logging(args.logging, args.log_level)
+    results = run_benchmark(args)
+    for result in results:
+        result['logging'] = args.logging
+    for result in results:
+        print_report(result)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2)
+        print(f"Saved results to {args.save}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        rows = compare_results(baseline, results, args.tolerance)
+        print(f"\nCompared with {args.compare}:")
+        print_comparison(rows)
+        if any(row[-1] for row in rows):
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main_cli())
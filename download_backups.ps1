@@ -2,7 +2,8 @@
 param(
     [switch]$Latest,
     [switch]$All,
-    [string]$Date
+    [string]$Date,
+    [switch]$Rebuild
 )
 
 $dropletHost = "64.23.176.81"
@@ -25,10 +26,20 @@ function Download-File {
 }
 
 if ($Latest) {
-    # Download only the latest_responses.csv
-    $localPath = Join-Path $localBackupDir "latest_responses.csv"
-    Download-File "$backupPath/latest_responses.csv" $localPath
-    Write-Host "Latest responses downloaded to: $localPath"
+    # Download only the latest_responses_<tag>.csv files, one per header the questions have had
+    $tempFile = New-TemporaryFile
+    $listCommand = "ssh ${dropletUser}@${dropletHost} `"ls -1 $backupPath | grep -E '^latest_responses(_[0-9a-f]{8})?\.csv$'`""
+    Invoke-Expression $listCommand | Out-File $tempFile
+    
+    Get-Content $tempFile | ForEach-Object {
+        $fileName = $_.Trim()
+        if ($fileName) {
+            $localPath = Join-Path $localBackupDir $fileName
+            Download-File "$backupPath/$fileName" $localPath
+        }
+    }
+    Remove-Item $tempFile
+    Write-Host "Latest responses downloaded to: $localBackupDir"
 }
 elseif ($All) {
     # Download all backup files
@@ -70,14 +81,52 @@ elseif ($Date) {
         Write-Host "Backups for $Date downloaded to: $localBackupDir"
     }
 }
+elseif ($Rebuild) {
+    # Download the daily delta files (responses_YYYYMMDD_<tag>.csv) and merge them
+    # into full-history CSVs, keeping the header row only once. Files with
+    # different tags have different headers, so each tag gets its own
+    # full_history_<tag>.csv (untagged files from older versions: full_history.csv)
+    $tempFile = New-TemporaryFile
+    $listCommand = "ssh ${dropletUser}@${dropletHost} `"ls -1 $backupPath | grep -E '^responses_[0-9]{8}(_[0-9a-f]{8})?\.csv$'`""
+    Invoke-Expression $listCommand | Out-File $tempFile
+    
+    $dailyFiles = Get-Content $tempFile | ForEach-Object { $_.Trim() } | Where-Object { $_ } | Sort-Object
+    Remove-Item $tempFile
+    
+    $groups = $dailyFiles | Group-Object { if ($_ -match '^responses_[0-9]{8}_([0-9a-f]{8})\.csv$') { $Matches[1] } else { '' } }
+    foreach ($group in $groups) {
+        $historyName = if ($group.Name) { "full_history_$($group.Name).csv" } else { "full_history.csv" }
+        $historyPath = Join-Path $localBackupDir $historyName
+        $first = $true
+        foreach ($fileName in ($group.Group | Sort-Object)) {
+            $localPath = Join-Path $localBackupDir $fileName
+            Download-File "$backupPath/$fileName" $localPath
+            $lines = Get-Content $localPath -Encoding UTF8
+            if ($first) {
+                $lines | Set-Content $historyPath -Encoding UTF8
+                $first = $false
+            }
+            else {
+                $lines | Select-Object -Skip 1 | Add-Content $historyPath -Encoding UTF8
+            }
+        }
+        Write-Host "Full history rebuilt from $($group.Count) daily file(s): $historyPath"
+    }
+    
+    if (-not $dailyFiles) {
+        Write-Host "No daily response files found"
+    }
+}
 else {
     Write-Host "Please specify one of the following options:"
     Write-Host "-Latest : Download only the latest responses"
     Write-Host "-All    : Download all backup files"
     Write-Host "-Date   : Download backups from a specific date (format: YYYYMMDD)"
+    Write-Host "-Rebuild: Download all daily files and merge them into full_history_<tag>.csv"
     Write-Host ""
     Write-Host "Examples:"
     Write-Host ".\download_backups.ps1 -Latest"
     Write-Host ".\download_backups.ps1 -All"
     Write-Host ".\download_backups.ps1 -Date 20250214"
+    Write-Host ".\download_backups.ps1 -Rebuild"
 }
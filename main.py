@@ -1,180 +1,233 @@
 import os
 import logging
-import json
 import csv
+import signal
+import asyncio
+import threading
 from datetime import datetime
-from telegram import Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup, ParseMode
+from telegram import Bot, Update, ParseMode
+from telegram.utils.request import Request
 from telegram.ext import (
     Updater, 
     CommandHandler, 
     CallbackQueryHandler, 
     MessageHandler,
+    TypeHandler,
     Filters,
     CallbackContext
 )
+from apscheduler.triggers.interval import IntervalTrigger
 from dotenv import load_dotenv
-from sheets_helper import SheetsHelper
+from sheets_helper import SheetsHelper, SheetsWriteQueue
 from utils.backup_manager import BackupManager
-from logging.handlers import RotatingFileHandler
-import sys
-
-# Load environment variables
-load_dotenv()
+from utils.sheets_outbox import SheetsOutbox
+from utils.completion_pipeline import CompletionPipeline
+from utils.quiz_schema import QuizSchemaRegistry, header_tag
+from utils.keyboards import DONE_ACTION, BACK_ACTION, decode_callback
+from utils.quiz_session import QuizSession
+from utils.recommendations import RecommendationIndex
+from utils.topic_directory import TopicDirectory
+from utils.edit_coalescer import EditCoalescer
+from utils.session_expiry import SessionExpiry
+from utils.rate_limiter import RateLimitedBot, RateLimitedMixin, OutboundScheduler, priority, PRIORITY_LOW
+from utils.session_store import SqliteSessionPersistence
+from utils.async_pipeline import AsyncUpdatePipeline
+from utils.webhook_server import WebhookServer
+from utils.sharding import ShardRouter
+from utils.logging_setup import configure_logging
+from utils.metrics import REGISTRY, HANDLER_SECONDS, COMPLETIONS, MetricsServer
+from utils.tracing import TRACER
 
 # Use token from config.py
 from config import BOT_TOKEN
 
-# Configure logging with rotation and enhanced formatting
-log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s')
-
-# File handler with rotation (10MB per file, keep 5 backup files)
-file_handler = RotatingFileHandler('logs/bot.log', maxBytes=10*1024*1024, backupCount=5)
-file_handler.setFormatter(log_formatter)
-file_handler.setLevel(logging.INFO)
-
-# Console handler
-console_handler = logging.StreamHandler(sys.stdout)
-console_handler.setFormatter(log_formatter)
-console_handler.setLevel(logging.DEBUG)  # Changed from INFO to DEBUG
-
-# Configure root logger
-logging.root.setLevel(logging.DEBUG)  # Changed from INFO to DEBUG
-logging.root.addHandler(file_handler)
-logging.root.addHandler(console_handler)
-
-# Set Telegram API logger to WARNING to avoid exposing token
-logging.getLogger('telegram').setLevel(logging.WARNING)
-logging.getLogger('telegram.bot').setLevel(logging.WARNING)
-logging.getLogger('telegram.ext.updater').setLevel(logging.WARNING)
-
+# Importing this module has no side effects: the environment, logging and
+# backups are set up by create_app() and the shard worker entry point
 logger = logging.getLogger(__name__)
 
-# Initialize backup manager
-backup_manager = BackupManager()
-
 class FormBot:
-    def __init__(self):
-        self.questions = self.load_questions()
-        self.state_links = self.load_state_links()
-        self.leadership_links = {
-            'general': 'https://t.me/c/2399831251/13132',
-            'veterans_educators_nurses': 'https://t.me/c/2399831251/289114',
-            'marginalized_underrepresented': 'https://t.me/c/2399831251/231957'
+    def __init__(self, sheets_helper=None, data_dir=None, response_sink=None, backups=None):
+        """Initialize the bot.
+        
+        Args:
+            sheets_helper: Sheets client to write responses with. Defaults to SheetsHelper().
+            data_dir: Directory for local backups and response logs. Defaults to this file's directory.
+            response_sink: Callable taking (row_data, headers) for completed responses.
+                Defaults to save_response, which writes to Sheets, CSV and the text log.
+                Shard workers pass a sink that forwards rows to the front process.
+            backups: BackupManager that keeps a copy of questions.json each time it
+                is loaded. None (the default) makes no copies.
+        """
+        self.data_dir = data_dir or os.path.dirname(os.path.abspath(__file__))
+        self.backups = backups
+        self.schemas = self.load_questions()
+        self.admin_ids = {
+            int(user_id) for user_id in os.getenv('ADMIN_USER_IDS', '').split(',') if user_id.strip()
         }
-        self.social_media_links = {
-            "BlueSky": "https://bsky.app/profile/voicesignited.bsky.social",
-            "TikTok": "https://www.tiktok.com/@voices_united",
-            "Substack": "https://voicesignited.substack.com/",
-            "YouTube": "https://www.youtube.com/@VoicesIgnited",
-            "Instagram": "https://www.instagram.com/voicesignited",
-            "Linktree": "https://linktr.ee/voices_ignited",
-            "Keybase": "keybase://team-page/quiz_team"
+        # Forum topics (state groups and channels), indexed by ID and title
+        self.topics = TopicDirectory(
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), 'forum_topics_with_links.csv')
+        )
+        # Completion message links, compiled from the rule table in utils/recommendations.py
+        self.recommendations = RecommendationIndex(topics=self.topics)
+        for question_id, option in self.recommendations.unmatched_rules(self.schemas.current):
+            logger.warning(f"Recommendation rule for {question_id}={option!r} matches no question option")
+        # Rapid multi-select toggles are collapsed into one edit per quiet window
+        self.edits = EditCoalescer(delay=float(os.getenv('EDIT_COALESCE_DELAY', '0.3')))
+        self.edits.start()
+        # Abandoned quizzes are dropped after a day idle, and the least recently active beyond the cap
+        self.sessions = SessionExpiry(
+            ttl=float(os.getenv('SESSION_TTL', '86400')),
+            max_sessions=int(os.getenv('SESSION_MAX', '10000'))
+        )
+        # The slowest traced updates are kept for /traces
+        TRACER.configure(
+            sample_rate=float(os.getenv('TRACE_SAMPLE_RATE', '1.0')),
+            keep=int(os.getenv('TRACE_KEEP', '20'))
+        )
+        self.sheets_queue = None
+        if response_sink is None:
+            self.start_sinks(sheets_helper)
+            response_sink = self.save_response
+        self.response_sink = response_sink
+        
+    def start_sinks(self, sheets_helper=None):
+        """Set up the Sheets write queue and the completion pipeline used by save_response."""
+        self.sheets_helper = sheets_helper or SheetsHelper()
+        # Completed rows are journaled to a durable outbox, then written behind
+        # the dispatcher by a background flusher that replays failed batches
+        self.sheets_outbox = SheetsOutbox(os.path.join(self.data_dir, 'local_backups', 'sheets_outbox.db'))
+        self.sheets_queue = SheetsWriteQueue(
+            self.sheets_helper,
+            max_batch_size=int(os.getenv('SHEETS_BATCH_SIZE', '50')),
+            flush_interval=float(os.getenv('SHEETS_FLUSH_INTERVAL', '2.0')),
+            outbox=self.sheets_outbox,
+            replay_interval=float(os.getenv('SHEETS_REPLAY_INTERVAL', '30.0'))
+        )
+        self.sheets_queue.start()
+        # Completed responses fan out to every sink in parallel, after the user is answered
+        sink_options = {
+            'timeout': float(os.getenv('SINK_TIMEOUT', '10')),
+            'retries': int(os.getenv('SINK_RETRIES', '2'))
         }
-        self.sheets_helper = SheetsHelper()
+        self.completion = CompletionPipeline()
+        self.completion.add_sink('sheets', lambda row_data, headers: self.sheets_queue.enqueue(row_data), **sink_options)
+        self.completion.add_sink('csv', self.save_to_local_csv, **sink_options)
+        self.completion.add_sink('text_log', self.save_to_text_log, **sink_options)
+        
+    def shutdown(self):
+        """Flush pending work before the process exits."""
+        self.edits.stop()
+        updater = getattr(self, 'updater', None)
+        if updater is not None and isinstance(updater.bot, RateLimitedBot):
+            updater.bot.scheduler.stop()
+        if self.sheets_queue is not None:
+            # Rows still in the pipeline reach the Sheets queue before it drains
+            self.completion.stop()
+            self.sheets_queue.stop()
+            self.sheets_outbox.close()
+            if isinstance(self.sheets_helper, SheetsHelper):
+                logger.info(f"Sheets transport stopped: {self.sheets_helper.get_transport_stats()}")
+                self.sheets_helper.close()
+        # Final counters, after the queues have drained
+        dump_metrics()
         
     def load_questions(self):
-        """Load and validate questions from JSON file."""
+        """Load, validate and compile questions from the JSON file.
+        
+        Returns:
+            A QuizSchemaRegistry holding the compiled schema.
+        """
         try:
             questions_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'questions.json')
             
             # Create backup before loading
-            backup_manager.backup_file(questions_path)
+            if self.backups is not None:
+                self.backups.backup_file(questions_path)
             
-            with open(questions_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                # Validate question format
-                if not isinstance(data, dict) or 'quiz' not in data or not isinstance(data['quiz'], list):
-                    logger.error("Invalid questions.json format: must have a 'quiz' list")
-                    raise ValueError("Invalid questions.json format")
-                
-                for q in data['quiz']:
-                    if not isinstance(q, dict):
-                        logger.error(f"Invalid question format - not a dict: {q}")
-                        raise ValueError("Invalid question format")
-                    
-                    required_fields = ['id', 'question', 'type']
-                    for field in required_fields:
-                        if field not in q:
-                            logger.error(f"Question missing required field '{field}': {q}")
-                            raise ValueError(f"Question missing required field '{field}'")
-                    
-                    if q['type'] in ['multiple_choice', 'multiple_select'] and ('options' not in q or not q['options']):
-                        logger.error(f"Multiple choice/select question missing options: {q}")
-                        raise ValueError("Multiple choice/select question missing options")
-                
-                logger.info(f"Successfully loaded {len(data['quiz'])} questions")
-                return data['quiz']
+            schemas = QuizSchemaRegistry(questions_path)
+            logger.info(f"Successfully loaded {len(schemas.current)} questions")
+            return schemas
         except Exception as e:
             logger.error(f"Error loading questions: {str(e)}", exc_info=True)
             raise  # Re-raise the error to stop bot initialization
             
-    def load_state_links(self):
-        """Load state links from CSV file."""
-        state_links = {}
-        try:
-            csv_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'forum_topics_with_links.csv')
-            with open(csv_path, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    # Convert state name to match the format in questions.json
-                    state_name = row['title'].strip().title()
-                    if state_name in [
-                        "Alabama", "Alaska", "Arizona", "Arkansas", "California",
-                        "Colorado", "Connecticut", "Delaware", "Florida", "Georgia",
-                        "Hawaii", "Idaho", "Illinois", "Indiana", "Iowa",
-                        "Kansas", "Kentucky", "Louisiana", "Maine", "Maryland",
-                        "Massachusetts", "Michigan", "Minnesota", "Mississippi", "Missouri",
-                        "Montana", "Nebraska", "Nevada", "New Hampshire", "New Jersey",
-                        "New Mexico", "New York", "North Carolina", "North Dakota", "Ohio",
-                        "Oklahoma", "Oregon", "Pennsylvania", "Rhode Island", "South Carolina",
-                        "South Dakota", "Tennessee", "Texas", "Utah", "Vermont",
-                        "Virginia", "Washington", "West Virginia", "Wisconsin", "Wyoming"
-                    ]:
-                        state_links[state_name] = row['link']
-        except Exception as e:
-            logger.error(f"Error loading state links: {str(e)}")
-        return state_links
+    def check_questions_reload(self, context: CallbackContext):
+        """Job callback: reload questions.json if it changed on disk."""
+        if self.schemas.check_for_changes() and self.backups is not None:
+            self.backups.backup_file(self.schemas.path)
+            
+    def reload_questions(self, update: Update, context: CallbackContext):
+        """Handle /reload: re-read questions.json on demand (admins only)."""
+        if update.effective_user.id not in self.admin_ids:
+            logger.warning(f"Unauthorized /reload attempt by user {update.effective_user.id}")
+            update.message.reply_text("Sorry, this command is only available to administrators.")
+            return
+            
+        schema = self.schemas.reload()
+        if schema:
+            if self.backups is not None:
+                self.backups.backup_file(self.schemas.path)
+            update.message.reply_text(f"Reloaded {len(schema)} questions (version {schema.version}).")
+        else:
+            update.message.reply_text(
+                f"questions.json is invalid, still using version {self.schemas.current.version}. Check the logs."
+            )
+            
+    def show_traces(self, update: Update, context: CallbackContext):
+        """Handle /traces: list the slowest traced updates and write them to TRACE_FILE (admins only)."""
+        if update.effective_user.id not in self.admin_ids:
+            logger.warning(f"Unauthorized /traces attempt by user {update.effective_user.id}")
+            update.message.reply_text("Sorry, this command is only available to administrators.")
+            return
+            
+        traces = TRACER.slowest()
+        if not traces:
+            update.message.reply_text("No traces recorded yet.")
+            return
+        path = os.getenv('TRACE_FILE', os.path.join('logs', 'slow_traces.json'))
+        TRACER.dump(path)
+        lines = [f"{len(traces)} slowest update(s), times in ms, full spans in {path}:"]
+        lines += [trace.summary() for trace in traces[:10]]
+        update.message.reply_text('\n'.join(lines)[:4000])
+        
+    def get_schema(self, session):
+        """Return the schema a session started on."""
+        return session.schema
+
+    def check_topics_reload(self, context: CallbackContext):
+        """Job callback: reload forum_topics_with_links.csv if it changed and recompile recommendations."""
+        if self.topics.check_for_changes():
+            self.recommendations = RecommendationIndex(topics=self.topics)
 
     def get_user_data(self, context: CallbackContext):
-        """Initialize or get user data with proper structure."""
+        """Initialize or get the user's QuizSession."""
         try:
-            if 'form_data' not in context.user_data:
-                context.user_data['form_data'] = {
-                    'current_question': 0,
-                    'answers': {},
-                    'start_time': datetime.now().isoformat()
-                }
-            return context.user_data['form_data']
+            session = context.user_data.get('form_data')
+            if session is None:
+                session = context.user_data['form_data'] = QuizSession(self.schemas.current)
+            elif isinstance(session, dict):
+                # Restored from the session store, or saved before sessions were slotted.
+                # A fingerprint no longer loaded means other questions: from_dict remaps the answers by ID
+                schema = self.schemas.get(session.get('schema_fingerprint')) or self.schemas.current
+                session = context.user_data['form_data'] = QuizSession.from_dict(session, schema)
+            return session
         except Exception as e:
             logger.error(f"Error in get_user_data: {str(e)}", exc_info=True)
             raise
 
+    @HANDLER_SECONDS.time('start')
+    @TRACER.traced('start')
     def start(self, update: Update, context: CallbackContext):
         """Start the conversation and send first question."""
         try:
-            if not self.questions:
+            if not self.schemas.current.questions:
                 logger.error("No questions loaded")
                 update.message.reply_text("Sorry, there was an error loading the questions. Please try again later.")
                 return
 
-            # Get user info
-            user = update.effective_user
-            username = user.username or "Unknown"
-            first_name = user.first_name or "Unknown"
-            last_name = user.last_name or "Unknown"
-            user_id = str(user.id)
-
-            # Reset user data
-            context.user_data['form_data'] = {
-                'current_question': 0,
-                'answers': {
-                    'username': username,
-                    'first_name': first_name,
-                    'last_name': last_name,
-                    'user_id': user_id
-                },
-                'start_time': datetime.now().isoformat()
-            }
+            # Reset user data, pinned to the current schema so a reload never changes it mid-quiz
+            context.user_data['form_data'] = QuizSession(self.schemas.current)
 
             # Send welcome message and first question
             welcome_text = (
@@ -190,97 +243,48 @@ class FormBot:
             logger.error(f"Error in start: {str(e)}", exc_info=True)
             update.message.reply_text("Sorry, something went wrong. Please try again later.")
 
+    @HANDLER_SECONDS.time('send_question')
+    @TRACER.traced('send_question')
     def send_question(self, update: Update, context: CallbackContext):
         """Send the current question to the user."""
         try:
-            user_data = self.get_user_data(context)
-            current_idx = user_data['current_question']
+            session = self.get_user_data(context)
+            current_idx = session.current_question
+            schema = self.get_schema(session)
             
             # Check if we've reached the end of questions
-            if current_idx >= len(self.questions):
+            if current_idx >= len(schema):
                 # Finish the form
                 self.finish_form(update, context)
                 return
 
-            question = self.questions[current_idx]
-            question_text = f"{current_idx + 1}. {question['question']}"
+            question = schema[current_idx]
+            question_text = f"{current_idx + 1}. {question.text}"
             
             # Add description if present
-            if 'description' in question:
-                question_text += f"\n\n{question['description']}"
+            if question.description:
+                question_text += f"\n\n{question.description}"
 
-            if question.get('type') in ['multiple_choice', 'multiple_select']:
-                # Get the current options
-                options = question.get('options', [])
-                
-                # For state question, check if we need to use region-specific options
-                if question['id'] == 'state' and question.get('dynamic'):
-                    selected_region = user_data['answers'].get('region')
-                    if selected_region and 'region_states' in question:
-                        options = question['region_states'].get(selected_region, ["Other State"])
-                        logger.info(f"Using region-specific states for {selected_region}: {options}")
-                
-                # Create keyboard with available options
-                keyboard = []
-                for option in options:
-                    keyboard.append([InlineKeyboardButton(option, callback_data=option)])
-                    
-                # For multiple select, add a "Done" button
-                if question.get('type') == 'multiple_select':
-                    # Initialize selected options in user data if not present
-                    if 'selected_options' not in user_data:
-                        user_data['selected_options'] = []
-                    keyboard.append([InlineKeyboardButton("✅ Done", callback_data="DONE_SELECTING")])
-                    # Add note about multiple selection
-                    question_text += "\n\n(You can select multiple options. Click '✅ Done' when finished.)"
-                
-                # Add back button if not on the first question
-                bottom_row = []
-                if current_idx > 0:
-                    bottom_row.append(InlineKeyboardButton("⬅️ Back", callback_data="GO_BACK"))
-                
-                # Add the bottom row if it has any buttons
-                if bottom_row:
-                    keyboard.append(bottom_row)
-                    
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                if update.callback_query:
-                    update.callback_query.message.edit_text(
-                        text=question_text,
-                        reply_markup=reply_markup
-                    )
-                elif update.message:
-                    update.message.reply_text(
-                        text=question_text,
-                        reply_markup=reply_markup
-                    )
-                else:
-                    logger.error("No valid message object found in update")
-                    raise ValueError("No valid message object found in update")
+            if question.is_multi_select:
+                # Add note about multiple selection
+                question_text += "\n\n(You can select multiple options. Click '✅ Done' when finished.)"
+
+            # Precompiled keyboard: options (region-specific for the state question), Done and Back rows
+            reply_markup = schema.keyboards.get(current_idx, session.get(schema, 'region'))
+
+            if update.callback_query:
+                update.callback_query.message.edit_text(
+                    text=question_text,
+                    reply_markup=reply_markup
+                )
+            elif update.message:
+                update.message.reply_text(
+                    text=question_text,
+                    reply_markup=reply_markup
+                )
             else:
-                # For text input questions
-                # Create keyboard with just the back button if not on first question
-                keyboard = []
-                if current_idx > 0:
-                    keyboard.append([InlineKeyboardButton("⬅️ Back", callback_data="GO_BACK")])
-                
-                # Only create reply markup if we have buttons
-                reply_markup = InlineKeyboardMarkup(keyboard) if keyboard else None
-                
-                if update.callback_query:
-                    update.callback_query.message.edit_text(
-                        text=question_text,
-                        reply_markup=reply_markup
-                    )
-                elif update.message:
-                    update.message.reply_text(
-                        text=question_text,
-                        reply_markup=reply_markup
-                    )
-                else:
-                    logger.error("No valid message object found in update")
-                    raise ValueError("No valid message object found in update")
+                logger.error("No valid message object found in update")
+                raise ValueError("No valid message object found in update")
                     
         except Exception as e:
             logger.error(f"Error in send_question: {str(e)}", exc_info=True)
@@ -292,21 +296,24 @@ class FormBot:
             except Exception as nested_e:
                 logger.error(f"Error in error handler: {str(nested_e)}")
 
+    @HANDLER_SECONDS.time('handle_response')
+    @TRACER.traced('handle_response')
     def handle_response(self, update: Update, context: CallbackContext):
         """Handle text responses."""
-        user_data = self.get_user_data(context)
-        current_idx = user_data['current_question']
-        current_question = self.questions[current_idx]
-        
-        if current_idx >= len(self.questions):
+        session = self.get_user_data(context)
+        current_idx = session.current_question
+        schema = self.get_schema(session)
+        logger.debug("Text answer to question %d from user %s", current_idx, update.effective_user.id)
+        if current_idx >= len(schema):
             update.message.reply_text("You've already completed the form!")
             return
+        current_question = schema[current_idx]
 
         # Handle number type questions
-        if current_question['type'] == 'number':
+        if current_question.type == 'number':
             try:
                 number = int(update.message.text)
-                if current_question['id'] == 'age':
+                if current_question.id == 'age':
                     if number < 13 or number > 120:
                         update.message.reply_text("Please enter a valid age between 13 and 120.")
                         return
@@ -321,58 +328,76 @@ class FormBot:
                 return
 
         # Save the answer and move to next question
-        user_data['answers'][current_question['id']] = update.message.text
-        user_data['current_question'] += 1
+        session.set_answer(current_idx, update.message.text)
+        session.current_question += 1
         self.send_question(update, context)
 
+    @HANDLER_SECONDS.time('handle_callback')
+    @TRACER.traced('handle_callback')
     def handle_callback(self, update: Update, context: CallbackContext):
         """Handle button callbacks."""
         try:
             query = update.callback_query
-            user_data = self.get_user_data(context)
-            current_idx = user_data['current_question']
-            current_question = self.questions[current_idx]
+            session = self.get_user_data(context)
+            current_idx = session.current_question
+            schema = self.get_schema(session)
+            current_question = schema[current_idx]
             
             # Always acknowledge the callback query first
             query.answer()
-            
+            # Lazy %-style arguments: nothing is formatted unless DEBUG is on (and sampled in)
+            logger.debug("Callback %r on question %d from user %s", query.data, current_idx, update.effective_user.id)
+
+            choice = schema.keyboards.resolve(query.data, current_idx, session.get(schema, 'region'))
+            if choice is None:
+                # Button from an earlier question or another schema; the current question is unaffected
+                logger.info("Ignoring stale callback %r from user %s", query.data, update.effective_user.id)
+                decoded = decode_callback(query.data)
+                if decoded is not None and decoded[0] != schema.fingerprint:
+                    # Keyboard sent before a restart onto changed questions: show the question the session is on
+                    self.send_question(update, context)
+                return
+            action, option = choice
+
+            if action == BACK_ACTION:
+                # Move back to previous question, dropping any half-made selection
+                self.edits.cancel(query.message)
+                session.selected_mask = 0
+                session.current_question -= 1
+                self.send_question(update, context)
             # Handle multiple select questions
-            if current_question.get('type') == 'multiple_select':
-                if 'selected_options' not in user_data:
-                    user_data['selected_options'] = []
-                    
-                if query.data == "DONE_SELECTING":
-                    if user_data['selected_options']:  # Only proceed if they selected at least one option
-                        # Join the selected options with commas and save
-                        user_data['answers'][current_question['id']] = ", ".join(user_data['selected_options'])
-                        # Clear the selected options
-                        user_data['selected_options'] = []
+            elif current_question.is_multi_select:
+                # Bit i of the mask is set when option i is selected
+                mask = session.selected_mask
+
+                if action == DONE_ACTION:
+                    if mask:  # Only proceed if they selected at least one option
+                        # Save the selected options, in option order, joined with commas
+                        session.set_answer(current_idx, schema.selections.answer(current_idx, mask))
+                        session.selected_mask = 0
+                        # The message is about to show the next question; drop the pending toggle edit
+                        self.edits.cancel(query.message)
                         # Move to next question
-                        user_data['current_question'] += 1
+                        session.current_question += 1
                         self.send_question(update, context)
                     else:
                         # If no options selected, inform the user
                         query.message.reply_text("Please select at least one option before clicking Done.")
                 else:
                     # Toggle the selected option
-                    if query.data in user_data['selected_options']:
-                        user_data['selected_options'].remove(query.data)
-                    else:
-                        user_data['selected_options'].append(query.data)
-                    # Update the message to show what's selected
-                    current_selections = "\n\nSelected: " + ", ".join(user_data['selected_options']) if user_data['selected_options'] else ""
-                    query.message.edit_text(
-                        text=f"{current_idx + 1}. {current_question['question']}\n\n(You can select multiple options. Click '✅ Done' when finished.){current_selections}",
+                    mask ^= 1 << action
+                    session.selected_mask = mask
+                    # Update the message to show what's selected once the user stops tapping
+                    self.edits.schedule(
+                        query.message,
+                        schema.selections.render(current_idx, mask),
                         reply_markup=query.message.reply_markup
                     )
-            elif query.data == "GO_BACK":
-                # Move back to previous question
-                user_data['current_question'] -= 1
-                self.send_question(update, context)
-            else:
+            elif action != DONE_ACTION:
+                self.edits.cancel(query.message)
                 # For multiple choice questions, process immediately
-                user_data['answers'][current_question['id']] = query.data
-                user_data['current_question'] += 1
+                session.set_answer(current_idx, option)
+                session.current_question += 1
                 self.send_question(update, context)
                 
         except Exception as e:
@@ -386,15 +411,16 @@ class FormBot:
     def process_answer(self, update: Update, context: CallbackContext, answer: str):
         """Process the user's answer and move to next question."""
         try:
-            user_data = self.get_user_data(context)
-            current_idx = user_data['current_question']
-            current_question = self.questions[current_idx]
+            session = self.get_user_data(context)
+            current_idx = session.current_question
+            schema = self.get_schema(session)
+            current_question = schema[current_idx]
             
             # Save the answer
-            user_data['answers'][current_question['id']] = answer
+            session.set_answer(current_idx, answer)
             
             # Check for disqualifying answers
-            if current_question['id'] in ['enforcement_affiliation', 'reporting_role'] and answer == "Yes":
+            if current_question.id in ['enforcement_affiliation', 'reporting_role'] and answer == "Yes":
                 # Finish the form
                 self.finish_form(update, context)
                 update.effective_message.reply_text(
@@ -404,7 +430,7 @@ class FormBot:
                 context.user_data.clear()
                 return
                 
-            if current_question['id'] == 'confidentiality' and answer == "No":
+            if current_question.id == 'confidentiality' and answer == "No":
                 # Finish the form
                 self.finish_form(update, context)
                 update.effective_message.reply_text(
@@ -414,7 +440,7 @@ class FormBot:
                 context.user_data.clear()
                 return
 
-            if current_question['id'] == 'mission_alignment' and answer == "Do not agree":
+            if current_question.id == 'mission_alignment' and answer == "Do not agree":
                 # Finish the form
                 self.finish_form(update, context)
                 update.effective_message.reply_text(
@@ -424,24 +450,13 @@ class FormBot:
                 context.user_data.clear()
                 return
             
-            # If this was the region question, update the next question's state options
-            if current_question['id'] == 'region':
-                next_idx = current_idx + 1
-                if next_idx < len(self.questions):
-                    next_question = self.questions[next_idx]
-                    if next_question['id'] == 'state' and next_question.get('dynamic'):
-                        logger.info(f"Updating state options for region: {answer}")
-                        if 'region_states' in next_question:
-                            next_question['options'] = next_question['region_states'].get(answer, ["Other State"])
-                            logger.info(f"New state options: {next_question['options']}")
-                        else:
-                            logger.error("region_states not found in state question")
+            # The state question's options are resolved from the region answer in send_question
             
             # Move to next question
-            user_data['current_question'] += 1
+            session.current_question += 1
             
             # Check if we're done with all questions
-            if user_data['current_question'] >= len(self.questions):
+            if session.current_question >= len(schema):
                 self.finish_form(update, context)
                 return
                 
@@ -455,259 +470,125 @@ class FormBot:
             elif update.message:
                 update.message.reply_text("Sorry, something went wrong. Please try /start again.")
 
-    def save_to_local_csv(self, row_data):
-        """Save response data to local CSV file."""
-        try:
-            # Ensure backup directories exist
-            csv_dir = os.path.join(os.path.dirname(__file__), 'local_backups')
-            if not os.path.exists(csv_dir):
-                os.makedirs(csv_dir)
+    def save_to_local_csv(self, row_data, headers):
+        """Save response data to local CSV files.
+        
+        Each completion is appended to two files, so the cost per response is
+        constant regardless of how many responses already exist:
+        
+        - ``latest_responses_<tag>.csv`` holds the full history.
+        - ``responses_<YYYYMMDD>_<tag>.csv`` holds only that day's responses, so
+          concatenating the daily files reconstructs the history as well.
+        
+        ``<tag>`` is a hash of the header row, so when a questions.json reload
+        changes the columns, rows start a new file under the new header
+        instead of landing under the old one.
+        
+        Runs as a completion pipeline sink, which logs and retries failures.
+        
+        Args:
+            row_data: Response row built by ``schema.build_row``.
+            headers: Header row of the schema the row was built from.
+        """
+        # Ensure backup directories exist
+        csv_dir = os.path.join(self.data_dir, 'local_backups')
+        os.makedirs(csv_dir, exist_ok=True)
 
-            # Current timestamp for filename
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            
-            # Paths for CSV files
-            latest_csv = os.path.join(csv_dir, 'latest_responses.csv')
-            timestamped_csv = os.path.join(csv_dir, f'responses_{timestamp}.csv')
-            
-            # Get headers from questions.json
-            with open('questions.json', 'r', encoding='utf-8') as f:
-                questions = json.load(f)['quiz']
-            headers = ['Username', 'First Name', 'Last Name', 'User ID', 'Timestamp'] + [q['question'] for q in questions]
-            
-            # Create new CSV file if it doesn't exist
-            if not os.path.exists(latest_csv):
-                with open(latest_csv, 'w', newline='', encoding='utf-8') as f:
-                    writer = csv.writer(f)
-                    writer.writerow(headers)
-            
-            # Append to latest responses
-            with open(latest_csv, 'a', newline='', encoding='utf-8') as f:
+        # Paths for CSV files
+        tag = header_tag(headers)
+        latest_csv = os.path.join(csv_dir, f'latest_responses_{tag}.csv')
+        daily_csv = os.path.join(csv_dir, f'responses_{datetime.now().strftime("%Y%m%d")}_{tag}.csv')
+        
+        for csv_path in (latest_csv, daily_csv):
+            # Write the header only when the file is created
+            write_header = not os.path.exists(csv_path)
+            with open(csv_path, 'a', newline='', encoding='utf-8') as f:
                 writer = csv.writer(f)
+                if write_header:
+                    writer.writerow(headers)
                 writer.writerow(row_data)
-            
-            # Also save timestamped copy
-            with open(timestamped_csv, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                writer.writerow(headers)
-                # Read all existing responses and write them
-                with open(latest_csv, 'r', newline='', encoding='utf-8') as latest:
-                    reader = csv.reader(latest)
-                    next(reader)  # Skip header
-                    for row in reader:
-                        writer.writerow(row)
-            
-            logger.info(f"Response saved to local CSV files: {latest_csv} and {timestamped_csv}")
-            
-        except Exception as e:
-            logger.error(f"Error saving to local CSV: {str(e)}", exc_info=True)
+        
+        logger.debug("Response saved to local CSV files: %s and %s", latest_csv, daily_csv)
 
-    def save_to_text_log(self, row_data):
-        """Save response data to a simple text log file."""
-        try:
-            # Ensure log directory exists
-            log_dir = os.path.join(os.path.dirname(__file__), 'response_logs')
-            if not os.path.exists(log_dir):
-                os.makedirs(log_dir)
-            
-            # Path for log file (one file per day)
-            today = datetime.now().strftime("%Y%m%d")
-            log_file = os.path.join(log_dir, f'responses_{today}.log')
-            
-            # Format the data in an easy-to-read way
-            log_entry = f"\n=== Response at {row_data[4]} ===\n"  # Timestamp is at index 4
-            log_entry += f"Username: {row_data[0]}\n"
-            log_entry += f"Name: {row_data[1]} {row_data[2]}\n"
-            log_entry += f"User ID: {row_data[3]}\n"
-            
-            # Add all question responses
-            with open('questions.json', 'r', encoding='utf-8') as f:
-                questions = json.load(f)['quiz']
-            
-            for i, q in enumerate(questions):
-                log_entry += f"{q['question']}: {row_data[i + 5]}\n"  # +5 because first 5 are user info and timestamp
-            
-            log_entry += "=" * 50 + "\n"
-            
-            # Append to log file
-            with open(log_file, 'a', encoding='utf-8') as f:
-                f.write(log_entry)
-            
-            logger.info(f"Response saved to text log: {log_file}")
-            
-        except Exception as e:
-            logger.error(f"Error saving to text log: {str(e)}", exc_info=True)
+    def save_to_text_log(self, row_data, headers):
+        """Save response data to a simple text log file (a completion pipeline sink)."""
+        # Ensure log directory exists
+        log_dir = os.path.join(self.data_dir, 'response_logs')
+        os.makedirs(log_dir, exist_ok=True)
+        
+        # Path for log file (one file per day)
+        today = datetime.now().strftime("%Y%m%d")
+        log_file = os.path.join(log_dir, f'responses_{today}.log')
+        
+        # Format the data in an easy-to-read way
+        log_entry = f"\n=== Response at {row_data[4]} ===\n"  # Timestamp is at index 4
+        log_entry += f"Username: {row_data[0]}\n"
+        log_entry += f"Name: {row_data[1]} {row_data[2]}\n"
+        log_entry += f"User ID: {row_data[3]}\n"
+        
+        # Add all question responses (answers start after the 5 user info columns)
+        for question_text, response in zip(headers[5:], row_data[5:]):
+            log_entry += f"{question_text}: {response}\n"
+        
+        log_entry += "=" * 50 + "\n"
+        
+        # Append to log file
+        with open(log_file, 'a', encoding='utf-8') as f:
+            f.write(log_entry)
+        
+        logger.debug("Response saved to text log: %s", log_file)
+
+    def save_response(self, row_data, headers):
+        """Queue a completed response for Google Sheets, the local CSV and the text log.
+        
+        Returns once the response is queued; the sinks write it in parallel.
+        """
+        self.completion.submit(row_data, headers)
 
+    @HANDLER_SECONDS.time('finish_form')
+    @TRACER.traced('finish_form')
     def finish_form(self, update: Update, context: CallbackContext) -> None:
         """Save form data and finish."""
         try:
-            # Get user data from form_data
-            form_data = context.user_data.get('form_data', {})
-            user_data = form_data.get('answers', {})
+            # Get the answers, keyed by question ID, plus the user's details from the update
+            session = self.get_user_data(context)
+            schema = self.get_schema(session)
+            user_data = session.answers_dict(schema)
+            user = update.effective_user
+            user_data['username'] = user.username or "Unknown"
+            user_data['first_name'] = user.first_name or "Unknown"
+            user_data['last_name'] = user.last_name or "Unknown"
+            user_data['user_id'] = str(user.id)
             chat_id = update.effective_chat.id
             
             # Get current time
             timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             
-            # Start row data with user info and timestamp
-            row_data = [
-                user_data.get('username', 'Unknown'),
-                user_data.get('first_name', 'Unknown'),
-                user_data.get('last_name', 'Unknown'),
-                user_data.get('user_id', 'Unknown'),
-                timestamp
-            ]
-            
-            # Load questions to ensure correct order
-            with open('questions.json', 'r', encoding='utf-8') as f:
-                questions = json.load(f)['quiz']
-            
-            # Add responses in the same order as questions
-            for q in questions:
-                response = user_data.get(q['id'], '')
-                if isinstance(response, list):
-                    response = ', '.join(response)
-                row_data.append(response)
-            
-            # Save to Google Sheet
-            try:
-                self.sheets_helper.append_row(row_data)
-            except Exception as e:
-                logger.error(f"Error saving to Google Sheets: {str(e)}", exc_info=True)
-            
-            # Save to local CSV
-            self.save_to_local_csv(row_data)
-            
-            # Save to text log
-            self.save_to_text_log(row_data)
-            
-            # Get user preferences for personalized recommendations
-            user_state = None
-            state_keys = ['state', 'location_state', 'region']
-            for key in state_keys:
-                if key in user_data and user_data[key]:
-                    user_state = user_data[key]
-                    logger.info(f"Found state using key: {key} = {user_state}")
-                    break
-                    
-            beliefs = user_data.get('beliefs', [])
-            if isinstance(beliefs, str) and beliefs:
-                beliefs = [beliefs]
-            skills = user_data.get('skills', [])
-            if isinstance(skills, str) and skills:
-                skills = [skills]
-            activism_type = user_data.get('activism_type', [])
-            if isinstance(activism_type, str) and activism_type:
-                activism_type = [activism_type]
-            leadership_interest = user_data.get('leadership', '')
-            social_media_platforms = user_data.get('social_media', [])
-            if isinstance(social_media_platforms, str) and social_media_platforms:
-                social_media_platforms = [social_media_platforms]
-                
-            # Debug logging to see what data we have
-            logger.info(f"User data keys: {list(user_data.keys())}")
-            logger.info(f"User state: {user_state}")
-            logger.info(f"Beliefs: {beliefs}")
-            logger.info(f"Skills: {skills}")
-            logger.info(f"Activism type: {activism_type}")
-            logger.info(f"Leadership interest: {leadership_interest}")
+            # User info, timestamp, then responses in the session's question order
+            row_data = schema.build_row(user_data, timestamp)
             
-            # Prepare completion message with personalized recommendations
-            completion_text = (
-                "Thank you for completing the Voices Ignited questionnaire! \n\n"
-                "Welcome to the group! Here are some links to get you started:\n"
-            )
-            
-            # Add state-specific link if available
-            if user_state and user_state in self.state_links:
-                completion_text += f"\n• Your local state group: {self.state_links[user_state]}"
-            else:
-                # If state not found, check if it's a region and provide general info
-                region = user_data.get('region', '')
-                if region:
-                    completion_text += f"\n• Your region ({region}) resources: https://t.me/c/2399831251/regional_resources"
-                else:
-                    # Fallback to general state resources
-                    completion_text += f"\n• State & regional resources: https://t.me/c/2399831251/state_resources"
-            
-            # Add general channels that everyone should join
-            general_channels = [
-                ("Mental Health Check In", "https://t.me/c/2399831251/227321"),
-                ("Public Announcements", "https://t.me/c/2399831251/465"),
-                ("Official Media & Information", "https://t.me/c/2399831251/202409"),
-                ("Open Discussion", "https://t.me/c/2399831251/8684")
-            ]
-            
-            completion_text += "\n\nImportant general channels:"
-            for channel_name, channel_link in general_channels:
-                completion_text += f"\n• {channel_name}: {channel_link}"
-            
-            # Add topic-specific channels based on user interests
-            topic_channels = []
-            
-            # Add channels based on beliefs
-            if "Healthcare Rights" in beliefs:
-                topic_channels.append(("Healthcare Advocacy", "https://t.me/c/2399831251/123456"))
-            if "Environmental Issues" in beliefs:
-                topic_channels.append(("Environmental Action", "https://t.me/c/2399831251/234567"))
-            if "Government Reform" in beliefs:
-                topic_channels.append(("Government Reform", "https://t.me/c/2399831251/345678"))
-            if "Economic Justice" in beliefs:
-                topic_channels.append(("Economic Justice", "https://t.me/c/2399831251/456789"))
-            
-            # Add channels based on activism type
-            if "Online Advocacy" in activism_type:
-                topic_channels.append(("Digital Activism", "https://t.me/c/2399831251/567890"))
-            if "Direct Action/Protest" in activism_type:
-                topic_channels.append(("Direct Action Planning", "https://t.me/c/2399831251/678901"))
-            if "Policy/Legislative" in activism_type:
-                topic_channels.append(("Policy Working Group", "https://t.me/c/2399831251/789012"))
-            
-            # Add channels based on skills
-            if "Social Media" in skills or "Writing/Content" in skills:
-                topic_channels.append(("Content Creation", "https://t.me/c/2399831251/890123"))
-            if "Tech/IT" in skills:
-                topic_channels.append(("Tech Team", "https://t.me/c/2399831251/901234"))
-            if "Event Planning" in skills:
-                topic_channels.append(("Event Coordination", "https://t.me/c/2399831251/012345"))
-            
-            # Add topic channels if any were selected
-            if topic_channels:
-                completion_text += "\n\nBased on your interests, we recommend these topic channels:"
-                for channel_name, channel_link in topic_channels:
-                    completion_text += f"\n• {channel_name}: {channel_link}"
-            
-            # Add leadership application links if user expressed interest
-            if leadership_interest in ["Yes, I'm ready to lead", "Maybe, I'd like to learn first"]:
-                completion_text += "\n\nLeadership application channels:"
-                completion_text += f"\n• General Leadership: {self.leadership_links['general']}"
-                completion_text += f"\n• Veterans, Educators & Nurses: {self.leadership_links['veterans_educators_nurses']}"
-                completion_text += f"\n• Marginalized/Underrepresented Communities: {self.leadership_links['marginalized_underrepresented']}"
-            
-            # Add social media follow links
-            completion_text += "\n\nFollow us on social media:"
-            for platform, link in self.social_media_links.items():
-                if platform != "Linktree" and platform != "Keybase":
-                    completion_text += f"\n• {platform}: {link}"
-            
-            completion_text += f"\n\nAll our social links: {self.social_media_links['Linktree']}"
-            
-            if "encrypted_communication" in user_data and user_data["encrypted_communication"] == "Yes":
-                completion_text += f"\n\nSecure communication: {self.social_media_links['Keybase']}"
+            # Personalized links from the compiled recommendation rules
+            completion_text = self.recommendations.completion_text(session, schema)
             
             # Clear user data
             context.user_data.clear()
             
-            # Send completion message
-            if update.callback_query:
-                update.callback_query.message.reply_text(
-                    completion_text
-                )
-            else:
-                context.bot.send_message(
-                    chat_id=chat_id,
-                    text=completion_text
-                )
+            try:
+                # Send completion message first, after other users' questions if the bot is busy
+                with priority(PRIORITY_LOW):
+                    if update.callback_query:
+                        update.callback_query.message.reply_text(
+                            completion_text
+                        )
+                    else:
+                        context.bot.send_message(
+                            chat_id=chat_id,
+                            text=completion_text
+                        )
+            finally:
+                # Then hand the response to the sinks, which write it in the background
+                self.response_sink(row_data, schema.header_row)
+            COMPLETIONS.inc()
             
         except Exception as e:
             logger.error(f"Error in finish_form: {str(e)}")
@@ -716,6 +597,388 @@ class FormBot:
                 text="Sorry, there was an error saving your responses. Please try again later or contact support."
             )
 
+def create_app(sheets_helper=None, data_dir=None, response_sink=None, backup_questions=True):
+    """Set up logging and questions.json backups, and create the FormBot the bot process runs.
+    
+    Tests and tools that only need the handlers construct FormBot directly,
+    which configures nothing globally and writes no backups. Other arguments
+    are passed to FormBot.
+    
+    Args:
+        backup_questions: Keep a copy of questions.json in .history/ each time
+            it is loaded. Shard workers pass False; the front process keeps
+            the one copy.
+    """
+    # Log records are formatted and written on a background thread (see utils/logging_setup.py)
+    configure_logging()
+    return FormBot(
+        sheets_helper=sheets_helper, data_dir=data_dir, response_sink=response_sink,
+        backups=BackupManager() if backup_questions else None
+    )
+
+def error_handler(update: Update, context: CallbackContext):
+    """Log dispatcher errors and tell the user something went wrong."""
+    error = context.error
+    logger.error(f"Error occurred: {error}", exc_info=True)
+    try:
+        if update and update.effective_message:
+            update.effective_message.reply_text("Sorry, something went wrong. Please try again later.")
+        elif update and update.callback_query:
+            update.callback_query.message.reply_text("Sorry, something went wrong. Please try /start again.")
+    except Exception as e:
+        logger.error(f"Error in error handler: {e}", exc_info=True)
+
+def register_handlers(dp, bot: FormBot):
+    """Register FormBot's command, message and callback handlers on a dispatcher."""
+    # Record every user's activity for session expiry, in its own group ahead of the rest
+    bot.sessions.attach(dp)
+    dp.add_handler(TypeHandler(Update, bot.sessions.touch_update), group=-2)
+    dp.add_handler(CommandHandler('start', bot.start))
+    dp.add_handler(CommandHandler('quiz', bot.start))  # Use the same handler for both commands
+    dp.add_handler(CommandHandler('reload', bot.reload_questions, run_async=True))
+    dp.add_handler(CommandHandler('traces', bot.show_traces, run_async=True))
+    dp.add_handler(MessageHandler(Filters.text & ~Filters.command, bot.handle_response))
+    dp.add_handler(CallbackQueryHandler(bot.handle_callback))
+    dp.add_error_handler(error_handler)
+
+def register_metrics(bot: FormBot, dispatcher=None):
+    """Expose the bot's existing stats (sessions, sinks, queues, 429s) as metrics read at scrape time.
+    
+    Args:
+        bot: FormBot whose completion pipeline and queues are reported.
+        dispatcher: Dispatcher whose sessions and outgoing calls are reported;
+            None in the sharded front process, where the workers own them.
+    """
+    if dispatcher is not None:
+        REGISTRY.callback(
+            'quizbot_active_sessions', 'Users with a quiz in progress',
+            lambda: sum(1 for data in list(dispatcher.user_data.values()) if 'form_data' in data)
+        )
+        REGISTRY.callback(
+            'quizbot_session_drops', 'Sessions dropped for being idle (expired) or over the cap (evicted)',
+            lambda: {'expired': bot.sessions.stats['expired'], 'evicted': bot.sessions.stats['evicted']},
+            type='counter', labelnames=('reason',)
+        )
+        if isinstance(dispatcher.bot, RateLimitedMixin):
+            scheduler = dispatcher.bot.scheduler
+            REGISTRY.callback(
+                'quizbot_telegram_retry_after', 'Telegram calls rejected with 429 RetryAfter',
+                lambda: scheduler.stats['retry_after'], type='counter'
+            )
+    if bot.sheets_queue is not None:
+        REGISTRY.callback(
+            'quizbot_sink_failures', 'Completed responses a sink gave up on after retries',
+            lambda: {name: stats['failed'] for name, stats in bot.completion.get_stats().items()},
+            type='counter', labelnames=('sink',)
+        )
+        REGISTRY.callback(
+            'quizbot_sink_dropped', 'Completed responses a sink dropped because max_pending were already queued',
+            lambda: {name: stats['dropped'] for name, stats in bot.completion.get_stats().items()},
+            type='counter', labelnames=('sink',)
+        )
+        if isinstance(bot.sheets_helper, SheetsHelper):
+            def sheets_requests():
+                stats = bot.sheets_helper.get_transport_stats()
+                return {'opened': stats.get('connections_opened', 0), 'reused': stats.get('connections_reused', 0)}
+
+            REGISTRY.callback(
+                'quizbot_sheets_requests', 'Sheets requests, by whether they opened a connection or reused one',
+                sheets_requests, type='counter', labelnames=('connection',)
+            )
+
+    def queue_depths():
+        depths = {'edit_coalescer': len(bot.edits._pending)}
+        if dispatcher is not None:
+            depths['update_queue'] = dispatcher.update_queue.qsize()
+            if isinstance(dispatcher.bot, RateLimitedMixin):
+                depths['telegram_outbound'] = dispatcher.bot.scheduler.depth()
+        if bot.sheets_queue is not None:
+            depths['sheets_write'] = bot.sheets_queue.depth()
+            depths['sheets_outbox'] = bot.sheets_outbox.count()
+            for name, stats in bot.completion.get_stats().items():
+                depths[f'sink_{name}'] = stats['pending']
+        return depths
+
+    REGISTRY.callback('quizbot_queue_depth', 'Items waiting in each internal queue', queue_depths, labelnames=('queue',))
+
+def start_metrics():
+    """Serve metrics on 127.0.0.1:METRICS_PORT when that is set; returns the server or None."""
+    port = os.getenv('METRICS_PORT')
+    if not port:
+        return None
+    server = MetricsServer(REGISTRY, listen=os.getenv('METRICS_LISTEN', '127.0.0.1'), port=int(port))
+    server.start()
+    return server
+
+def dump_metrics(context: CallbackContext = None):
+    """Write the current metrics to METRICS_FILE, if set; also usable as a job callback."""
+    path = os.getenv('METRICS_FILE')
+    if not path:
+        return
+    try:
+        REGISTRY.dump(path)
+    except OSError as e:
+        logger.error(f"Error writing metrics to {path}: {str(e)}")
+
+def run_every(job_queue, callback, seconds):
+    """Schedule a job callback every ``seconds`` seconds, first run one interval from now.
+    
+    Same as ``job_queue.run_repeating``, but with the trigger built here:
+    run_repeating names its trigger, and APScheduler resolves trigger names
+    through pkg_resources entry points, which parses every installed
+    package's requirements (about 0.3 s of startup).
+    """
+    trigger = IntervalTrigger(seconds=seconds, timezone=job_queue.scheduler.timezone)
+    return job_queue.run_custom(callback, job_kwargs={'trigger': trigger})
+
+def build_updater(token, bot: FormBot, session_db=None, rate_limit_share=1):
+    """Create an Updater with session persistence, FormBot's handlers and the reload job.
+    
+    Args:
+        token: Telegram bot token.
+        bot: FormBot whose handlers are registered.
+        session_db: Path of the session database. Defaults to 'sessions/sessions.db'.
+        rate_limit_share: Number of processes sending as this bot; each gets
+            that fraction of the global rate limit.
+    """
+    # Keep quiz sessions across restarts unless SESSION_STORE=memory
+    persistence = None
+    if os.getenv('SESSION_STORE', 'sqlite') == 'sqlite':
+        persistence = SqliteSessionPersistence(
+            db_path=session_db,
+            flush_interval=float(os.getenv('SESSION_FLUSH_INTERVAL', '0.5'))
+        )
+    # Outgoing calls are paced below Telegram's global and per-chat limits
+    scheduler = OutboundScheduler(
+        global_rate=float(os.getenv('TELEGRAM_GLOBAL_RATE', '30')) / rate_limit_share,
+        answer_rate=float(os.getenv('TELEGRAM_ANSWER_RATE', '30')) / rate_limit_share,
+        chat_rate=float(os.getenv('TELEGRAM_CHAT_RATE', '1')),
+        chat_burst=int(os.getenv('TELEGRAM_CHAT_BURST', '3')),
+        max_workers=int(os.getenv('TELEGRAM_SEND_WORKERS', '8'))
+    )
+    telegram_bot = RateLimitedBot(
+        token,
+        scheduler=scheduler,
+        request=Request(con_pool_size=scheduler.max_workers + 8)
+    )
+    updater = Updater(bot=telegram_bot, use_context=True, persistence=persistence)
+    bot.updater = updater
+    register_handlers(updater.dispatcher, bot)
+    
+    # Pick up edits to questions.json without a restart
+    run_every(updater.job_queue, bot.check_questions_reload, float(os.getenv('QUESTIONS_RELOAD_INTERVAL', '30')))
+    # Pick up edits to forum_topics_with_links.csv the same way
+    run_every(updater.job_queue, bot.check_topics_reload, float(os.getenv('TOPICS_RELOAD_INTERVAL', '60')))
+    # Drop sessions idle for longer than SESSION_TTL
+    run_every(updater.job_queue, bot.sessions.sweep_job, float(os.getenv('SESSION_SWEEP_INTERVAL', '300')))
+    register_metrics(bot, updater.dispatcher)
+    if os.getenv('METRICS_FILE'):
+        run_every(updater.job_queue, dump_metrics, float(os.getenv('METRICS_DUMP_INTERVAL', '60')))
+    return updater
+
+def run_async_mode(updater: Updater, webhook=False):
+    """Serve updates through the asyncio pipeline instead of the threaded polling loop.
+    
+    Args:
+        updater: Updater whose dispatcher, bot and job queue are used.
+        webhook: Receive updates on the built-in webhook listener instead of long polling.
+    """
+    dp = updater.dispatcher
+    pipeline = AsyncUpdatePipeline(
+        dp,
+        max_concurrency=int(os.getenv('ASYNC_CONCURRENCY', '64')),
+        max_pending=int(os.getenv('ASYNC_MAX_PENDING', '1000'))
+    )
+    
+    # The dispatcher thread only serves run_async handlers (e.g. /reload) in this mode
+    threading.Thread(target=dp.start, name='dispatcher', daemon=True).start()
+    updater.job_queue.start()
+    
+    async def serve():
+        await pipeline.start()
+        loop = asyncio.get_running_loop()
+        poller = asyncio.current_task()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, poller.cancel)
+        server = None
+        try:
+            if webhook:
+                server = WebhookServer(
+                    pipeline,
+                    updater.bot,
+                    listen=os.getenv('WEBHOOK_LISTEN', '127.0.0.1'),
+                    port=int(os.getenv('WEBHOOK_PORT', '8443')),
+                    path=os.getenv('WEBHOOK_PATH', '/telegram')
+                )
+                await server.start()
+                webhook_url = os.getenv('WEBHOOK_URL')
+                if webhook_url:
+                    await loop.run_in_executor(None, lambda: updater.bot.set_webhook(
+                        url=webhook_url,
+                        allowed_updates=['message', 'callback_query'],
+                        drop_pending_updates=True
+                    ))
+                # Serve until a stop signal cancels this task
+                await asyncio.Event().wait()
+            else:
+                await pipeline.poll(
+                    updater.bot,
+                    timeout=30,
+                    allowed_updates=['message', 'callback_query'],
+                    drop_pending_updates=True
+                )
+        except asyncio.CancelledError:
+            logger.info("Received stop signal, draining async pipeline...")
+        finally:
+            if server is not None:
+                await server.stop()
+            await pipeline.stop()
+    
+    try:
+        asyncio.run(serve())
+    finally:
+        updater.job_queue.stop()
+        dp.stop()
+        if dp.persistence:
+            dp.update_persistence()
+            dp.persistence.flush()
+
+def run_shard_worker(index, update_queue, result_queue, token, num_workers=1):
+    """Entry point of a shard worker process: handle the updates routed to this shard.
+    
+    Completed responses are sent back to the front process, which owns the
+    shared sinks. Each worker keeps its own session database, log file,
+    metrics file and trace file.
+    """
+    # The front process coordinates shutdown by sending None
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Spawned workers start from a fresh interpreter
+    load_dotenv()
+    # Processes sharing a log, metrics or trace file would rotate or replace each
+    # other's; each worker writes its own, and labels its metrics with its shard
+    for name, default in (
+        ('LOG_FILE', os.path.join('logs', 'bot.log')),
+        ('METRICS_FILE', ''),
+        ('TRACE_FILE', os.path.join('logs', 'slow_traces.json'))
+    ):
+        path = os.getenv(name, default)
+        if path:
+            os.environ[name] = f"{path}.shard{index}"
+    REGISTRY.const_labels['shard'] = str(index)
+    bot = create_app(
+        response_sink=lambda row_data, headers: result_queue.put((row_data, list(headers))),
+        backup_questions=False
+    )
+    session_db = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sessions', f'sessions_{index}.db')
+    updater = build_updater(token, bot, session_db=session_db, rate_limit_share=num_workers)
+    dp = updater.dispatcher
+    
+    # The dispatcher thread only serves run_async handlers (e.g. /reload) here
+    threading.Thread(target=dp.start, name='dispatcher', daemon=True).start()
+    updater.job_queue.start()
+    logger.info(f"Shard worker {index} ready")
+    
+    try:
+        while True:
+            data = update_queue.get()
+            if data is None:
+                break
+            try:
+                dp.process_update(Update.de_json(data, updater.bot))
+            except Exception as e:
+                logger.error(f"Shard worker {index} failed to process update: {str(e)}", exc_info=True)
+    finally:
+        updater.job_queue.stop()
+        dp.stop()
+        if dp.persistence:
+            dp.update_persistence()
+            dp.persistence.flush()
+        bot.shutdown()
+        logger.info(f"Shard worker {index} stopped")
+
+def run_sharded_mode(token, bot: FormBot, num_workers, webhook=False):
+    """Receive updates in this process and route them by user to worker processes.
+    
+    Args:
+        token: Telegram bot token.
+        bot: FormBot owning the shared sinks; rows from all workers are written through it.
+        num_workers: Number of worker processes.
+        webhook: Receive updates on the built-in webhook listener instead of long polling.
+    """
+    router = ShardRouter(
+        num_workers,
+        run_shard_worker,
+        worker_args=(token, num_workers),
+        response_sink=bot.save_response,
+        max_pending=int(os.getenv('ASYNC_MAX_PENDING', '1000'))
+    )
+    router.start()
+    telegram_bot = Bot(token)
+    
+    async def watch_questions():
+        # Workers reload questions.json on their own; this process keeps the one backup of each edit
+        interval = float(os.getenv('QUESTIONS_RELOAD_INTERVAL', '30'))
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            await loop.run_in_executor(None, bot.check_questions_reload, None)
+    
+    async def serve():
+        loop = asyncio.get_running_loop()
+        task = asyncio.current_task()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, task.cancel)
+        server = None
+        watcher = asyncio.create_task(watch_questions())
+        try:
+            if webhook:
+                server = WebhookServer(
+                    router,
+                    telegram_bot,
+                    listen=os.getenv('WEBHOOK_LISTEN', '127.0.0.1'),
+                    port=int(os.getenv('WEBHOOK_PORT', '8443')),
+                    path=os.getenv('WEBHOOK_PATH', '/telegram')
+                )
+                await server.start()
+                webhook_url = os.getenv('WEBHOOK_URL')
+                if webhook_url:
+                    await loop.run_in_executor(None, lambda: telegram_bot.set_webhook(
+                        url=webhook_url,
+                        allowed_updates=['message', 'callback_query'],
+                        drop_pending_updates=True
+                    ))
+                await asyncio.Event().wait()
+            else:
+                await loop.run_in_executor(None, lambda: telegram_bot.delete_webhook(drop_pending_updates=True))
+                offset = None
+                while True:
+                    try:
+                        updates = await loop.run_in_executor(None, lambda: telegram_bot.get_updates(
+                            offset=offset,
+                            timeout=30,
+                            read_latency=5,
+                            allowed_updates=['message', 'callback_query']
+                        ))
+                    except Exception as e:
+                        logger.error(f"Error fetching updates: {str(e)}")
+                        await asyncio.sleep(1)
+                        continue
+                    for update in updates:
+                        offset = update.update_id + 1
+                        # A full worker queue blocks here, which pauses polling (backpressure)
+                        await loop.run_in_executor(None, router.submit, update)
+        except asyncio.CancelledError:
+            logger.info("Received stop signal, stopping shard workers...")
+        finally:
+            watcher.cancel()
+            if server is not None:
+                await server.stop()
+    
+    try:
+        asyncio.run(serve())
+    finally:
+        router.stop()
+
 def main():
     """Run the bot."""
     try:
@@ -727,46 +990,40 @@ def main():
         if not token:
             raise ValueError("No bot token found in environment variables")
             
-        # Enable more verbose logging
-        logging.getLogger('telegram').setLevel(logging.DEBUG)
-        logging.getLogger('telegram.ext').setLevel(logging.DEBUG)
-        
-        bot = FormBot()
-        updater = Updater(token, use_context=True)
-        bot.updater = updater
-        
-        # Get the dispatcher to register handlers
-        dp = updater.dispatcher
-
-        # Add handlers
-        dp.add_handler(CommandHandler('start', bot.start))
-        dp.add_handler(CommandHandler('quiz', bot.start))  # Use the same handler for both commands
-        dp.add_handler(MessageHandler(Filters.text & ~Filters.command, bot.handle_response))
-        dp.add_handler(CallbackQueryHandler(bot.handle_callback))
-
-        # Add error handler
-        def error_handler(update: Update, context: CallbackContext):
-            error = context.error
-            logger.error(f"Error occurred: {error}", exc_info=True)
-            try:
-                if update and update.effective_message:
-                    update.effective_message.reply_text("Sorry, something went wrong. Please try again later.")
-                elif update and update.callback_query:
-                    update.callback_query.message.reply_text("Sorry, something went wrong. Please try /start again.")
-            except Exception as e:
-                logger.error(f"Error in error handler: {e}", exc_info=True)
-        
-        dp.add_error_handler(error_handler)
+        bot = create_app()
+        # Local Prometheus endpoint, off unless METRICS_PORT is set
+        metrics_server = start_metrics()
         
         # Start the bot
-        logger.info("Starting bot with token ending in ...%s", token[-4:])
-        updater.start_polling(
-            timeout=30,
-            read_latency=5,
-            drop_pending_updates=True,
-            allowed_updates=['message', 'callback_query']
-        )
-        updater.idle()
+        mode = os.getenv('BOT_MODE', 'polling')
+        logger.info("Starting bot in %s mode with token ending in ...%s", mode, token[-4:])
+        if mode == 'sharded':
+            register_metrics(bot)
+            run_sharded_mode(
+                token,
+                bot,
+                num_workers=int(os.getenv('SHARD_WORKERS', str(os.cpu_count() or 2))),
+                webhook=(os.getenv('SHARD_INGEST', 'polling') == 'webhook')
+            )
+            bot.shutdown()
+            if metrics_server is not None:
+                metrics_server.stop()
+            return
+            
+        updater = build_updater(token, bot)
+        if mode in ('async', 'webhook'):
+            run_async_mode(updater, webhook=(mode == 'webhook'))
+        else:
+            updater.start_polling(
+                timeout=30,
+                read_latency=5,
+                drop_pending_updates=True,
+                allowed_updates=['message', 'callback_query']
+            )
+            updater.idle()
+        bot.shutdown()
+        if metrics_server is not None:
+            metrics_server.stop()
     except Exception as e:
         logger.error(f"Fatal error: {str(e)}", exc_info=True)
         raise
@@ -1,49 +1,119 @@
-from google.oauth2.credentials import Credentials
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
 import os
 import json
+import time
+import threading
+import functools
 from datetime import datetime
 import logging
+from utils.metrics import API_CALL_SECONDS
+from utils.sheets_transport import SheetsTransport
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
+# The Google client libraries take a quarter of a second to import, so they
+# are imported when the first Sheets call needs a client, not with this module
+
+# Handlers and levels are configured by the entry point (utils/logging_setup.py for the bot)
 logger = logging.getLogger(__name__)
 
+SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
+
+@functools.lru_cache(maxsize=None)
+def discovery_document(api='sheets', version='v4'):
+    """Return the parsed discovery document bundled with google-api-python-client.
+    
+    Parsed once per process; clients built from it never fetch the document
+    over the network or read it from disk again.
+    """
+    from googleapiclient import discovery_cache
+    document = discovery_cache.get_static_doc(api, version)
+    if document is None:
+        raise ValueError(f"No bundled discovery document for {api} {version}")
+    return json.loads(document)
+
 class SheetsHelper:
-    def __init__(self):
-        """Initialize the Google Sheets helper."""
+    def __init__(self, credentials_file='service_account.json', pool_size=None):
+        """Initialize the Google Sheets helper.
+        
+        The Sheets client is created on first use, so constructing the helper
+        neither imports the Google libraries nor reads the credentials.
+        Requests are safe to make from several threads: each runs on its own
+        pooled connection (see utils/sheets_transport.py).
+        
+        Args:
+            credentials_file: Service account key file.
+            pool_size: Maximum concurrent Sheets requests, each with its own
+                keep-alive connection. Defaults to SHEETS_POOL_SIZE (4).
+        """
         self.SPREADSHEET_ID = os.getenv('SPREADSHEET_ID')
         if not self.SPREADSHEET_ID:
             raise ValueError("SPREADSHEET_ID not found in environment variables")
             
         self.SHEET_NAME = 'Sheet1'  # Changed to Sheet1 since it's the default sheet
+        self.credentials_file = credentials_file
+        self.pool_size = pool_size or int(os.getenv('SHEETS_POOL_SIZE', '4'))
+        self.transport = None
+        self._sheet = None
+        self._service_lock = threading.Lock()
+        
+    @property
+    def sheet(self):
+        """The spreadsheets resource of the Sheets API client, created on first access."""
+        if self._sheet is None:
+            with self._service_lock:
+                if self._sheet is None:
+                    self.service = self._build_service()
+                    self._sheet = self.service.spreadsheets()
+        return self._sheet
         
+    def execute(self, request):
+        """Execute a request built from ``self.sheet`` on a pooled connection."""
+        return self.transport.execute(request)
+        
+    def get_transport_stats(self):
+        """Connection reuse, token refresh and pool wait counters; empty before the first request."""
+        return self.transport.get_stats() if self.transport is not None else {}
+        
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+        
+    def _build_service(self):
         try:
+            from google.oauth2 import service_account
+            from googleapiclient.discovery import build_from_document
+            
             # Load credentials
             logger.debug("Loading service account credentials...")
-            creds = service_account.Credentials.from_service_account_file(
-                'service_account.json',
-                scopes=['https://www.googleapis.com/auth/spreadsheets']
-            )
+            creds = service_account.Credentials.from_service_account_file(self.credentials_file, scopes=SCOPES)
             logger.info("Successfully loaded credentials")
             
-            # Create service
+            # Requests are executed on the transport's pooled clients, never on the service's own
+            self.transport = SheetsTransport(
+                creds,
+                pool_size=self.pool_size,
+                refresh_margin=float(os.getenv('SHEETS_TOKEN_REFRESH_MARGIN', '300'))
+            )
+            
+            # Create service from the bundled discovery document
             logger.debug("Initializing Google Sheets service...")
-            self.service = build('sheets', 'v4', credentials=creds)
-            self.sheet = self.service.spreadsheets()
+            service = build_from_document(discovery_document(), credentials=creds)
             logger.info("Successfully initialized Google Sheets service")
+            return service
             
         except Exception as e:
             logger.error(f"Failed to initialize sheets helper: {str(e)}")
             raise
             
-    def setup_sheet(self, force_recreate=False):
-        """Create Responses sheet if it doesn't exist and set up headers."""
+    def setup_sheet(self, force_recreate=False, headers=None):
+        """Create Responses sheet if it doesn't exist and set up headers.
+        
+        Args:
+            force_recreate: Delete and recreate the sheet first.
+            headers: Header row to write, e.g. ``QuizSchema.header_row``.
+                Defaults to headers built from questions.json.
+        """
         try:
             # Get spreadsheet info
-            spreadsheet = self.sheet.get(spreadsheetId=self.SPREADSHEET_ID).execute()
+            spreadsheet = self.execute(self.sheet.get(spreadsheetId=self.SPREADSHEET_ID))
             sheets = spreadsheet.get('sheets', [])
             sheet_names = [s['properties']['title'] for s in sheets]
             
@@ -65,10 +135,10 @@ class SheetsHelper:
                             }
                         }]
                     }
-                    self.sheet.batchUpdate(
+                    self.execute(self.sheet.batchUpdate(
                         spreadsheetId=self.SPREADSHEET_ID,
                         body=body
-                    ).execute()
+                    ))
                     sheet_names.remove(self.SHEET_NAME)
                     
             # Create sheet if it doesn't exist
@@ -82,36 +152,37 @@ class SheetsHelper:
                         }
                     }]
                 }
-                self.sheet.batchUpdate(
+                self.execute(self.sheet.batchUpdate(
                     spreadsheetId=self.SPREADSHEET_ID,
                     body=body
-                ).execute()
+                ))
                 
-            # Load questions to get headers
-            with open('questions.json', 'r', encoding='utf-8') as f:
-                questions = json.load(f)['quiz']
+            if headers is None:
+                # Load questions to get headers
+                with open('questions.json', 'r', encoding='utf-8') as f:
+                    questions = json.load(f)['quiz']
+                    
+                # Create headers
+                headers = [
+                    'Timestamp',
+                    'Telegram Username',
+                    'Telegram User ID'
+                ]
                 
-            # Create headers
-            headers = [
-                'Timestamp',
-                'Telegram Username',
-                'Telegram User ID'
-            ]
-            
-            # Add question headers
-            for q in questions:
-                headers.append(q['question'])
+                # Add question headers
+                for q in questions:
+                    headers.append(q['question'])
                 
             # Update headers in sheet
             body = {
-                'values': [headers]
+                'values': [list(headers)]
             }
-            self.sheet.values().update(
+            self.execute(self.sheet.values().update(
                 spreadsheetId=self.SPREADSHEET_ID,
                 range=f'{self.SHEET_NAME}!A1:ZZ1',
                 valueInputOption='RAW',
                 body=body
-            ).execute()
+            ))
             
             logger.info("Sheet setup completed successfully")
             return True
@@ -122,20 +193,271 @@ class SheetsHelper:
             
     def append_row(self, row_data):
         """Append a row of data to the sheet."""
+        return self.append_rows([row_data])
+
+    def append_rows(self, rows):
+        """Append several rows to the sheet in a single API call."""
         try:
             body = {
-                'values': [row_data]
+                'values': rows
             }
-            self.sheet.values().append(
+            request = self.sheet.values().append(
                 spreadsheetId=self.SPREADSHEET_ID,
                 range=f'{self.SHEET_NAME}!A1',
                 valueInputOption='RAW',
                 insertDataOption='INSERT_ROWS',
                 body=body
-            ).execute()
-            logger.info("Successfully appended row to sheet")
+            )
+            with API_CALL_SECONDS.labels('sheets', 'append').time():
+                self.execute(request)
+            logger.info("Successfully appended %d row(s) to sheet", len(rows))
             return True
             
         except Exception as e:
-            logger.error(f"Failed to append row: {str(e)}")
+            logger.error(f"Failed to append {len(rows)} row(s): {str(e)}")
             return False
+            
+    def get_existing_keys(self):
+        """Return the idempotency keys of every row already in the sheet.
+        
+        Raises on API errors so callers never mistake an outage for an empty sheet.
+        """
+        request = self.sheet.values().get(
+            spreadsheetId=self.SPREADSHEET_ID,
+            range=f'{self.SHEET_NAME}!A:E'
+        )
+        with API_CALL_SECONDS.labels('sheets', 'get').time():
+            result = self.execute(request)
+        return {row_key(row) for row in result.get('values', []) if len(row) >= 5}
+
+
+def row_key(row_data):
+    """Build the idempotency key (user ID plus timestamp) for a response row."""
+    return f"{row_data[3]}:{row_data[4]}"
+
+
+class SheetsWriteQueue:
+    """Write-behind queue that batches rows into a single Sheets append call.
+    
+    Rows are handed to a background flusher thread so callers never wait on
+    the Google API. A batch is written once it reaches ``max_batch_size`` rows
+    or once its oldest row has been pending for ``flush_interval`` seconds.
+    
+    When an outbox is given, every row is stored there before it is queued and
+    removed only after the sheet accepts it. Rows from failed batches (or from
+    a previous crash) are replayed in bulk, skipping keys already in the sheet.
+    """
+    
+    def __init__(self, sheets_helper, max_batch_size=50, flush_interval=2.0,
+                 outbox=None, replay_interval=30.0):
+        """Initialize the write queue.
+        
+        Args:
+            sheets_helper: Object providing ``append_rows(rows)`` and, when an
+                outbox is used, ``get_existing_keys()``.
+            max_batch_size: Maximum number of rows sent in one API call.
+            flush_interval: Seconds a row may wait before a flush is forced.
+            outbox: Optional SheetsOutbox for durable, replayable storage.
+            replay_interval: Seconds between replay attempts while the outbox
+                holds undelivered rows.
+        """
+        self.sheets_helper = sheets_helper
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.outbox = outbox
+        self.replay_interval = replay_interval
+        self._pending = []
+        self._pending_since = None
+        self._needs_replay = outbox is not None and outbox.count() > 0
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._stopping = False
+        self._thread = None
+        self.stats = {
+            'enqueued': 0,
+            'flushed_rows': 0,
+            'failed_rows': 0,
+            'replayed_rows': 0,
+            'duplicates_skipped': 0,
+            'batches': 0,
+            'last_flush_latency': 0.0,
+            'max_flush_latency': 0.0,
+            'total_flush_latency': 0.0
+        }
+        
+    def start(self):
+        """Start the background flusher thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='sheets-flusher', daemon=True)
+            self._thread.start()
+            logger.info(
+                f"Sheets write queue started (batch size {self.max_batch_size}, "
+                f"interval {self.flush_interval}s)"
+            )
+        
+    def enqueue(self, row_data, key=None):
+        """Queue a row for the next batch without blocking on the API.
+        
+        Args:
+            row_data: List of cell values.
+            key: Idempotency key. Defaults to ``row_key(row_data)``.
+        """
+        key = key or row_key(row_data)
+        with self._cond:
+            if self.outbox is not None and not self.outbox.add(key, row_data):
+                logger.info("Row %s is already in the outbox, not queueing it again", key)
+                return
+            if not self._pending:
+                self._pending_since = time.monotonic()
+            self._pending.append((key, row_data))
+            self.stats['enqueued'] += 1
+            # Wake the flusher for the first row (starts the timer) and on a full batch
+            if len(self._pending) == 1 or len(self._pending) >= self.max_batch_size:
+                self._cond.notify()
+                
+    def depth(self):
+        """Return the number of rows waiting to be written."""
+        with self._cond:
+            return len(self._pending)
+        
+    def flush(self):
+        """Write every pending row now, one batch at a time.
+        
+        Returns:
+            True if all batches were written, False if any batch failed.
+        """
+        ok = True
+        with self._flush_lock:
+            while True:
+                with self._cond:
+                    batch = self._pending[:self.max_batch_size]
+                    del self._pending[:self.max_batch_size]
+                    self._pending_since = time.monotonic() if self._pending else None
+                if not batch:
+                    break
+                ok = self._write_batch(batch) and ok
+        return ok
+        
+    def replay_outbox(self):
+        """Drain undelivered outbox rows to the sheet in bulk.
+        
+        Rows whose key is already present in the sheet are dropped from the
+        outbox instead of being appended again.
+        
+        Returns:
+            True if the outbox was fully drained, False otherwise.
+        """
+        if self.outbox is None:
+            return True
+        with self._flush_lock:
+            try:
+                existing = self.sheets_helper.get_existing_keys()
+            except Exception as e:
+                logger.error(f"Cannot replay outbox, failed to read sheet: {str(e)}")
+                return False
+            
+            while True:
+                with self._cond:
+                    queued = [key for key, _ in self._pending]
+                entries = self.outbox.pending(limit=self.max_batch_size, exclude=queued)
+                if not entries:
+                    self._needs_replay = False
+                    return True
+                
+                duplicates = [key for key, _ in entries if key in existing]
+                if duplicates:
+                    self.outbox.mark_delivered(duplicates)
+                    self.stats['duplicates_skipped'] += len(duplicates)
+                    logger.info(f"Skipped {len(duplicates)} outbox row(s) already in the sheet")
+                batch = [(key, row) for key, row in entries if key not in existing]
+                if batch and not self._write_batch(batch):
+                    return False
+                self.stats['replayed_rows'] += len(batch)
+                existing.update(key for key, _ in batch)
+        
+    def _write_batch(self, batch):
+        """Send one batch of (key, row) pairs and record latency statistics."""
+        keys = [key for key, _ in batch]
+        started = time.monotonic()
+        error = None
+        try:
+            success = self.sheets_helper.append_rows([row for _, row in batch])
+        except Exception as e:
+            logger.error(f"Error flushing rows to sheet: {str(e)}", exc_info=True)
+            success = False
+            error = str(e)
+        latency = time.monotonic() - started
+        
+        self.stats['batches'] += 1
+        self.stats['last_flush_latency'] = latency
+        self.stats['max_flush_latency'] = max(self.stats['max_flush_latency'], latency)
+        self.stats['total_flush_latency'] += latency
+        if success:
+            self.stats['flushed_rows'] += len(batch)
+        else:
+            self.stats['failed_rows'] += len(batch)
+            
+        if self.outbox is not None:
+            try:
+                if success:
+                    self.outbox.mark_delivered(keys)
+                else:
+                    # The rows stay in the outbox and are retried by replay_outbox
+                    self.outbox.record_failure(keys, error)
+                    self._needs_replay = True
+            except Exception as e:
+                logger.error(f"Error updating sheets outbox: {str(e)}", exc_info=True)
+        
+        logger.info(
+            f"Flushed {len(batch)} row(s) to sheet in {latency:.3f}s "
+            f"(success: {success}, queue depth: {self.depth()})"
+        )
+        return success
+        
+    def get_stats(self):
+        """Return a snapshot of queue depth and flush latency statistics."""
+        stats = dict(self.stats)
+        stats['queue_depth'] = self.depth()
+        stats['outbox_depth'] = self.outbox.count() if self.outbox is not None else 0
+        stats['avg_flush_latency'] = (
+            stats['total_flush_latency'] / stats['batches'] if stats['batches'] else 0.0
+        )
+        return stats
+        
+    def _run(self):
+        """Flusher loop: wait for a size or time threshold, then flush."""
+        last_replay = 0.0
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopping:
+                    if self._needs_replay:
+                        wait = last_replay + self.replay_interval - time.monotonic()
+                        if wait <= 0:
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+                while self._pending and not self._stopping and len(self._pending) < self.max_batch_size:
+                    remaining = self._pending_since + self.flush_interval - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                stopping = self._stopping
+            self.flush()
+            if self._needs_replay and time.monotonic() - last_replay >= self.replay_interval:
+                last_replay = time.monotonic()
+                self.replay_outbox()
+            if stopping:
+                return
+                
+    def stop(self, timeout=30):
+        """Stop the flusher thread after writing any pending rows."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        # Catch rows enqueued while the thread was shutting down
+        self.flush()
+        logger.info(f"Sheets write queue stopped: {self.get_stats()}")
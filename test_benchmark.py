@@ -0,0 +1,47 @@
+import logging
+from benchmark import percentile, compare_results, deep_sizeof
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def test_percentile_uses_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 0.50) == 50
+    assert percentile(values, 0.95) == 95
+    assert percentile(values, 0.99) == 99
+    assert percentile([], 0.99) == 0.0
+
+def test_compare_flags_regressions_in_the_right_direction():
+    baseline = [
+        {'mode': 'async', 'updates_per_sec': 100.0, 'handler_p95': 0.010},
+        {'mode': 'memory', 'bytes_per_session': 1000.0}
+    ]
+    current = [
+        {'mode': 'async', 'updates_per_sec': 80.0, 'handler_p95': 0.008},
+        {'mode': 'memory', 'bytes_per_session': 1050.0},
+        {'mode': 'webhook', 'updates_per_sec': 50.0}
+    ]
+    rows = {(mode, metric): regressed for mode, metric, _, _, _, regressed in compare_results(baseline, current, 0.1)}
+    # Lower throughput is a regression, lower latency is not
+    assert rows == {
+        ('async', 'updates_per_sec'): True,
+        ('async', 'handler_p95'): False,
+        ('memory', 'bytes_per_session'): False
+    }
+
+def test_deep_sizeof_counts_nested_and_slotted_data():
+    class Slotted:
+        __slots__ = ('answers',)
+
+        def __init__(self):
+            self.answers = {'age': '18-25'}
+
+    assert deep_sizeof({'answers': {'age': '18-25'}}) > deep_sizeof({'answers': {}})
+    assert deep_sizeof(Slotted()) > deep_sizeof(object())
+
+if __name__ == "__main__":
+    test_percentile_uses_nearest_rank()
+    test_compare_flags_regressions_in_the_right_direction()
+    test_deep_sizeof_counts_nested_and_slotted_data()
+    logger.info("✓ Benchmark tests passed")
@@ -0,0 +1,116 @@
+import time
+import logging
+import threading
+from utils.completion_pipeline import CompletionPipeline
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+HEADERS = ('Username', 'Answer')
+
+def test_every_sink_gets_every_row():
+    rows = {'a': [], 'b': []}
+    pipeline = CompletionPipeline()
+    pipeline.add_sink('a', lambda row_data, headers: rows['a'].append(row_data))
+    pipeline.add_sink('b', lambda row_data, headers: rows['b'].append(row_data), workers=2)
+    for i in range(20):
+        pipeline.submit([f'user{i}', 'yes'], HEADERS)
+    pipeline.stop()
+    assert rows['a'] == [[f'user{i}', 'yes'] for i in range(20)]
+    assert sorted(rows['b']) == sorted(rows['a'])
+    stats = pipeline.get_stats()
+    assert stats['a']['delivered'] == 20
+    assert stats['b']['pending'] == 0
+
+def test_slow_sink_does_not_delay_the_others():
+    release = threading.Event()
+    fast_rows = []
+    pipeline = CompletionPipeline()
+    pipeline.add_sink('slow', lambda row_data, headers: release.wait(5))
+    pipeline.add_sink('fast', lambda row_data, headers: fast_rows.append(row_data))
+    started = time.perf_counter()
+    for i in range(5):
+        pipeline.submit([i], HEADERS)
+    # submit never waits on a sink
+    assert time.perf_counter() - started < 0.5
+    deadline = time.time() + 2
+    while len(fast_rows) < 5 and time.time() < deadline:
+        time.sleep(0.01)
+    assert len(fast_rows) == 5
+    assert pipeline.get_stats()['slow']['pending'] == 5
+    release.set()
+    pipeline.stop()
+    assert pipeline.get_stats()['slow']['delivered'] == 5
+
+def test_failed_writes_are_retried():
+    attempts = []
+
+    def flaky(row_data, headers):
+        attempts.append(row_data)
+        if len(attempts) < 3:
+            raise OSError("disk full")
+
+    pipeline = CompletionPipeline()
+    pipeline.add_sink('flaky', flaky, retries=2, retry_delay=0.01)
+    pipeline.add_sink('broken', lambda row_data, headers: 1 / 0, retries=1, retry_delay=0.01)
+    pipeline.submit(['row'], HEADERS)
+    pipeline.stop()
+    stats = pipeline.get_stats()
+    assert stats['flaky']['delivered'] == 1 and stats['flaky']['retries'] == 2
+    assert stats['broken']['failed'] == 1 and stats['broken']['retries'] == 1
+
+def test_full_sink_drops_rows_instead_of_waiting():
+    release = threading.Event()
+    fast_rows = []
+    pipeline = CompletionPipeline()
+    pipeline.add_sink('hung', lambda row_data, headers: release.wait(5), max_pending=2)
+    pipeline.add_sink('fast', lambda row_data, headers: fast_rows.append(row_data))
+    started = time.perf_counter()
+    for i in range(5):
+        pipeline.submit([i], HEADERS)
+    assert time.perf_counter() - started < 0.5
+    release.set()
+    pipeline.stop()
+    stats = pipeline.get_stats()
+    assert stats['hung']['delivered'] == 2 and stats['hung']['dropped'] == 3
+    # The other sinks still get every row
+    assert fast_rows == [[i] for i in range(5)]
+
+def test_slow_write_is_not_retried_while_running():
+    rows = []
+
+    def slow(row_data, headers):
+        time.sleep(0.2)
+        rows.append(row_data)
+
+    calls = []
+
+    def slow_then_broken(row_data, headers):
+        calls.append(row_data)
+        if len(calls) == 1:
+            time.sleep(0.2)
+            raise OSError("disk full")
+
+    pipeline = CompletionPipeline()
+    pipeline.add_sink('slow', slow, timeout=0.1, retries=2, retry_delay=0.01)
+    pipeline.add_sink('slow_then_broken', slow_then_broken, timeout=0.1, retries=2, retry_delay=0.01)
+    pipeline.submit(['row'], HEADERS)
+    pipeline.stop()
+    stats = pipeline.get_stats()
+    # The late write counts as delivered, and nothing raced it
+    assert rows == [['row']]
+    assert stats['slow']['delivered'] == 1 and stats['slow']['failed'] == 0
+    assert stats['slow']['timeouts'] == 1 and stats['slow']['retries'] == 0
+    assert stats['slow']['latency_max'] >= 0.2
+    # A slow attempt that then fails is retried only after it has failed
+    assert len(calls) == 2
+    assert stats['slow_then_broken']['delivered'] == 1 and stats['slow_then_broken']['retries'] == 1
+
+if __name__ == "__main__":
+    test_every_sink_gets_every_row()
+    test_slow_sink_does_not_delay_the_others()
+    test_failed_writes_are_retried()
+    test_full_sink_drops_rows_instead_of_waiting()
+    test_slow_write_is_not_retried_while_running()
+    logger.info("✓ Completion pipeline tests passed")
@@ -0,0 +1,99 @@
+import time
+import logging
+from concurrent.futures import Future
+from telegram.error import BadRequest
+from utils.edit_coalescer import EditCoalescer
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class FakeMessage:
+    def __init__(self, chat_id, message_id=1, text='Pick some'):
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.text = text
+        self.edits = []
+
+    def edit_text(self, text, reply_markup=None):
+        self.edits.append(text)
+
+def test_rapid_edits_are_coalesced():
+    coalescer = EditCoalescer(delay=0.05)
+    coalescer.start()
+    first, second = FakeMessage(1), FakeMessage(2)
+    for text in ('a', 'a, b', 'a, b, c'):
+        coalescer.schedule(first, text)
+    coalescer.schedule(second, 'x')
+    time.sleep(0.3)
+    coalescer.stop()
+
+    # Only the latest state of each message is sent
+    assert first.edits == ['a, b, c']
+    assert second.edits == ['x']
+    assert coalescer.stats['superseded'] == 2
+    assert coalescer.saved_calls() == 2
+
+def test_cancelled_and_unchanged_edits_are_not_sent():
+    coalescer = EditCoalescer(delay=0.05)
+    coalescer.start()
+    replaced, toggled_back = FakeMessage(1), FakeMessage(2, text='Pick some')
+    coalescer.schedule(replaced, 'a')
+    coalescer.cancel(replaced)
+    coalescer.schedule(toggled_back, 'Pick some\n\nSelected: a')
+    coalescer.schedule(toggled_back, 'Pick some')
+    time.sleep(0.3)
+    coalescer.stop()
+
+    assert replaced.edits == []
+    assert toggled_back.edits == []
+    assert coalescer.stats['cancelled'] == 1
+    assert coalescer.saved_calls() == 3
+
+def test_queued_edits_do_not_hold_up_other_chats():
+    # Like RateLimitedBot: edit_text returns a Future that completes once the edit is sent
+    class QueuedMessage(FakeMessage):
+        def __init__(self, chat_id):
+            super().__init__(chat_id)
+            self.futures = []
+
+        def edit_text(self, text, reply_markup=None):
+            super().edit_text(text, reply_markup)
+            self.futures.append(Future())
+            return self.futures[-1]
+
+    coalescer = EditCoalescer(delay=0.01)
+    coalescer.start()
+    throttled, other = QueuedMessage(1), QueuedMessage(2)
+    coalescer.schedule(throttled, 'a')
+    time.sleep(0.1)
+    coalescer.schedule(other, 'x')
+    time.sleep(0.1)
+    # Released while the throttled chat's edit is still waiting to be sent
+    assert other.edits == ['x']
+    assert coalescer.stats['sent'] == 0
+    other.futures[0].set_result(True)
+    throttled.futures[0].set_exception(BadRequest('Message is not modified'))
+    coalescer.stop()
+    assert coalescer.stats['sent'] == 1
+    assert coalescer.stats['unchanged'] == 1
+
+def test_stop_sends_pending_edits_and_zero_delay_edits_inline():
+    coalescer = EditCoalescer(delay=60)
+    coalescer.start()
+    message = FakeMessage(1)
+    coalescer.schedule(message, 'a')
+    coalescer.stop()
+    assert message.edits == ['a']
+
+    inline = EditCoalescer(delay=0)
+    inline.start()
+    inline.schedule(message, 'b')
+    assert message.edits == ['a', 'b']
+
+if __name__ == "__main__":
+    test_rapid_edits_are_coalesced()
+    test_cancelled_and_unchanged_edits_are_not_sent()
+    test_queued_edits_do_not_hold_up_other_chats()
+    test_stop_sends_pending_edits_and_zero_delay_edits_inline()
+    logger.info("✓ Edit coalescer tests passed")
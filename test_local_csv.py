@@ -0,0 +1,76 @@
+import os
+import csv
+import logging
+import tempfile
+from datetime import datetime
+from main import FormBot
+from utils.quiz_schema import header_tag
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class StubSheetsHelper:
+    def append_rows(self, rows):
+        return True
+
+def read_csv(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return list(csv.reader(f))
+
+def csv_paths(data_dir, headers):
+    csv_dir = os.path.join(data_dir, 'local_backups')
+    tag = header_tag(headers)
+    return (
+        os.path.join(csv_dir, f'latest_responses_{tag}.csv'),
+        os.path.join(csv_dir, f'responses_{datetime.now().strftime("%Y%m%d")}_{tag}.csv')
+    )
+
+def test_responses_are_appended_under_one_header():
+    data_dir = tempfile.mkdtemp(prefix='quizbot-csv-')
+    bot = FormBot(sheets_helper=StubSheetsHelper(), data_dir=data_dir)
+    try:
+        schema = bot.schemas.current
+        first_question, second_question = schema[0], schema[1]
+        rows = [
+            schema.build_row({
+                'username': 'first', 'user_id': '1',
+                first_question.id: first_question.options[0], second_question.id: second_question.options[1]
+            }, '2025-02-14 12:00:00'),
+            # Commas and quotes in an answer must survive the round trip
+            schema.build_row({
+                'username': 'second', 'user_id': '2',
+                first_question.id: 'Answer, with "quotes"'
+            }, '2025-02-14 12:05:00')
+        ]
+        for row in rows:
+            bot.save_to_local_csv(row, schema.header_row)
+    finally:
+        bot.shutdown()
+
+    for path in csv_paths(data_dir, schema.header_row):
+        content = read_csv(path)
+        assert content[0] == list(schema.header_row)
+        assert content[1:] == [[str(value) for value in row] for row in rows]
+
+def test_changed_header_starts_new_files():
+    data_dir = tempfile.mkdtemp(prefix='quizbot-csv-')
+    bot = FormBot(sheets_helper=StubSheetsHelper(), data_dir=data_dir)
+    old_headers = ('Username', 'User ID', 'Timestamp', 'Q1')
+    # After a questions.json reload added a column
+    new_headers = old_headers + ('Q2',)
+    try:
+        bot.save_to_local_csv(['first', '1', '2025-02-14 12:00:00', 'a'], old_headers)
+        bot.save_to_local_csv(['second', '2', '2025-02-14 12:05:00', 'b', 'c'], new_headers)
+    finally:
+        bot.shutdown()
+
+    for headers, row in ((old_headers, ['first', '1', '2025-02-14 12:00:00', 'a']),
+                         (new_headers, ['second', '2', '2025-02-14 12:05:00', 'b', 'c'])):
+        for path in csv_paths(data_dir, headers):
+            assert read_csv(path) == [list(headers), row]
+
+if __name__ == "__main__":
+    test_responses_are_appended_under_one_header()
+    test_changed_header_starts_new_files()
+    logger.info("✓ Local CSV tests passed")
@@ -0,0 +1,67 @@
+import os
+import logging
+import tempfile
+import threading
+from utils.logging_setup import configure_logging, stop_logging, DebugSampler
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def make_record(level, lineno=1):
+    return logging.LogRecord('test', level, __file__, lineno, 'message %d', (1,), None)
+
+def test_debug_records_are_sampled_per_call_site():
+    sampler = DebugSampler(every=10)
+    kept = [sampler.filter(make_record(logging.DEBUG)) for _ in range(100)]
+    assert sum(kept) == 10
+    assert sampler.filter(make_record(logging.DEBUG, lineno=2))
+    assert all(sampler.filter(make_record(logging.INFO)) for _ in range(5))
+
+def test_records_are_written_by_the_listener_thread():
+    log_file = os.path.join(tempfile.mkdtemp(), 'bot.log')
+    threads = []
+
+    class Recording(logging.Handler):
+        def emit(self, record):
+            threads.append(threading.current_thread().name)
+
+    previous_level = logging.getLogger().level
+    listener = configure_logging(
+        level='DEBUG', log_file=log_file, console_stream=open(os.devnull, 'w'), queued=True, debug_sample=5
+    )
+    try:
+        listener.handlers += (Recording(),)
+        sample_logger = logging.getLogger('sample')
+        for i in range(20):
+            sample_logger.debug("event %d", i)
+        sample_logger.info("done after %d events", 20)
+    finally:
+        stop_logging()
+        logging.getLogger().setLevel(previous_level)
+
+    with open(log_file, encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    assert [line.rsplit(' - ', 1)[1] for line in lines] == [
+        'event 0', 'event 5', 'event 10', 'event 15', 'done after 20 events'
+    ]
+    assert threads and threading.current_thread().name not in threads
+
+def test_reconfiguring_replaces_handlers():
+    root = logging.getLogger()
+    before = list(root.handlers)
+    previous_level = root.level
+    try:
+        configure_logging(level='INFO', log_file='', console_stream=open(os.devnull, 'w'), queued=False)
+        configure_logging(level='INFO', log_file='', console_stream=open(os.devnull, 'w'), queued=True)
+        assert len(root.handlers) == len(before) + 1
+    finally:
+        stop_logging()
+        root.setLevel(previous_level)
+    assert root.handlers == before
+
+if __name__ == "__main__":
+    test_debug_records_are_sampled_per_call_site()
+    test_records_are_written_by_the_listener_thread()
+    test_reconfiguring_replaces_handlers()
+    logger.info("✓ Logging setup tests passed")
@@ -0,0 +1,212 @@
+import os
+import json
+import logging
+import tempfile
+from dataclasses import FrozenInstanceError
+from utils.quiz_schema import QuizSchema, QuizSchemaRegistry, USER_COLUMNS
+from utils.keyboards import encode_callback, decode_callback, DONE_ACTION, BACK_ACTION
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+QUESTIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'questions.json')
+
+def test_schema_compiles_questions_file():
+    schema = QuizSchema.from_file(QUESTIONS_PATH)
+    assert len(schema) > 0
+    assert schema.header_row[:len(USER_COLUMNS)] == USER_COLUMNS
+    assert schema.header_row[len(USER_COLUMNS):] == tuple(q.text for q in schema)
+    for index, q in enumerate(schema):
+        assert schema.index_by_id[q.id] == index
+        assert schema.get(q.id) is q
+
+def test_questions_are_immutable():
+    schema = QuizSchema.from_file(QUESTIONS_PATH)
+    try:
+        schema[0].options = ()
+    except FrozenInstanceError:
+        pass
+    else:
+        raise AssertionError("Question records should be frozen")
+
+def test_dynamic_state_options():
+    schema = QuizSchema.from_file(QUESTIONS_PATH)
+    state = schema.get('state')
+    region_states = state.options_for_region('West')
+    assert region_states == state.region_states['West']
+    assert set(region_states) <= schema.option_sets[state.index]
+    assert state.options_for_region(None) == state.options
+
+def keyboard_data(markup):
+    return [[button.callback_data for button in row] for row in markup.inline_keyboard]
+
+def test_keyboards_are_precompiled_and_shared():
+    schema = QuizSchema.from_file(QUESTIONS_PATH)
+    first = schema.keyboards.get(0)
+    assert first is schema.keyboards.get(0)
+    assert [[b.text for b in row] for row in first.inline_keyboard] == [[option] for option in schema[0].options]
+    assert keyboard_data(first) == [[f'v{schema.fingerprint}:q0:o{i}'] for i in range(len(schema[0].options))]
+
+    multi = next(q for q in schema if q.is_multi_select and q.index > 0)
+    rows = keyboard_data(schema.keyboards.get(multi.index))
+    assert rows[-2:] == [
+        [encode_callback(schema.fingerprint, multi.index, DONE_ACTION)],
+        [encode_callback(schema.fingerprint, multi.index, BACK_ACTION)]
+    ]
+
+    state = schema.get('state')
+    west = schema.keyboards.get(state.index, 'West')
+    assert west is schema.keyboards.get(state.index, 'West')
+    assert [row[0].text for row in west.inline_keyboard[:-1]] == list(state.region_states['West'])
+    # Unknown regions are built on demand rather than cached
+    unknown = schema.keyboards.get(state.index, 'Atlantis')
+    assert [row[0].text for row in unknown.inline_keyboard] == ['Other State', '⬅️ Back']
+
+def test_text_question_keyboards():
+    schema = QuizSchema.from_dict({'quiz': [
+        {'id': 'a', 'question': 'A?', 'type': 'text'},
+        {'id': 'b', 'question': 'B?', 'type': 'text'}
+    ]})
+    assert schema.keyboards.get(0) is None
+    assert keyboard_data(schema.keyboards.get(1)) == [[f'v{schema.fingerprint}:q1:back']]
+
+def test_callback_data_round_trip():
+    schema = QuizSchema.from_file(QUESTIONS_PATH, version=7)
+    state = schema.get('state')
+    for row in schema.keyboards.get(state.index, 'West').inline_keyboard:
+        button = row[0]
+        assert len(button.callback_data.encode()) <= 64
+        action, option = schema.keyboards.resolve(button.callback_data, state.index, 'West')
+        if action == BACK_ACTION:
+            assert option is None
+        else:
+            assert option == button.text
+    assert decode_callback(f'v{schema.fingerprint}:q5:o2') == (schema.fingerprint, 5, 2)
+    assert decode_callback('v7:q5:done') == ('7', 5, DONE_ACTION)
+    assert decode_callback('Healthcare Rights') is None
+
+def test_fingerprint_follows_content_not_version():
+    quiz = {'quiz': [{'id': 'a', 'question': 'A?', 'type': 'multiple_choice', 'options': ['x', 'y']}]}
+    first = QuizSchema.from_dict(quiz, version=1)
+    assert QuizSchema.from_dict(quiz, version=9).fingerprint == first.fingerprint
+    quiz['quiz'][0]['question'] = 'Reworded?'
+    assert QuizSchema.from_dict(quiz).fingerprint == first.fingerprint
+    quiz['quiz'][0]['options'] = ['y', 'x']
+    assert QuizSchema.from_dict(quiz).fingerprint != first.fingerprint
+
+def test_stale_and_legacy_callbacks():
+    schema = QuizSchema.from_file(QUESTIONS_PATH, version=2)
+    tag = schema.fingerprint
+    multi = next(q for q in schema if q.is_multi_select and q.index > 0)
+    resolve = schema.keyboards.resolve
+    # Another schema, a version number sent before fingerprints, another question, or an option out of range
+    assert resolve(encode_callback('0123456789ab', multi.index, 0), multi.index) is None
+    assert resolve(encode_callback(2, multi.index, 0), multi.index) is None
+    assert resolve(encode_callback(tag, multi.index - 1, 0), multi.index) is None
+    assert resolve(encode_callback(tag, multi.index, 99), multi.index) is None
+    assert resolve(encode_callback(tag, 0, BACK_ACTION), 0) is None
+    assert resolve(encode_callback(tag, multi.index, 0), multi.index) == (0, multi.options[0])
+    # Keyboards sent before the compact encoding
+    assert resolve(multi.options[1], multi.index) == (1, multi.options[1])
+    assert resolve('DONE_SELECTING', multi.index) == (DONE_ACTION, None)
+    assert resolve('GO_BACK', multi.index) == (BACK_ACTION, None)
+    assert resolve('GO_BACK', 0) is None
+
+def test_multi_select_masks():
+    schema = QuizSchema.from_dict({'quiz': [
+        {'id': 'a', 'question': 'A?', 'type': 'multiple_select', 'options': ['x', 'y', 'z']}
+    ]})
+    selections = schema.selections
+    mask = 0
+    for option_index in (2, 0, 1, 1):
+        mask ^= 1 << option_index
+    # Answers follow option order, not click order
+    assert selections.answer(0, mask) == 'x, z'
+    assert selections.render(0, mask).endswith('\n\nSelected: x, z')
+    assert selections.render(0, mask) is selections.render(0, mask)
+    assert 'Selected' not in selections.render(0, 0)
+    assert selections.mask_for(0, ['z', 'x', 'gone']) == mask
+    assert selections.mask_of(0, 'x, z') == mask
+
+def test_answer_masks_with_commas_in_options():
+    options = ['a, b', 'c'] + [f'o{i}' for i in range(10)]
+    schema = QuizSchema.from_dict({'quiz': [
+        {'id': 'a', 'question': 'A?', 'type': 'multiple_select', 'options': options[:2]},
+        {'id': 'b', 'question': 'B?', 'type': 'multiple_select', 'options': options}
+    ]})
+    selections = schema.selections
+    for index in (0, 1):
+        # Question 'b' has too many options for precomputed masks and is parsed instead
+        assert selections.mask_of(index, selections.answer(index, 0b11)) == 0b11
+        assert selections.mask_of(index, 'c') == 0b10
+        assert selections.mask_of(index, 'a') == 0
+
+def test_build_row_follows_question_order():
+    schema = QuizSchema.from_dict({'quiz': [
+        {'id': 'b', 'question': 'B?', 'type': 'text'},
+        {'id': 'a', 'question': 'A?', 'type': 'multiple_select', 'options': ['x', 'y']}
+    ]})
+    row = schema.build_row({'user_id': '1', 'a': ['x', 'y'], 'b': 'hi'}, 'now')
+    assert row == ['Unknown', 'Unknown', 'Unknown', '1', 'now', 'hi', 'x, y']
+
+def test_invalid_schema_is_rejected():
+    for data in [{}, {'quiz': [{'id': 'a', 'type': 'text'}]},
+                 {'quiz': [{'id': 'a', 'question': 'A?', 'type': 'multiple_choice'}]}]:
+        try:
+            QuizSchema.from_dict(data)
+        except ValueError:
+            continue
+        raise AssertionError(f"Schema should be rejected: {data}")
+
+def write_quiz(path, questions):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'quiz': questions}, f)
+    # Make sure the change is visible even on filesystems with coarse mtimes
+    os.utime(path, ns=(os.stat(path).st_mtime_ns + 1_000_000_000,) * 2)
+
+def test_registry_hot_reload_keeps_old_versions():
+    path = os.path.join(tempfile.mkdtemp(), 'questions.json')
+    write_quiz(path, [{'id': 'a', 'question': 'A?', 'type': 'text'}])
+    registry = QuizSchemaRegistry(path)
+    old = registry.current
+    assert registry.check_for_changes() is None
+
+    write_quiz(path, [{'id': 'a', 'question': 'A?', 'type': 'text'},
+                      {'id': 'b', 'question': 'B?', 'type': 'text'}])
+    new = registry.check_for_changes()
+    assert new is registry.current and new.version == old.version + 1
+    assert registry.get(old.fingerprint) is old
+    assert len(registry.get(old.fingerprint)) == 1
+    # Unknown fingerprints are reported, never answered with the current schema
+    assert registry.get('0123456789ab') is None
+    assert registry.get() is new
+
+def test_registry_rejects_invalid_reload():
+    path = os.path.join(tempfile.mkdtemp(), 'questions.json')
+    write_quiz(path, [{'id': 'a', 'question': 'A?', 'type': 'text'}])
+    registry = QuizSchemaRegistry(path)
+    old = registry.current
+
+    write_quiz(path, [{'id': 'a', 'type': 'text'}])
+    assert registry.check_for_changes() is None
+    assert registry.current is old
+    # A broken file is only reported once, not on every check
+    assert registry.check_for_changes() is None
+
+if __name__ == "__main__":
+    test_schema_compiles_questions_file()
+    test_questions_are_immutable()
+    test_dynamic_state_options()
+    test_keyboards_are_precompiled_and_shared()
+    test_text_question_keyboards()
+    test_callback_data_round_trip()
+    test_fingerprint_follows_content_not_version()
+    test_stale_and_legacy_callbacks()
+    test_multi_select_masks()
+    test_answer_masks_with_commas_in_options()
+    test_build_row_follows_question_order()
+    test_invalid_schema_is_rejected()
+    test_registry_hot_reload_keeps_old_versions()
+    test_registry_rejects_invalid_reload()
+    logger.info("✓ Quiz schema tests passed")
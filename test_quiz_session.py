@@ -0,0 +1,114 @@
+import os
+import json
+import logging
+from datetime import datetime
+from utils.quiz_schema import QuizSchema
+from utils.quiz_session import QuizSession
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+QUESTIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'questions.json')
+
+def test_session_is_slotted():
+    schema = QuizSchema.from_file(QUESTIONS_PATH)
+    session = QuizSession(schema)
+    assert not hasattr(session, '__dict__')
+    assert session.answers == [None] * len(schema)
+    assert session.schema is schema
+    assert isinstance(session.start_time, float)
+
+def test_answers_by_position_and_id():
+    schema = QuizSchema.from_file(QUESTIONS_PATH)
+    session = QuizSession(schema)
+    region = schema.index_by_id['region']
+    session.set_answer(region, 'West')
+    assert session.get(schema, 'region') == 'West'
+    assert session.get(schema, 'state') is None
+    assert session.get(schema, 'unknown', 'default') == 'default'
+    assert session.answers_dict(schema) == {'region': 'West'}
+
+def test_round_trip_through_json():
+    schema = QuizSchema.from_file(QUESTIONS_PATH)
+    session = QuizSession(schema, start_time=1739500000.0)
+    session.set_answer(0, schema[0].options[1])
+    session.current_question = 3
+    session.selected_mask = 0b101
+
+    restored = QuizSession.from_dict(json.loads(json.dumps(session.to_dict())), schema)
+    assert restored.to_dict() == session.to_dict()
+    # Option answers point at the schema's strings again rather than fresh copies
+    assert restored.answers[0] is schema[0].options[1]
+
+def test_legacy_dict_session_is_converted():
+    schema = QuizSchema.from_file(QUESTIONS_PATH)
+    beliefs = schema.index_by_id['beliefs']
+    started = datetime(2025, 2, 14, 12, 0, 0)
+    session = QuizSession.from_dict({
+        'current_question': beliefs,
+        'answers': {'username': 'someone', 'user_id': '1', 'age': '18-25', 'retired_question': 'x'},
+        'start_time': started.isoformat(),
+        'schema_version': schema.version,
+        'selected_options': [schema[beliefs].options[2], schema[beliefs].options[0]]
+    }, schema)
+    # Without a fingerprint positions cannot be trusted: answers are matched by ID
+    assert session.answers_dict(schema) == {'age': '18-25'}
+    assert session.current_question == schema.index_by_id['source']
+    assert session.selected_mask == 0
+    assert session.start_time == started.timestamp()
+
+def test_positional_session_without_fingerprint_starts_over():
+    schema = QuizSchema.from_file(QUESTIONS_PATH)
+    session = QuizSession.from_dict({
+        'current_question': 2,
+        'answers': [schema[0].options[0], schema[1].options[0], None],
+        'start_time': 1739500000.0,
+        'schema_version': 1,
+        'selected_mask': 1
+    }, schema)
+    assert session.answers == [None] * len(schema)
+    assert session.current_question == 0 and session.selected_mask == 0
+
+def test_session_is_remapped_onto_changed_questions():
+    old = QuizSchema.from_dict({'quiz': [
+        {'id': 'age', 'question': 'Age?', 'type': 'multiple_choice', 'options': ['young', 'old']},
+        {'id': 'colour', 'question': 'Colour?', 'type': 'multiple_choice', 'options': ['red', 'blue']},
+        {'id': 'pets', 'question': 'Pets?', 'type': 'multiple_select', 'options': ['cat', 'dog']},
+        {'id': 'name', 'question': 'Name?', 'type': 'text'}
+    ]})
+    session = QuizSession(old)
+    for question, answer in zip(old, ['old', 'red', 'cat, dog', 'Sam']):
+        session.set_answer(question.index, answer)
+    session.current_question = 3
+    stored = json.loads(json.dumps(session.to_dict()))
+    assert stored['answers'] == {'age': 'old', 'colour': 'red', 'pets': 'cat, dog', 'name': 'Sam'}
+
+    # Reordered, a question inserted and the colour options changed; the version number restarts at 1
+    new = QuizSchema.from_dict({'quiz': [
+        {'id': 'name', 'question': 'Name?', 'type': 'text'},
+        {'id': 'city', 'question': 'City?', 'type': 'text'},
+        {'id': 'pets', 'question': 'Pets?', 'type': 'multiple_select', 'options': ['dog', 'cat']},
+        {'id': 'age', 'question': 'Age?', 'type': 'multiple_choice', 'options': ['young', 'old']},
+        {'id': 'colour', 'question': 'Colour?', 'type': 'multiple_choice', 'options': ['green', 'blue']}
+    ]})
+    assert new.version == old.version and new.fingerprint != old.fingerprint
+    restored = QuizSession.from_dict(stored, new)
+    assert restored.schema is new
+    assert restored.answers_dict(new) == {'name': 'Sam', 'age': 'old'}
+    assert restored.current_question == new.index_by_id['city']
+
+    # The same questions loaded again, as after a restart, resume exactly where the session was
+    same = QuizSession.from_dict(stored, QuizSchema.from_dict({'quiz': [
+        {'id': q.id, 'question': q.text, 'type': q.type, 'options': list(q.options)} for q in old
+    ]}))
+    assert same.answers == session.answers and same.current_question == 3
+
+if __name__ == "__main__":
+    test_session_is_slotted()
+    test_answers_by_position_and_id()
+    test_round_trip_through_json()
+    test_legacy_dict_session_is_converted()
+    test_positional_session_without_fingerprint_starts_over()
+    test_session_is_remapped_onto_changed_questions()
+    logger.info("✓ Quiz session tests passed")
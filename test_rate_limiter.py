@@ -0,0 +1,143 @@
+import time
+import logging
+import threading
+from telegram.error import RetryAfter
+from utils.metrics import REGISTRY
+from utils.rate_limiter import (
+    OutboundScheduler, RateLimitedMixin, priority, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW, PRIORITY_NAMES
+)
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def recorder():
+    calls = []
+    lock = threading.Lock()
+
+    def call(name):
+        with lock:
+            calls.append(name)
+        return name
+    return calls, call
+
+def test_higher_priority_calls_go_first():
+    # One call every 50 ms, no bursts
+    scheduler = OutboundScheduler(global_rate=20, global_burst=1, chat_rate=100, chat_burst=100)
+    calls, call = recorder()
+    # Uses up the only token, so the rest queue up behind it
+    scheduler.submit(1, PRIORITY_NORMAL, call, 'first').result(timeout=5)
+    futures = [
+        scheduler.submit(2, PRIORITY_LOW, call, 'completion'),
+        scheduler.submit(3, PRIORITY_NORMAL, call, 'question'),
+        scheduler.submit(None, PRIORITY_HIGH, call, 'callback answer')
+    ]
+    for future in futures:
+        future.result(timeout=5)
+    scheduler.stop()
+    assert calls == ['first', 'callback answer', 'question', 'completion']
+    stats = scheduler.get_stats()
+    assert stats['sent'] == 4
+    assert stats['wait_max_low'] >= stats['wait_max_high']
+
+def test_throttled_chat_does_not_block_others():
+    scheduler = OutboundScheduler(global_rate=1000, chat_rate=5, chat_burst=1)
+    calls, call = recorder()
+    futures = [
+        scheduler.submit(1, PRIORITY_NORMAL, call, 'a1'),
+        scheduler.submit(1, PRIORITY_NORMAL, call, 'a2'),
+        scheduler.submit(2, PRIORITY_NORMAL, call, 'b1')
+    ]
+    for future in futures:
+        future.result(timeout=5)
+    scheduler.stop()
+    assert calls.index('b1') < calls.index('a2')
+    assert scheduler.stats['throttled'] >= 1
+
+def test_callback_answers_do_not_use_the_global_limit():
+    # One message a second
+    scheduler = OutboundScheduler(global_rate=1, global_burst=1, chat_rate=100, chat_burst=100)
+    calls, call = recorder()
+    scheduler.submit(1, PRIORITY_NORMAL, call, 'first').result(timeout=5)
+    waiting = scheduler.submit(2, PRIORITY_NORMAL, call, 'second')
+    answers = [scheduler.submit_answer(call, f'answer {n}') for n in range(3)]
+    for future in answers:
+        future.result(timeout=0.5)
+    assert calls == ['first', 'answer 0', 'answer 1', 'answer 2']
+    assert not waiting.done()
+    scheduler.stop()
+
+def test_chat_calls_are_sent_in_order():
+    # Low priority first, then high priority calls for the same chat
+    scheduler = OutboundScheduler(global_rate=1000, chat_rate=1000, chat_burst=10)
+    calls, call = recorder()
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow(name):
+        started.set()
+        release.wait(5)
+        return call(name)
+
+    futures = [scheduler.submit(1, PRIORITY_LOW, slow, 'reply')]
+    started.wait(5)
+    futures += [scheduler.submit(1, PRIORITY_HIGH, call, f'edit {n}') for n in range(3)]
+    futures.append(scheduler.submit(2, PRIORITY_NORMAL, call, 'other chat'))
+    futures[-1].result(timeout=5)
+    assert calls == ['other chat']
+    # The chat's later calls wait for its first one, then keep their order
+    assert scheduler.pending(1) is futures[3]
+    assert scheduler.depth() == 3
+    release.set()
+    futures[3].result(timeout=5)
+    scheduler.stop()
+    assert calls == ['other chat', 'reply', 'edit 0', 'edit 1', 'edit 2']
+    assert scheduler.pending(1) is None
+
+def test_retry_after_pauses_and_retries():
+    scheduler = OutboundScheduler(global_rate=1000, chat_rate=1000, chat_burst=10)
+    attempts = []
+
+    def flaky():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise RetryAfter(0.2)
+        return 'ok'
+
+    assert scheduler.call(7, flaky) == 'ok'
+    scheduler.stop()
+    assert attempts[1] - attempts[0] >= 0.2
+    assert scheduler.stats['retry_after'] == 1
+
+def test_mixin_routes_calls_with_priorities():
+    class FakeBot:
+        def send_message(self, chat_id, text):
+            return ('send', chat_id, text)
+
+        def answer_callback_query(self, callback_query_id):
+            return ('answer', callback_query_id)
+
+    class LimitedBot(RateLimitedMixin, FakeBot):
+        pass
+
+    bot = LimitedBot()
+    bot.scheduler = OutboundScheduler()
+    # Calls return a Future at once instead of waiting for the result
+    assert bot.send_message(chat_id=5, text='hi').result(timeout=5) == ('send', 5, 'hi')
+    with priority(PRIORITY_LOW):
+        assert bot.send_message(5, 'bye').result(timeout=5) == ('send', 5, 'bye')
+    assert bot.answer_callback_query('q1').result(timeout=5) == ('answer', 'q1')
+    bot.scheduler.stop()
+    assert [count for count, _, _ in bot.scheduler.waits] == [1, 1, 1]
+    exported = REGISTRY.render()
+    for name in PRIORITY_NAMES:
+        assert f'quizbot_outbound_wait_seconds_count{{priority="{name}"}}' in exported
+
+if __name__ == "__main__":
+    test_higher_priority_calls_go_first()
+    test_throttled_chat_does_not_block_others()
+    test_callback_answers_do_not_use_the_global_limit()
+    test_chat_calls_are_sent_in_order()
+    test_retry_after_pauses_and_retries()
+    test_mixin_routes_calls_with_priorities()
+    logger.info("✓ Rate limiter tests passed")
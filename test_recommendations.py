@@ -0,0 +1,78 @@
+import os
+import logging
+from utils.quiz_schema import QuizSchema
+from utils.quiz_session import QuizSession
+from utils.recommendations import RecommendationIndex, Section
+from utils.topic_directory import TopicDirectory
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+QUESTIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'questions.json')
+TOPICS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'forum_topics_with_links.csv')
+
+def make_session(schema, **answers):
+    session = QuizSession(schema)
+    for question_id, answer in answers.items():
+        index = schema.index_by_id[question_id]
+        if isinstance(answer, list):
+            answer = schema.selections.answer(index, schema.selections.mask_for(index, answer))
+        session.set_answer(index, answer)
+    return session
+
+def test_rule_table_matches_questions():
+    schema = QuizSchema.from_file(QUESTIONS_PATH)
+    assert RecommendationIndex().unmatched_rules(schema) == []
+
+def test_every_selected_option_is_matched():
+    schema = QuizSchema.from_file(QUESTIONS_PATH)
+    index = RecommendationIndex(topics=TopicDirectory(TOPICS_PATH))
+    session = make_session(
+        schema,
+        beliefs=["Economic Justice", "Healthcare Rights"],
+        skills=["Social Media", "Writing/Content", "Tech/IT"],
+        leadership="No, just want to support"
+    )
+    text = index.completion_text(session, schema)
+    # Multi-select answers are stored joined; each option still counts
+    assert "Healthcare Advocacy" in text
+    assert "Economic Justice:" in text
+    assert "Tech Team" in text
+    assert text.count("Content Creation") == 1
+    assert "Leadership application channels" not in text
+    assert "Secure communication" not in text
+    # Topic channels follow the rule table order, after the general channels
+    assert text.index("Open Discussion") < text.index("Healthcare Advocacy") < text.index("Economic Justice:")
+
+def test_single_choice_sections_and_state_link():
+    schema = QuizSchema.from_file(QUESTIONS_PATH)
+    index = RecommendationIndex(topics=TopicDirectory(TOPICS_PATH))
+    session = make_session(
+        schema, region="Southwest", state="Texas", leadership="Yes, I'm ready to lead", encrypted_communication="Yes"
+    )
+    text = index.completion_text(session, schema)
+    assert "\n• Your local state group: https://t.me/c/2399831251/69" in text
+    assert "Based on your interests" not in text
+    assert "\n\nLeadership application channels:\n• General Leadership: https://t.me/c/2399831251/13132" in text
+    assert "\n• Public Announcements: https://t.me/c/2399831251/465" in text
+    assert text.endswith("\n\nSecure communication: keybase://team-page/quiz_team")
+
+    text = index.completion_text(make_session(schema, region="West", state="Other State"), schema)
+    assert "Your region (West) resources" in text
+
+def test_index_scales_with_selected_options():
+    schema = QuizSchema.from_file(QUESTIONS_PATH)
+    beliefs = schema.get('beliefs').options
+    rules = [('beliefs', beliefs[i % len(beliefs)], 'topics', f"Topic {i}", f"https://t.me/c/1/{i}") for i in range(600)]
+    index = RecommendationIndex(rules, sections=(Section('topics', "\n\nTopics:"),))
+    assert len(index) == 600
+    channels = index.channels_for(make_session(schema, beliefs=[beliefs[0]]), schema)
+    assert channels == list(range(0, 600, len(beliefs)))
+
+if __name__ == "__main__":
+    test_rule_table_matches_questions()
+    test_every_selected_option_is_matched()
+    test_single_choice_sections_and_state_link()
+    test_index_scales_with_selected_options()
+    logger.info("✓ Recommendation tests passed")
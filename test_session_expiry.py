@@ -0,0 +1,82 @@
+import os
+import logging
+import tempfile
+from types import SimpleNamespace
+from collections import defaultdict
+from utils.session_expiry import SessionExpiry
+from utils.session_store import SqliteSessionPersistence
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def make_dispatcher(persistence=None):
+    return SimpleNamespace(user_data=defaultdict(dict), persistence=persistence)
+
+def start_session(expiry, dispatcher, user_id):
+    expiry.touch(user_id)
+    dispatcher.user_data[user_id]['form_data'] = {'current_question': 0}
+
+def test_idle_sessions_expire():
+    clock = FakeClock()
+    dispatcher = make_dispatcher()
+    expiry = SessionExpiry(ttl=60, max_sessions=100, timer=clock)
+    expiry.attach(dispatcher)
+    start_session(expiry, dispatcher, 1)
+    clock.now += 30
+    start_session(expiry, dispatcher, 2)
+    clock.now += 40
+    # User 1 has been idle for 70s, user 2 for 40s
+    assert expiry.sweep() == 1
+    assert 1 not in dispatcher.user_data
+    assert 2 in dispatcher.user_data
+    # Activity resets the idle time
+    expiry.touch(2)
+    clock.now += 59
+    assert expiry.sweep() == 0
+    assert expiry.stats['expired'] == 1
+    assert expiry.stats['sweeps'] == 2
+
+def test_least_recently_active_is_evicted_over_the_cap():
+    clock = FakeClock()
+    dispatcher = make_dispatcher()
+    expiry = SessionExpiry(ttl=3600, max_sessions=3, timer=clock)
+    expiry.attach(dispatcher)
+    for user_id in (1, 2, 3):
+        start_session(expiry, dispatcher, user_id)
+        clock.now += 1
+    expiry.touch(1)
+    start_session(expiry, dispatcher, 4)
+    assert set(dispatcher.user_data) == {1, 3, 4}
+    assert len(expiry) == 3
+    assert expiry.stats['evicted'] == 1
+
+def test_restored_and_stored_sessions_are_dropped():
+    clock = FakeClock()
+    db_path = os.path.join(tempfile.mkdtemp(), 'sessions.db')
+    store = SqliteSessionPersistence(db_path, flush_interval=60)
+    store.update_user_data(7, {'form_data': {'current_question': 2}})
+    store.flush()
+
+    dispatcher = make_dispatcher(store)
+    dispatcher.user_data.update(store.get_user_data())
+    expiry = SessionExpiry(ttl=60, timer=clock)
+    expiry.attach(dispatcher)
+    assert len(expiry) == 1
+    clock.now += 61
+    assert expiry.sweep() == 1
+    store.flush()
+    assert 7 not in SqliteSessionPersistence(db_path).get_user_data()
+
+if __name__ == "__main__":
+    test_idle_sessions_expire()
+    test_least_recently_active_is_evicted_over_the_cap()
+    test_restored_and_stored_sessions_are_dropped()
+    logger.info("✓ Session expiry tests passed")
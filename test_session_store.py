@@ -0,0 +1,83 @@
+import os
+import warnings
+import logging
+import tempfile
+from utils.session_store import SqliteSessionPersistence
+from utils.quiz_schema import QuizSchema
+from utils.quiz_session import QuizSession
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+QUESTIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'questions.json')
+
+def make_db_path():
+    return os.path.join(tempfile.mkdtemp(), 'sessions.db')
+
+def test_sessions_survive_restart():
+    db_path = make_db_path()
+    store = SqliteSessionPersistence(db_path, flush_interval=60)
+    store.update_user_data(1, {'form_data': {'current_question': 3, 'answers': {'age': '18-25'}}})
+    store.update_user_data(2, {'form_data': {'current_question': 1, 'answers': {}}})
+    store.flush()
+
+    restored = SqliteSessionPersistence(db_path).get_user_data()
+    assert restored[1]['form_data']['current_question'] == 3
+    assert restored[1]['form_data']['answers'] == {'age': '18-25'}
+    assert restored[2]['form_data']['current_question'] == 1
+
+def test_burst_of_updates_is_coalesced():
+    store = SqliteSessionPersistence(make_db_path(), flush_interval=60)
+    for i in range(50):
+        store.update_user_data(1, {'form_data': {'selected_options': [str(i)]}})
+    store.flush()
+    assert store.stats['updates'] == 50
+    assert store.stats['commits'] == 1
+    assert store.get_user_data()[1]['form_data']['selected_options'] == ['49']
+
+def test_cleared_session_is_deleted():
+    db_path = make_db_path()
+    store = SqliteSessionPersistence(db_path, flush_interval=60)
+    store.update_user_data(1, {'form_data': {'current_question': 3}})
+    store.flush()
+    store = SqliteSessionPersistence(db_path, flush_interval=60)
+    store.update_user_data(1, {})
+    store.flush()
+    assert 1 not in SqliteSessionPersistence(db_path).get_user_data()
+
+def test_quiz_sessions_are_stored_as_dicts():
+    schema = QuizSchema.from_file(QUESTIONS_PATH)
+    session = QuizSession(schema)
+    session.set_answer(0, schema[0].options[0])
+    session.current_question = 1
+    db_path = make_db_path()
+    store = SqliteSessionPersistence(db_path, flush_interval=60)
+    store.update_user_data(1, {'form_data': session})
+    store.flush()
+
+    restored = SqliteSessionPersistence(db_path).get_user_data()[1]['form_data']
+    assert restored == session.to_dict()
+    assert QuizSession.from_dict(restored, schema).to_dict() == session.to_dict()
+
+def test_sessions_are_snapshotted_without_walking_the_schema():
+    schema = QuizSchema.from_file(QUESTIONS_PATH)
+    session = QuizSession(schema)
+    session.set_answer(0, schema[0].options[0])
+    store = SqliteSessionPersistence(make_db_path(), flush_interval=60)
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        snapshot = store.replace_bot({'form_data': session, 'history': [1, 2]})
+    assert snapshot == {'form_data': session.to_dict(), 'history': [1, 2]}
+    # Later changes to the live session do not leak into the queued copy
+    session.set_answer(1, schema[1].options[0])
+    assert snapshot['form_data']['answers'] == {schema[0].id: schema[0].options[0]}
+    store.flush()
+
+if __name__ == "__main__":
+    test_sessions_survive_restart()
+    test_quiz_sessions_are_stored_as_dicts()
+    test_burst_of_updates_is_coalesced()
+    test_cleared_session_is_deleted()
+    test_sessions_are_snapshotted_without_walking_the_schema()
+    logger.info("✓ Session store tests passed")
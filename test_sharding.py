@@ -0,0 +1,78 @@
+import os
+import logging
+import threading
+from telegram import Update
+from utils.sharding import ShardRouter
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def echo_worker(index, update_queue, result_queue, tag):
+    """Sends back (worker index, user id) for every routed update."""
+    while True:
+        data = update_queue.get()
+        if data is None:
+            return
+        if data['message']['text'] == 'crash':
+            os._exit(1)
+        user_id = data['message']['from']['id']
+        result_queue.put(([tag, index, user_id], ['Worker', 'Index', 'User ID']))
+
+def make_update(update_id, user_id, text='hello'):
+    return Update.de_json({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': 1739500000,
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'Test'},
+            'text': text
+        }
+    }, None)
+
+def test_updates_are_routed_by_user_and_collected():
+    rows = []
+    lock = threading.Lock()
+
+    def sink(row_data, headers):
+        with lock:
+            rows.append(row_data)
+
+    router = ShardRouter(3, echo_worker, worker_args=('echo',), response_sink=sink)
+    router.start()
+    for update_id, user_id in enumerate([10, 11, 12, 10, 13, 11, 10], start=1):
+        router.submit(make_update(update_id, user_id))
+    router.stop()
+
+    assert len(rows) == 7
+    for tag, index, user_id in rows:
+        assert tag == 'echo'
+        # Every update from a user lands on the same worker
+        assert index == user_id % 3
+    assert router.stats['routed'] == [1, 4, 2]
+
+def test_dead_worker_is_restarted():
+    rows = []
+
+    def sink(row_data, headers):
+        rows.append(row_data)
+
+    router = ShardRouter(2, echo_worker, worker_args=('echo',), response_sink=sink, max_pending=1)
+    router.start()
+    router.submit(make_update(1, 11, text='crash'))
+    router.processes[1].join(30)
+    assert router.processes[1].exitcode == 1
+    # The dead worker's queue would fill after one update and block here
+    for update_id in (2, 3):
+        router.submit(make_update(update_id, 11))
+    assert router.submit_nowait(make_update(4, 10))
+    router.stop()
+
+    assert sorted(rows) == [['echo', 0, 10], ['echo', 1, 11], ['echo', 1, 11]]
+    assert router.stats['restarts'] == 1
+
+if __name__ == "__main__":
+    test_updates_are_routed_by_user_and_collected()
+    test_dead_worker_is_restarted()
+    logger.info("✓ Sharding tests passed")
@@ -0,0 +1,118 @@
+import os
+import time
+import logging
+import tempfile
+from sheets_helper import SheetsWriteQueue, row_key
+from utils.sheets_outbox import SheetsOutbox
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class FakeSheetsHelper:
+    """Records append calls instead of talking to Google."""
+
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+        self.sheet_rows = []
+
+    def append_rows(self, rows):
+        self.calls.append(list(rows))
+        if not self.fail:
+            self.sheet_rows.extend(rows)
+        return not self.fail
+
+    def get_existing_keys(self):
+        return {row_key(row) for row in self.sheet_rows}
+
+def make_row(user_id, timestamp="2025-02-14 15:34:40"):
+    return ["user", "First", "Last", user_id, timestamp, "answer"]
+
+def make_outbox():
+    return SheetsOutbox(os.path.join(tempfile.mkdtemp(), 'outbox.db'))
+
+def test_batches_by_size():
+    helper = FakeSheetsHelper()
+    queue = SheetsWriteQueue(helper, max_batch_size=5, flush_interval=60)
+    for i in range(12):
+        queue.enqueue(make_row(str(i)))
+    queue.flush()
+    assert [len(c) for c in helper.calls] == [5, 5, 2]
+    assert queue.get_stats()['flushed_rows'] == 12
+
+def test_background_flush_on_interval():
+    helper = FakeSheetsHelper()
+    queue = SheetsWriteQueue(helper, max_batch_size=100, flush_interval=0.1)
+    queue.start()
+    try:
+        queue.enqueue(make_row("1"))
+        queue.enqueue(make_row("2"))
+        deadline = time.monotonic() + 2
+        while not helper.calls and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert helper.calls == [[make_row("1"), make_row("2")]]
+    finally:
+        queue.stop()
+
+def test_stop_flushes_pending_rows():
+    helper = FakeSheetsHelper()
+    queue = SheetsWriteQueue(helper, max_batch_size=100, flush_interval=60)
+    queue.start()
+    queue.enqueue(make_row("1"))
+    queue.stop()
+    assert helper.calls == [[make_row("1")]]
+    assert queue.depth() == 0
+
+def test_failed_batch_is_counted():
+    helper = FakeSheetsHelper(fail=True)
+    queue = SheetsWriteQueue(helper, max_batch_size=10, flush_interval=60)
+    queue.enqueue(make_row("1"))
+    assert not queue.flush()
+    assert queue.get_stats()['failed_rows'] == 1
+
+def test_outbox_keeps_failed_rows_until_replayed():
+    helper = FakeSheetsHelper(fail=True)
+    outbox = make_outbox()
+    queue = SheetsWriteQueue(helper, max_batch_size=10, flush_interval=60, outbox=outbox)
+    queue.enqueue(make_row("1"))
+    queue.enqueue(make_row("2"))
+    assert not queue.flush()
+    assert outbox.count() == 2
+
+    helper.fail = False
+    assert queue.replay_outbox()
+    assert outbox.count() == 0
+    assert [row[3] for row in helper.sheet_rows] == ["1", "2"]
+
+def test_replay_skips_rows_already_in_sheet():
+    helper = FakeSheetsHelper()
+    outbox = make_outbox()
+    # Simulate a crash after the sheet accepted the row but before the outbox was cleared
+    outbox.add(row_key(make_row("1")), make_row("1"))
+    outbox.add(row_key(make_row("2")), make_row("2"))
+    helper.sheet_rows.append(make_row("1"))
+
+    queue = SheetsWriteQueue(helper, max_batch_size=10, flush_interval=60, outbox=outbox)
+    assert queue.replay_outbox()
+    assert [row[3] for row in helper.sheet_rows] == ["1", "2"]
+    assert queue.get_stats()['duplicates_skipped'] == 1
+
+def test_outbox_ignores_duplicate_keys():
+    helper = FakeSheetsHelper()
+    outbox = make_outbox()
+    queue = SheetsWriteQueue(helper, max_batch_size=10, flush_interval=60, outbox=outbox)
+    queue.enqueue(make_row("1"))
+    queue.enqueue(make_row("1"))
+    queue.flush()
+    assert len(helper.sheet_rows) == 1
+
+if __name__ == "__main__":
+    test_batches_by_size()
+    test_background_flush_on_interval()
+    test_stop_flushes_pending_rows()
+    test_failed_batch_is_counted()
+    test_outbox_keeps_failed_rows_until_replayed()
+    test_replay_skips_rows_already_in_sheet()
+    test_outbox_ignores_duplicate_keys()
+    logger.info("✓ Sheets write queue tests passed")
@@ -0,0 +1,124 @@
+import json
+import time
+import logging
+import datetime
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import httplib2
+from google.auth import credentials
+from utils.sheets_transport import SheetsTransport
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def utcnow():
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+class FakeCredentials(credentials.Credentials):
+    """Issues numbered tokens valid for ``lifetime`` seconds."""
+
+    def __init__(self, lifetime=3600):
+        super().__init__()
+        self.lifetime = lifetime
+        self.refreshes = 0
+
+    def refresh(self, request):
+        time.sleep(0.01)
+        self.refreshes += 1
+        self.token = f'token-{self.refreshes}'
+        self.expiry = utcnow() + datetime.timedelta(seconds=self.lifetime)
+
+class FakeRequest:
+    """Stands in for a googleapiclient HttpRequest."""
+
+    def __init__(self, url, in_use):
+        self.url = url
+        self.in_use = in_use
+
+    def execute(self, http, num_retries=0):
+        with self.in_use['lock']:
+            assert id(http) not in self.in_use['clients'], "client shared between threads"
+            self.in_use['clients'].add(id(http))
+        try:
+            response, content = http.request(self.url)
+            return json.loads(content)
+        finally:
+            with self.in_use['lock']:
+                self.in_use['clients'].discard(id(http))
+
+def start_server():
+    connections = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def setup(self):
+            super().setup()
+            connections.append(self.client_address)
+
+        def do_GET(self):
+            time.sleep(0.002)
+            body = json.dumps({'authorization': self.headers.get('Authorization')}).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, connections
+
+def test_concurrent_requests_share_pooled_keep_alive_connections():
+    server, connections = start_server()
+    url = f'http://127.0.0.1:{server.server_address[1]}/values'
+    creds = FakeCredentials()
+    transport = SheetsTransport(creds, pool_size=3, http_factory=lambda: httplib2.Http(timeout=5))
+    in_use = {'lock': threading.Lock(), 'clients': set()}
+    results = []
+
+    def writer():
+        for _ in range(10):
+            results.append(transport.execute(FakeRequest(url, in_use)))
+
+    threads = [threading.Thread(target=writer) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    transport.close()
+    server.shutdown()
+
+    stats = transport.get_stats()
+    assert len(results) == 80 and stats['requests'] == 80
+    assert all(result['authorization'] == 'Bearer token-1' for result in results)
+    assert creds.refreshes == 1 and stats['token_refreshes'] == 1
+    assert stats['clients'] == 0 and stats['waits'] > 0
+    assert stats['connections_opened'] == len(connections) <= 3
+    assert stats['connections_reused'] == 80 - stats['connections_opened']
+
+def test_token_is_refreshed_ahead_of_expiry():
+    server, connections = start_server()
+    url = f'http://127.0.0.1:{server.server_address[1]}/values'
+    creds = FakeCredentials(lifetime=3600)
+    transport = SheetsTransport(creds, pool_size=1, refresh_margin=300)
+    in_use = {'lock': threading.Lock(), 'clients': set()}
+    assert transport.execute(FakeRequest(url, in_use))['authorization'] == 'Bearer token-1'
+    # Still valid, but inside the refresh margin
+    creds.expiry = utcnow() + datetime.timedelta(seconds=120)
+    assert transport.execute(FakeRequest(url, in_use))['authorization'] == 'Bearer token-2'
+    assert transport.execute(FakeRequest(url, in_use))['authorization'] == 'Bearer token-2'
+    transport.close()
+    server.shutdown()
+    assert transport.get_stats()['token_refreshes'] == 2
+    assert len(connections) == 1
+
+if __name__ == "__main__":
+    test_concurrent_requests_share_pooled_keep_alive_connections()
+    test_token_is_refreshed_ahead_of_expiry()
+    logger.info("✓ Sheets transport tests passed")
@@ -0,0 +1,53 @@
+import os
+import sys
+import logging
+import subprocess
+from sheets_helper import SheetsHelper, discovery_document
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+def test_importing_main_has_no_side_effects():
+    history = os.path.join(ROOT, '.history')
+    before = sorted(os.listdir(history)) if os.path.isdir(history) else None
+    script = (
+        "import logging, sys, main\n"
+        "print(len(logging.getLogger().handlers), 'googleapiclient' in sys.modules)"
+    )
+    output = subprocess.run(
+        [sys.executable, '-c', script], cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    assert output.split() == ['0', 'False']
+    after = sorted(os.listdir(history)) if os.path.isdir(history) else None
+    assert after == before
+
+def test_sheets_client_is_created_on_first_use():
+    previous = os.environ.get('SPREADSHEET_ID')
+    os.environ['SPREADSHEET_ID'] = 'test-spreadsheet'
+    try:
+        helper = SheetsHelper(credentials_file=os.path.join(ROOT, 'missing_service_account.json'))
+    finally:
+        if previous is None:
+            del os.environ['SPREADSHEET_ID']
+        else:
+            os.environ['SPREADSHEET_ID'] = previous
+    try:
+        helper.sheet
+    except FileNotFoundError:
+        pass
+    else:
+        raise AssertionError("Expected the missing credentials file to be reported on first use")
+
+def test_discovery_document_is_bundled_and_parsed_once():
+    document = discovery_document()
+    assert document is discovery_document()
+    assert 'spreadsheets' in document['resources']
+
+if __name__ == "__main__":
+    test_importing_main_has_no_side_effects()
+    test_sheets_client_is_created_on_first_use()
+    test_discovery_document_is_bundled_and_parsed_once()
+    logger.info("✓ Startup tests passed")
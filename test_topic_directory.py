@@ -0,0 +1,63 @@
+import os
+import csv
+import time
+import logging
+import tempfile
+from utils.topic_directory import TopicDirectory, normalize_title
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TOPICS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'forum_topics_with_links.csv')
+
+def write_topics(path, rows):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['topic_id', 'title', 'created_date', 'top_message', 'closed', 'pinned', 'link'])
+        for topic_id, title, closed, pinned in rows:
+            writer.writerow([topic_id, title, '2025-01-20 00:00:00', 1, closed, pinned, f'https://t.me/c/1/{topic_id}'])
+
+def test_topics_file_is_indexed():
+    topics = TopicDirectory(TOPICS_PATH)
+    assert topics.get(289114).title.startswith("Veterans, educator")
+    assert topics.find("Open Discussion").topic_id == 8684
+    assert topics.find("new JERSEY").topic_id == 57
+    # Titles with an aside in parentheses still count as the state
+    assert topics.state_links['Connecticut'] == 'https://t.me/c/2399831251/32'
+    assert topics.state_links['New Mexico'] == 'https://t.me/c/2399831251/58'
+    assert 'Dc' not in topics.state_links
+    # Closed announcement topics stay; closed archived ones are dropped
+    assert 465 in topics
+    assert 2071 not in topics
+    assert [topic.topic_id for topic in topics.pinned][:3] == [227321, 465, 202409]
+
+def test_normalize_title():
+    assert normalize_title("Connecticut (why so hard to spell?)") == "connecticut"
+    assert normalize_title("  New   york ") == "new york"
+
+def test_reload_on_change():
+    path = os.path.join(tempfile.mkdtemp(), 'topics.csv')
+    write_topics(path, [(69, 'Texas', False, False), (5, 'Old', True, False)])
+    topics = TopicDirectory(path)
+    assert len(topics) == 1
+    assert topics.check_for_changes() is False
+
+    time.sleep(0.01)
+    write_topics(path, [(69, 'Texas', False, False), (70, 'Utah', False, False), (71, 'Vermont', True, True)])
+    assert topics.check_for_changes() is True
+    assert set(topics.state_links) == {'Texas', 'Utah', 'Vermont'}
+    assert TopicDirectory(path, include_closed=True).get(71).closed
+
+def test_missing_file_leaves_directory_empty():
+    topics = TopicDirectory(os.path.join(tempfile.mkdtemp(), 'missing.csv'))
+    assert len(topics) == 0
+    assert topics.find('Texas') is None
+    assert dict(topics.state_links) == {}
+
+if __name__ == "__main__":
+    test_topics_file_is_indexed()
+    test_normalize_title()
+    test_reload_on_change()
+    test_missing_file_leaves_directory_empty()
+    logger.info("✓ Topic directory tests passed")
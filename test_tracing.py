@@ -0,0 +1,76 @@
+import os
+import json
+import time
+import logging
+import tempfile
+from utils.tracing import Tracer, TRACER
+from utils.completion_pipeline import CompletionPipeline
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def test_spans_nest_under_the_update():
+    tracer = Tracer()
+    with tracer.trace('handle_callback', user_id=1):
+        with tracer.span('telegram.answer_callback_query'):
+            pass
+        # A handler called from another one becomes a span
+        with tracer.trace('send_question'):
+            with tracer.span('telegram.edit_message_text'):
+                time.sleep(0.01)
+    with tracer.span('outside'):
+        pass
+    [trace] = tracer.slowest()
+    spans = trace.to_dict()['spans']
+    assert spans['name'] == 'handle_callback'
+    assert [child['name'] for child in spans['children']] == ['telegram.answer_callback_query', 'send_question']
+    assert spans['children'][1]['children'][0]['duration_ms'] >= 10
+    assert trace.summary().startswith('handle_callback')
+
+def test_only_the_slowest_are_kept():
+    tracer = Tracer(keep=3)
+    # Far enough apart that scheduling jitter does not reorder them
+    for delay in (0.04, 0.0, 0.08, 0.01, 0.06):
+        with tracer.trace('update', delay=delay):
+            time.sleep(delay)
+    assert [trace.attributes['delay'] for trace in tracer.slowest()] == [0.08, 0.06, 0.04]
+    tracer.configure(keep=1)
+    assert len(tracer.slowest()) == 1
+
+def test_sampling_skips_updates():
+    tracer = Tracer(sample_rate=0.0)
+    with tracer.trace('update'):
+        with tracer.span('telegram.send_message'):
+            pass
+        tracer.sample_rate = 1.0
+        # A handler called by an unsampled one is not traced on its own
+        with tracer.trace('send_question'):
+            pass
+    assert tracer.slowest() == []
+    assert tracer.stats == {'traced': 0, 'skipped': 1}
+
+def test_sink_writes_join_the_trace_and_dump():
+    # The pipeline records into the process-wide tracer
+    TRACER.clear()
+    pipeline = CompletionPipeline()
+    pipeline.add_sink('broken', lambda row_data, headers: 1 / 0, retries=1, retry_delay=0.01)
+    with TRACER.trace('finish_form'):
+        pipeline.submit(['row'], ('Answer',))
+    pipeline.stop()
+    [trace] = TRACER.slowest()
+    children = trace.to_dict()['spans']['children']
+    assert [child['name'] for child in children] == ['completion.submit', 'sink.broken', 'sink.broken']
+    assert children[1]['error'] == 'ZeroDivisionError'
+
+    path = os.path.join(tempfile.mkdtemp(), 'traces', 'slow.json')
+    assert TRACER.dump(path) == 1
+    with open(path, encoding='utf-8') as f:
+        assert json.load(f)[0]['spans']['name'] == 'finish_form'
+
+if __name__ == "__main__":
+    test_spans_nest_under_the_update()
+    test_only_the_slowest_are_kept()
+    test_sampling_skips_updates()
+    test_sink_writes_join_the_trace_and_dump()
+    logger.info("✓ Tracing tests passed")
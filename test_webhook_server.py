@@ -0,0 +1,60 @@
+import json
+import asyncio
+import logging
+from utils.async_pipeline import AsyncUpdatePipeline
+from utils.webhook_server import WebhookServer
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+UPDATE = {
+    'update_id': 1,
+    'message': {
+        'message_id': 1,
+        'date': 1739500000,
+        'chat': {'id': 42, 'type': 'private'},
+        'from': {'id': 42, 'is_bot': False, 'first_name': 'Test'},
+        'text': 'hello'
+    }
+}
+
+async def post(port, path, body):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(
+        f'POST {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n'
+        f'Connection: close\r\n\r\n'.encode() + body
+    )
+    await writer.drain()
+    status_line = await reader.readline()
+    writer.close()
+    return int(status_line.split()[1])
+
+async def exercise_server():
+    # No workers are started, so the single queue slot stays full after one update
+    pipeline = AsyncUpdatePipeline(dispatcher=None, max_concurrency=1, max_pending=1)
+    pipeline.queue = asyncio.Queue(maxsize=1)
+    server = WebhookServer(pipeline, bot=None, port=0, path='/hook')
+    await server.start()
+    try:
+        body = json.dumps(UPDATE).encode()
+        statuses = [
+            await post(server.port, '/hook', body),
+            await post(server.port, '/hook', body),
+            await post(server.port, '/hook', b'not json'),
+            await post(server.port, '/elsewhere', body)
+        ]
+    finally:
+        await server.stop()
+    queued = pipeline.queue.get_nowait()
+    return statuses, queued
+
+def test_webhook_accepts_and_applies_backpressure():
+    statuses, queued = asyncio.run(exercise_server())
+    assert statuses == [200, 503, 400, 404]
+    assert queued.effective_user.id == 42
+    assert queued.message.text == 'hello'
+
+if __name__ == "__main__":
+    test_webhook_accepts_and_applies_backpressure()
+    logger.info("✓ Webhook server tests passed")
@@ -0,0 +1,143 @@
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+class AsyncUpdatePipeline:
+    """asyncio execution mode for the bot's update handling.
+
+    Updates go into a bounded asyncio queue that a fixed number of worker
+    coroutines drain. Each worker awaits the dispatcher (FormBot handlers,
+    Telegram calls and file sinks) on a bounded thread pool, so the event loop
+    never blocks and many users are served concurrently. Updates from the same
+    user are handled one at a time and in order, which keeps each session's
+    state consistent. Memory stays bounded: at most ``max_pending`` updates are
+    queued and ``max_concurrency`` are in flight; producers wait when full.
+    """
+
+    def __init__(self, dispatcher, max_concurrency=64, max_pending=1000):
+        """Initialize the pipeline.
+
+        Args:
+            dispatcher: telegram.ext.Dispatcher with FormBot handlers registered.
+            max_concurrency: Number of updates processed at the same time.
+            max_pending: Maximum number of updates waiting in the queue.
+        """
+        self.dispatcher = dispatcher
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='update-worker')
+        self.queue = None
+        self.loop = None
+        self._user_locks = {}
+        self._workers = []
+        self.stats = {'received': 0, 'processed': 0, 'rejected': 0, 'errors': 0, 'busy_time': 0.0}
+
+    async def start(self):
+        """Create the queue and worker coroutines on the running loop."""
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=self.max_pending)
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f'update-worker-{i}')
+            for i in range(self.max_concurrency)
+        ]
+        logger.info(
+            f"Async pipeline started ({self.max_concurrency} concurrent, {self.max_pending} pending max)"
+        )
+
+    async def submit(self, update):
+        """Queue an update, waiting while the queue is full (backpressure)."""
+        self.stats['received'] += 1
+        await self.queue.put(update)
+
+    def submit_nowait(self, update):
+        """Queue an update without waiting.
+
+        Returns:
+            False if the queue is full and the update was rejected.
+        """
+        try:
+            self.queue.put_nowait(update)
+        except asyncio.QueueFull:
+            self.stats['rejected'] += 1
+            return False
+        self.stats['received'] += 1
+        return True
+
+    def pending(self):
+        """Return the number of queued updates."""
+        return self.queue.qsize() if self.queue is not None else 0
+
+    async def join(self):
+        """Wait until every queued update has been processed."""
+        await self.queue.join()
+
+    async def _worker(self):
+        while True:
+            update = await self.queue.get()
+            try:
+                await self.handle_update(update)
+            finally:
+                self.queue.task_done()
+
+    async def handle_update(self, update):
+        """Process one update, serialized with other updates from the same user."""
+        user = getattr(update, 'effective_user', None)
+        key = user.id if user else None
+        lock, waiters = self._user_locks.get(key, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self._user_locks[key] = (lock, waiters + 1)
+        try:
+            async with lock:
+                started = time.monotonic()
+                await self.loop.run_in_executor(self.executor, self.dispatcher.process_update, update)
+                self.stats['busy_time'] += time.monotonic() - started
+                self.stats['processed'] += 1
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.error(f"Error processing update: {str(e)}", exc_info=True)
+        finally:
+            lock, waiters = self._user_locks[key]
+            # Drop the lock once nobody is waiting so idle users cost no memory
+            if waiters == 1:
+                del self._user_locks[key]
+            else:
+                self._user_locks[key] = (lock, waiters - 1)
+
+    async def poll(self, bot, timeout=30, allowed_updates=None, drop_pending_updates=True):
+        """Long-poll getUpdates and feed the queue until cancelled."""
+        offset = None
+        if drop_pending_updates:
+            await self.loop.run_in_executor(None, lambda: bot.delete_webhook(drop_pending_updates=True))
+        while True:
+            try:
+                updates = await self.loop.run_in_executor(
+                    None,
+                    lambda: bot.get_updates(
+                        offset=offset,
+                        timeout=timeout,
+                        read_latency=5,
+                        allowed_updates=allowed_updates
+                    )
+                )
+            except Exception as e:
+                logger.error(f"Error fetching updates: {str(e)}")
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                offset = update.update_id + 1
+                await self.submit(update)
+
+    async def stop(self):
+        """Finish queued updates, then stop the workers and thread pool."""
+        if self.queue is not None:
+            await self.queue.join()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self.executor.shutdown(wait=True)
+        logger.info(f"Async pipeline stopped: {self.stats}")
@@ -0,0 +1,157 @@
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from utils.tracing import TRACER
+
+logger = logging.getLogger(__name__)
+
+class Sink:
+    """One destination for completed responses, with its own workers, retries and metrics."""
+
+    def __init__(self, name, write, timeout=10.0, retries=2, retry_delay=0.5, workers=1, max_pending=1000):
+        """Initialize the sink.
+
+        Args:
+            name: Name used in logs and stats.
+            write: Callable taking (row_data, headers); raising marks the attempt failed.
+            timeout: Seconds after which a still-running attempt is logged and
+                counted as a timeout. The attempt is never abandoned: its outcome
+                decides whether the row is delivered or retried, so a slow write
+                is not duplicated by a retry racing it.
+            retries: Attempts made after the first one fails.
+            retry_delay: Seconds before the first retry, doubled for each further one.
+            workers: Responses written to this sink at once.
+            max_pending: Responses queued for this sink before ``submit`` drops new
+                ones (counted and logged with the row) instead of waiting for room.
+        """
+        self.name = name
+        self.write = write
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'sink-{name}')
+        # Attempts run here so the worker can notice one overrunning the timeout
+        self._calls = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'sink-{name}-call')
+        self._lock = threading.Lock()
+        self.stats = {'delivered': 0, 'failed': 0, 'retries': 0, 'timeouts': 0, 'dropped': 0, 'pending': 0}
+        # [attempts, total seconds, max seconds] for successful and failed attempts alike
+        self.latency = [0, 0.0, 0.0]
+
+    def submit(self, row_data, headers, trace=None):
+        if not self._slots.acquire(blocking=False):
+            # A hung write holds every slot; waiting here would stall the handler and the other sinks
+            with self._lock:
+                self.stats['dropped'] += 1
+            logger.error(f"{self.name} sink has {self.max_pending} responses pending, dropping row: {row_data}")
+            return
+        with self._lock:
+            self.stats['pending'] += 1
+        self._pool.submit(self._deliver, row_data, headers, trace)
+
+    def _attempt(self, row_data, headers, trace=None):
+        started = time.perf_counter()
+        error = None
+        future = self._calls.submit(self.write, row_data, headers)
+        try:
+            try:
+                future.result(timeout=self.timeout)
+            except FutureTimeout:
+                with self._lock:
+                    self.stats['timeouts'] += 1
+                logger.warning(f"{self.name} sink write still running after {self.timeout}s, waiting for it")
+                # Retrying now could write the row twice; the attempt's own outcome decides
+                future.result()
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.latency[0] += 1
+                self.latency[1] += elapsed
+                self.latency[2] = max(self.latency[2], elapsed)
+            if trace is not None:
+                trace.record(f"sink.{self.name}", started, elapsed, error)
+
+    def _deliver(self, row_data, headers, trace=None):
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    self._attempt(row_data, headers, trace)
+                except Exception as e:
+                    if attempt == self.retries:
+                        with self._lock:
+                            self.stats['failed'] += 1
+                        logger.error(
+                            f"Giving up on {self.name} sink after {attempt + 1} attempt(s): {str(e)}", exc_info=True
+                        )
+                        return
+                    with self._lock:
+                        self.stats['retries'] += 1
+                    logger.warning(f"{self.name} sink failed ({str(e)}), retrying")
+                    time.sleep(self.retry_delay * (2 ** attempt))
+                else:
+                    with self._lock:
+                        self.stats['delivered'] += 1
+                    return
+        finally:
+            with self._lock:
+                self.stats['pending'] -= 1
+            self._slots.release()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            attempts, total, longest = self.latency
+        stats['latency_mean'] = total / attempts if attempts else 0.0
+        stats['latency_max'] = longest
+        return stats
+
+    def stop(self):
+        self._pool.shutdown(wait=True)
+        self._calls.shutdown(wait=False)
+
+class CompletionPipeline:
+    """Fans completed responses out to every sink in parallel, off the handler thread.
+
+    ``submit`` returns as soon as the response is queued for each sink. Every
+    sink has its own worker threads, retries with backoff, and counters, so
+    a slow or failing sink only delays itself. Each sink queues
+    at most ``max_pending`` responses; past that, the sink drops the response
+    and logs the row rather than holding unbounded work in memory or making
+    ``submit`` wait.
+    """
+
+    def __init__(self):
+        self.sinks = {}
+
+    def add_sink(self, name, write, **options):
+        """Register a sink; ``options`` are passed to Sink (timeout, retries, retry_delay, workers, max_pending)."""
+        if name in self.sinks:
+            raise ValueError(f"Sink {name!r} is already registered")
+        self.sinks[name] = Sink(name, write, **options)
+        return self.sinks[name]
+
+    def submit(self, row_data, headers):
+        """Queue a completed response for every sink.
+
+        When called inside a trace, each sink attempt is added to that trace
+        as it finishes.
+        """
+        trace = TRACER.current()
+        with TRACER.span('completion.submit'):
+            for sink in self.sinks.values():
+                sink.submit(row_data, headers, trace)
+
+    def get_stats(self):
+        """Return each sink's counters and attempt latency, keyed by sink name."""
+        return {name: sink.get_stats() for name, sink in self.sinks.items()}
+
+    def stop(self):
+        """Wait for queued responses to be written (or given up on), then stop."""
+        for sink in self.sinks.values():
+            sink.stop()
+        logger.info(f"Completion pipeline stopped: {self.get_stats()}")
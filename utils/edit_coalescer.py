@@ -0,0 +1,154 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from telegram.error import BadRequest
+from utils.tracing import TRACER
+
+logger = logging.getLogger(__name__)
+
+class EditCoalescer:
+    """Debounces message edits so rapid taps on the same message send one edit.
+
+    Each edit waits ``delay`` seconds; a newer edit of the same message
+    replaces it and restarts the wait, so only the latest state is sent once
+    the user stops tapping. Edits that would leave the message as it was
+    before the first tap are dropped. Edits are released from a background
+    thread, so handlers never wait on the Telegram API for them. With the
+    rate-limited bot a released edit is only queued on the outbound
+    scheduler, so a throttled chat does not hold up other chats' edits; its
+    outcome is counted once it is sent.
+    """
+
+    def __init__(self, delay=0.3):
+        """Initialize the coalescer.
+
+        Args:
+            delay: Quiet period in seconds before an edit is sent. With 0,
+                edits are sent immediately by the caller.
+        """
+        self.delay = delay
+        # (chat_id, message_id) -> [deadline, message, text, reply_markup, original_text],
+        # kept in deadline order: every delay is the same, so a rescheduled edit moves to the end
+        self._pending = OrderedDict()
+        self._in_flight = None
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread = None
+        self.stats = {
+            'scheduled': 0,
+            'api_calls': 0,
+            'sent': 0,
+            'superseded': 0,
+            'unchanged': 0,
+            'cancelled': 0,
+            'errors': 0
+        }
+
+    def start(self):
+        """Start the background sender thread."""
+        if self._thread is None and self.delay > 0:
+            self._thread = threading.Thread(target=self._run, name='edit-coalescer', daemon=True)
+            self._thread.start()
+            logger.info(f"Edit coalescer started ({self.delay}s quiet window)")
+
+    def schedule(self, message, text, reply_markup=None):
+        """Edit ``message`` once no newer edit of it arrives within the quiet window."""
+        key = (message.chat_id, message.message_id)
+        if self._thread is None:
+            self.stats['scheduled'] += 1
+            self._send(message, text, reply_markup)
+            return
+        with self._cond:
+            self.stats['scheduled'] += 1
+            entry = self._pending.pop(key, None)
+            if entry is not None:
+                self.stats['superseded'] += 1
+                original_text = entry[4]
+            else:
+                original_text = message.text
+            self._pending[key] = [time.monotonic() + self.delay, message, text, reply_markup, original_text]
+            if len(self._pending) == 1:
+                self._cond.notify()
+
+    def cancel(self, message):
+        """Drop any pending edit of ``message`` and wait for one being released.
+
+        Call this before replacing the message, so a stale edit cannot land
+        on top of the new content: an edit already queued on the outbound
+        scheduler is sent before anything the caller queues for that chat.
+        """
+        key = (message.chat_id, message.message_id)
+        with TRACER.span('edits.cancel'), self._cond:
+            if self._pending.pop(key, None) is not None:
+                self.stats['cancelled'] += 1
+            while self._in_flight == key:
+                self._cond.wait()
+
+    def saved_calls(self):
+        """Return the number of edit API calls avoided so far."""
+        return self.stats['scheduled'] - self.stats['api_calls']
+
+    def _send(self, message, text, reply_markup):
+        self.stats['api_calls'] += 1
+        try:
+            result = message.edit_text(text=text, reply_markup=reply_markup)
+        except Exception as e:
+            self._count(e)
+            if self._is_error(e):
+                logger.error(f"Error editing message: {str(e)}", exc_info=not isinstance(e, BadRequest))
+            return
+        if isinstance(result, Future):
+            # Queued by RateLimitedBot, which logs failures itself
+            result.add_done_callback(lambda future: self._count(future.exception()))
+        else:
+            self._count(None)
+
+    @staticmethod
+    def _is_error(error):
+        return error is not None and not (isinstance(error, BadRequest) and 'not modified' in str(error).lower())
+
+    def _count(self, error):
+        if error is None:
+            self.stats['sent'] += 1
+        elif self._is_error(error):
+            self.stats['errors'] += 1
+        else:
+            self.stats['unchanged'] += 1
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if not self._pending:
+                        if self._stopping:
+                            return
+                        self._cond.wait()
+                        continue
+                    key, entry = next(iter(self._pending.items()))
+                    wait = entry[0] - time.monotonic()
+                    if wait <= 0 or self._stopping:
+                        break
+                    self._cond.wait(wait)
+                del self._pending[key]
+                self._in_flight = key
+            _, message, text, reply_markup, original_text = entry
+            if text == original_text:
+                # Taps cancelled each other out; the message already shows this
+                self.stats['unchanged'] += 1
+            else:
+                self._send(message, text, reply_markup)
+            with self._cond:
+                self._in_flight = None
+                self._cond.notify_all()
+
+    def stop(self, timeout=10):
+        """Send every pending edit now and stop the sender thread."""
+        if self._thread is not None:
+            with self._cond:
+                self._stopping = True
+                self._cond.notify_all()
+            self._thread.join(timeout)
+            self._thread = None
+        logger.info(f"Edit coalescer stopped, {self.saved_calls()} edit call(s) saved: {self.stats}")
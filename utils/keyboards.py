@@ -0,0 +1,246 @@
+import logging
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+logger = logging.getLogger(__name__)
+
+# Callback actions besides picking an option
+DONE_ACTION = 'done'
+BACK_ACTION = 'back'
+
+# Callback data used by keyboards sent before the compact encoding
+LEGACY_DONE = 'DONE_SELECTING'
+LEGACY_BACK = 'GO_BACK'
+
+def encode_callback(tag, question_index, action):
+    """Encode a button press as compact callback data.
+
+    Args:
+        tag: Fingerprint of the schema the keyboard was built from.
+        question_index: Index of the question the button belongs to.
+        action: Option index, DONE_ACTION or BACK_ACTION.
+
+    Returns:
+        A string such as ``v1f3a9c0b22e7:q5:o2`` that stays far below
+        Telegram's 64-byte callback_data limit whatever the option text.
+    """
+    if isinstance(action, int):
+        action = f'o{action}'
+    return f'v{tag}:q{question_index}:{action}'
+
+def decode_callback(data):
+    """Decode callback data built by encode_callback.
+
+    Returns:
+        (tag, question_index, action) where action is an option index,
+        DONE_ACTION or BACK_ACTION, or None if the data is not in this format.
+        Keyboards sent before schemas had fingerprints carry a version
+        number as the tag, which matches no schema.
+    """
+    parts = data.split(':')
+    if len(parts) != 3 or len(parts[0]) < 2 or not parts[0].startswith('v') or not parts[1].startswith('q'):
+        return None
+    tag = parts[0][1:]
+    try:
+        question_index = int(parts[1][1:])
+        action = parts[2]
+        if action.startswith('o'):
+            action = int(action[1:])
+        elif action not in (DONE_ACTION, BACK_ACTION):
+            return None
+    except ValueError:
+        return None
+    return tag, question_index, action
+
+def build_keyboard(question, options, is_first, tag=''):
+    """Build the inline keyboard for a question.
+
+    Args:
+        question: Question record being asked.
+        options: Options to offer (already resolved for dynamic questions).
+        is_first: True for the first question, which has no Back button.
+        tag: Schema fingerprint encoded in the callback data.
+
+    Returns:
+        InlineKeyboardMarkup, or None for a first question without buttons.
+    """
+    keyboard = []
+    if question.is_choice:
+        for option_index, option in enumerate(options):
+            keyboard.append([InlineKeyboardButton(
+                option, callback_data=encode_callback(tag, question.index, option_index)
+            )])
+        if question.is_multi_select:
+            keyboard.append([InlineKeyboardButton(
+                "✅ Done", callback_data=encode_callback(tag, question.index, DONE_ACTION)
+            )])
+    if not is_first:
+        keyboard.append([InlineKeyboardButton(
+            "⬅️ Back", callback_data=encode_callback(tag, question.index, BACK_ACTION)
+        )])
+    return InlineKeyboardMarkup(keyboard) if keyboard else None
+
+class KeyboardCache:
+    """Keyboards for every question of a schema, built once and shared by all users.
+
+    A keyboard only depends on the question index, the region answer (for the
+    dynamic state question) and whether it is the first question, so each one
+    is compiled when the schema loads. Markups are never modified after they
+    are built, which makes them safe to send to any number of chats.
+    """
+
+    def __init__(self, questions, tag=''):
+        """Compile the keyboards.
+
+        Args:
+            questions: Question records in display order.
+            tag: Schema fingerprint encoded in the callback data.
+        """
+        self.questions = tuple(questions)
+        self.tag = tag
+        self._keyboards = {}
+        for question in self.questions:
+            is_first = question.index == 0
+            self._keyboards[(question.index, None, is_first)] = build_keyboard(
+                question, question.options, is_first, tag
+            )
+            if question.dynamic:
+                for region, states in question.region_states.items():
+                    self._keyboards[(question.index, region, is_first)] = build_keyboard(
+                        question, states, is_first, tag
+                    )
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def __len__(self):
+        return len(self._keyboards)
+
+    def get(self, index, region=None):
+        """Return the keyboard for a question given the user's region answer (or None)."""
+        question = self.questions[index]
+        if not (question.dynamic and question.region_states):
+            region = None
+        key = (index, region or None, index == 0)
+        try:
+            markup = self._keyboards[key]
+        except KeyError:
+            # Region without a state list; rare, so build it rather than growing the cache
+            self.stats['misses'] += 1
+            return build_keyboard(question, question.options_for_region(region), index == 0, self.tag)
+        self.stats['hits'] += 1
+        return markup
+
+    def resolve(self, data, index, region=None):
+        """Turn callback data into an action on the current question.
+
+        Args:
+            data: callback_data from the pressed button.
+            index: Index of the user's current question.
+            region: The user's region answer (resolves dynamic options).
+
+        Returns:
+            (action, option) where action is DONE_ACTION, BACK_ACTION or the
+            option index and option is the option text (None for Done/Back),
+            or None if the button belongs to another question or schema
+            (including a keyboard sent before a restart onto changed questions),
+            names an option that does not exist, or is Back on
+            the first question.
+        """
+        options = self.questions[index].options_for_region(region)
+        decoded = decode_callback(data)
+        if decoded is None:
+            # Keyboards sent before the compact encoding carry the option text itself
+            if data == LEGACY_DONE:
+                return DONE_ACTION, None
+            if data == LEGACY_BACK:
+                return (BACK_ACTION, None) if index > 0 else None
+            if data in options:
+                return options.index(data), data
+            return None
+
+        tag, question_index, action = decoded
+        if tag != self.tag or question_index != index:
+            return None
+        if isinstance(action, int):
+            if not 0 <= action < len(options):
+                return None
+            return action, options[action]
+        if action == BACK_ACTION and index == 0:
+            return None
+        return action, None
+
+class SelectionCache:
+    """Question text and answer for every multi-select selection, indexed by bitmask.
+
+    Bit ``i`` of a mask stands for the question's option ``i``, so toggling is
+    ``mask ^ (1 << i)`` and the selection is always listed in option order.
+    The "Selected:" text and the answer string for each mask are built once
+    when the schema loads; questions with more than ``max_options`` options
+    are rendered on demand.
+    """
+
+    def __init__(self, questions, max_options=10):
+        """Render the multi-select texts.
+
+        Args:
+            questions: Question records in display order.
+            max_options: Largest option count rendered up front (2 ** n masks).
+        """
+        self.questions = tuple(questions)
+        self._rendered = {}
+        self._answers = {}
+        self._masks = {}
+        for question in self.questions:
+            if question.is_multi_select and len(question.options) <= max_options:
+                masks = range(1 << len(question.options))
+                self._rendered[question.index] = tuple(self._render(question, mask) for mask in masks)
+                # Shared by every session that picks the same combination
+                self._answers[question.index] = tuple(
+                    ", ".join(self.selected(question, mask)) for mask in masks
+                )
+                self._masks[question.index] = {answer: mask for mask, answer in enumerate(self._answers[question.index])}
+
+    @staticmethod
+    def selected(question, mask):
+        """Return the selected option texts in option order."""
+        return [option for bit, option in enumerate(question.options) if mask >> bit & 1]
+
+    def _render(self, question, mask):
+        text = (
+            f"{question.index + 1}. {question.text}\n\n"
+            f"(You can select multiple options. Click '✅ Done' when finished.)"
+        )
+        if mask:
+            text += "\n\nSelected: " + ", ".join(self.selected(question, mask))
+        return text
+
+    def render(self, index, mask):
+        """Return the question text showing the options in ``mask`` as selected."""
+        rendered = self._rendered.get(index)
+        if rendered is None:
+            return self._render(self.questions[index], mask)
+        return rendered[mask]
+
+    def answer(self, index, mask):
+        """Return the stored answer for a selection: option texts joined with commas."""
+        answers = self._answers.get(index)
+        if answers is None:
+            return ", ".join(self.selected(self.questions[index], mask))
+        return answers[mask]
+
+    def mask_of(self, index, answer):
+        """Return the mask a stored answer string was built from (0 if it matches no selection)."""
+        masks = self._masks.get(index)
+        if masks is not None:
+            return masks.get(answer, 0)
+        # Options may contain commas, so match them in option order instead of splitting
+        mask, position = 0, 0
+        for bit, option in enumerate(self.questions[index].options):
+            end = position + len(option)
+            if answer.startswith(option, position) and (end == len(answer) or answer.startswith(", ", end)):
+                mask |= 1 << bit
+                position = end + 2
+        return mask if position >= len(answer) else 0
+
+    def mask_for(self, index, options):
+        """Convert a list of option texts (sessions saved before bitmasks) into a mask."""
+        question = self.questions[index]
+        return sum(1 << question.options.index(option) for option in set(options) if option in question.options)
@@ -0,0 +1,120 @@
+import os
+import sys
+import queue
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s'
+
+# Loggers kept quieter than the root level by default (the telegram ones can expose the token)
+QUIET_LOGGERS = {
+    'telegram': logging.WARNING,
+    'telegram.bot': logging.WARNING,
+    'telegram.ext.updater': logging.WARNING,
+    'googleapiclient.discovery_cache': logging.ERROR,
+}
+
+_lock = threading.Lock()
+_installed = []
+_listener = None
+
+class DebugSampler(logging.Filter):
+    """Lets through one in ``every`` DEBUG records per call site; other levels always pass."""
+
+    def __init__(self, every=10):
+        super().__init__()
+        self.every = max(1, every)
+        self._counts = {}
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.every == 1:
+            return True
+        key = (record.pathname, record.lineno)
+        # A lost increment between threads only shifts which record is sampled
+        count = self._counts.get(key, 0)
+        self._counts[key] = count + 1
+        return count % self.every == 0
+
+class DeferredQueueHandler(QueueHandler):
+    """QueueHandler that leaves all formatting to the listener thread.
+
+    The stock QueueHandler merges the message arguments (and renders any
+    traceback) on the logging thread so records can be pickled. Records here
+    stay in this process, so the calling thread only enqueues them. Log
+    arguments must therefore not be mutated after the call, which holds for
+    the strings and numbers this code logs.
+    """
+
+    def prepare(self, record):
+        return record
+
+def configure_logging(level=None, log_file=None, console_stream=None, queued=None, debug_sample=None):
+    """Install the bot's log handlers on the root logger, replacing ones installed earlier.
+
+    Production defaults come from the environment: LOG_LEVEL (INFO),
+    LOG_FILE (logs/bot.log, rotated at 10 MB, 5 backups), LOG_QUEUED (1) and
+    LOG_DEBUG_SAMPLE (10).
+
+    Args:
+        level: Root level name or number.
+        log_file: Rotating log file path, or '' for no file.
+        console_stream: Stream for console output. Defaults to stdout.
+        queued: Format and write on a background QueueListener thread. When
+            False, every logging call writes synchronously, as before.
+        debug_sample: Keep one in this many DEBUG records per call site.
+
+    Returns:
+        The QueueListener, or None when ``queued`` is False.
+    """
+    global _listener
+    level = level if level is not None else os.getenv('LOG_LEVEL', 'INFO').upper()
+    log_file = log_file if log_file is not None else os.getenv('LOG_FILE', os.path.join('logs', 'bot.log'))
+    queued = queued if queued is not None else os.getenv('LOG_QUEUED', '1') != '0'
+    debug_sample = debug_sample if debug_sample is not None else int(os.getenv('LOG_DEBUG_SAMPLE', '10'))
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = []
+    if log_file:
+        os.makedirs(os.path.dirname(log_file) or '.', exist_ok=True)
+        file_handler = RotatingFileHandler(log_file, maxBytes=10 * 1024 * 1024, backupCount=5, encoding='utf-8')
+        file_handler.setFormatter(formatter)
+        handlers.append(file_handler)
+    console_handler = logging.StreamHandler(console_stream or sys.stdout)
+    console_handler.setFormatter(formatter)
+    handlers.append(console_handler)
+
+    with _lock:
+        stop_logging()
+        root = logging.getLogger()
+        root.setLevel(level)
+        for name, quiet_level in QUIET_LOGGERS.items():
+            logging.getLogger(name).setLevel(quiet_level)
+        if queued:
+            front = DeferredQueueHandler(queue.SimpleQueue())
+            _listener = QueueListener(front.queue, *handlers, respect_handler_level=True)
+            _listener.start()
+            front_handlers = [front]
+        else:
+            front_handlers = handlers
+        for handler in front_handlers:
+            handler.addFilter(DebugSampler(debug_sample))
+            root.addHandler(handler)
+        # With a listener, its handlers are closed by stop_logging too
+        _installed[:] = front_handlers + (handlers if queued else [])
+    return _listener
+
+def stop_logging():
+    """Write out queued records and remove the handlers installed by configure_logging."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    root = logging.getLogger()
+    for handler in _installed:
+        root.removeHandler(handler)
+        handler.close()
+    _installed.clear()
+
+atexit.register(stop_logging)
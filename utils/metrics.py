@@ -0,0 +1,299 @@
+import os
+import time
+import bisect
+import logging
+import functools
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Seconds; covers in-process handlers (sub-millisecond) up to slow Sheets calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    type = 'untyped'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children = {}
+
+    def _init_children(self):
+        # Unlabeled metrics are reported (as zero) before their first update
+        if not self.labelnames:
+            self.labels()
+
+    def labels(self, *values):
+        """Return the child for one combination of label values (created on first use)."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def samples(self):
+        """Yield (suffix, label pairs, value) for the exposition format."""
+        for values, child in list(self._children.items()):
+            for suffix, extra, value in child.samples():
+                yield suffix, tuple(zip(self.labelnames, values)) + extra, value
+
+class _CounterChild:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self):
+        yield '_total', (), self.value
+
+class Counter(_Metric):
+    """Monotonic count; use ``labels(...).inc()``, or ``inc()`` when there are no labels."""
+    type = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._init_children()
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+class _Timer:
+    __slots__ = ('child', 'started')
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.child.observe(time.perf_counter() - self.started)
+
+    def __call__(self, func):
+        child = self.child
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - started)
+        return wrapper
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', '_lock')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self):
+        """Time a block (``with child.time():``) or a function (``@child.time()``) in seconds."""
+        return _Timer(self)
+
+    def samples(self):
+        with self._lock:
+            counts = list(self.counts)
+            total = self.sum
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            yield '_bucket', (('le', _format_value(bound)),), cumulative
+        yield '_sum', (), total
+        yield '_count', (), cumulative
+
+class Histogram(_Metric):
+    """Distribution of observed values (durations in seconds) in cumulative buckets."""
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._init_children()
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self, *labels):
+        """Timer for the child with ``labels``; see _HistogramChild.time."""
+        return self.labels(*labels).time()
+
+class CallbackMetric:
+    """Gauge or counter read from existing state when metrics are collected.
+
+    ``read`` returns a number, or a dict mapping a label value (or tuple of
+    values) to a number. Nothing is recorded on the update path, so stats the
+    components already keep (queue depths, 429 counts, sink failures) cost
+    nothing until scraped.
+    """
+
+    def __init__(self, name, help, read, type='gauge', labelnames=()):
+        self.name = name
+        self.help = help
+        self.read = read
+        self.type = type
+        self.labelnames = tuple(labelnames)
+
+    def samples(self):
+        suffix = '_total' if self.type == 'counter' else ''
+        try:
+            value = self.read()
+        except Exception as e:
+            logger.warning(f"Could not collect {self.name}: {str(e)}")
+            return
+        if isinstance(value, dict):
+            for key, item in value.items():
+                values = key if isinstance(key, tuple) else (key,)
+                yield suffix, tuple(zip(self.labelnames, values)), item
+        else:
+            yield suffix, (), value
+
+class Registry:
+    """Set of metrics rendered together in the Prometheus text format."""
+
+    def __init__(self, const_labels=None):
+        """Initialize the registry.
+
+        Args:
+            const_labels: Labels added to every sample, e.g. ``{'shard': '2'}``
+                in a shard worker, so files from several processes can be told apart.
+        """
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self.const_labels = dict(const_labels or {})
+
+    def register(self, metric):
+        """Add a metric, replacing any earlier one with the same name; returns the metric."""
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def callback(self, name, help, read, type='gauge', labelnames=()):
+        return self.register(CallbackMetric(name, help, read, type, labelnames))
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        const_labels = tuple(self.const_labels.items())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for suffix, labels, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{_format_labels(const_labels + labels)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path):
+        """Write ``render()`` to ``path``, replacing it atomically."""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(self.render())
+        os.replace(temp_path, path)
+
+# Process-wide registry; components record into the metrics below
+REGISTRY = Registry()
+
+HANDLER_SECONDS = REGISTRY.histogram(
+    'quizbot_handler_seconds', 'Time spent in each FormBot handler', ('handler',)
+)
+API_CALL_SECONDS = REGISTRY.histogram(
+    'quizbot_api_call_seconds', 'Duration of Telegram and Google Sheets API calls', ('api', 'method')
+)
+OUTBOUND_WAIT_SECONDS = REGISTRY.histogram(
+    'quizbot_outbound_wait_seconds', 'Time outgoing Telegram calls spend queued behind the rate limits', ('priority',)
+)
+COMPLETIONS = REGISTRY.counter('quizbot_completions', 'Quizzes completed')
+
+class MetricsServer:
+    """Serves ``registry.render()`` at /metrics from a background thread."""
+
+    def __init__(self, registry=REGISTRY, listen='127.0.0.1', port=9108):
+        """Initialize the server.
+
+        Args:
+            registry: Registry to expose.
+            listen: Interface to bind to. Keep it local; the endpoint has no authentication.
+            port: TCP port to bind to; 0 picks a free port.
+        """
+        self.registry = registry
+        self.listen = listen
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        """Start serving; ``self.port`` holds the bound port afterwards."""
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.listen, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name='metrics-server', daemon=True)
+        self._thread.start()
+        logger.info(f"Metrics available at http://{self.listen}:{self.port}/metrics")
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
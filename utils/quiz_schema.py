@@ -0,0 +1,251 @@
+import os
+import sys
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from utils.keyboards import KeyboardCache, SelectionCache
+
+logger = logging.getLogger(__name__)
+
+# Columns written before the answers in every response row
+USER_COLUMNS = ('Username', 'First Name', 'Last Name', 'User ID', 'Timestamp')
+
+CHOICE_TYPES = ('multiple_choice', 'multiple_select')
+
+def _fingerprint(questions):
+    """Hash the question ids, types and options, which decide what a stored answer means."""
+    content = [
+        [q.id, q.type, q.options, q.dynamic, sorted(q.region_states.items())]
+        for q in questions
+    ]
+    return hashlib.sha256(json.dumps(content, ensure_ascii=False).encode('utf-8')).hexdigest()[:12]
+
+def header_tag(headers):
+    """Hash a response header row, so files of rows with different columns get different names."""
+    return hashlib.sha256(json.dumps(list(headers), ensure_ascii=False).encode('utf-8')).hexdigest()[:8]
+
+@dataclass(frozen=True)
+class Question:
+    """Immutable, validated record for one quiz question."""
+    index: int
+    id: str
+    text: str
+    type: str
+    options: tuple = ()
+    description: str = None
+    required: bool = False
+    dynamic: bool = False
+    region_states: MappingProxyType = field(default_factory=lambda: MappingProxyType({}))
+
+    @property
+    def is_choice(self):
+        return self.type in CHOICE_TYPES
+
+    @property
+    def is_multi_select(self):
+        return self.type == 'multiple_select'
+
+    def options_for_region(self, region):
+        """Return the options to show given the user's region answer (or None)."""
+        if self.dynamic and self.region_states and region:
+            return self.region_states.get(region, ("Other State",))
+        return self.options
+
+class QuizSchema:
+    """Compiled quiz definition shared by every handler and sink.
+
+    Built once from questions.json; holds frozen question records, the header
+    row used by the CSV and Sheets sinks, an id -> index map, the set of
+    valid options for each question, and the precompiled keyboards and
+    multi-select texts.
+
+    ``version`` counts reloads within one process and restarts at 1.
+    ``fingerprint`` is derived from the questions' content, so it is the same
+    in every process and after a restart; stored sessions and keyboard
+    callback data carry it to tell which questions their answers refer to.
+    """
+
+    def __init__(self, questions, version=1, source_path=None):
+        """Initialize the schema.
+
+        Args:
+            questions: Sequence of Question records in display order.
+            version: Version number, bumped on every reload.
+            source_path: File the schema was loaded from, if any.
+        """
+        self.questions = tuple(questions)
+        self.version = version
+        self.fingerprint = _fingerprint(self.questions)
+        self.source_path = source_path
+        self.index_by_id = MappingProxyType({q.id: q.index for q in self.questions})
+        self.option_sets = tuple(
+            frozenset(q.options).union(*q.region_states.values()) for q in self.questions
+        )
+        self.header_row = USER_COLUMNS + tuple(q.text for q in self.questions)
+        self.keyboards = KeyboardCache(self.questions, self.fingerprint)
+        self.selections = SelectionCache(self.questions)
+
+    def __len__(self):
+        return len(self.questions)
+
+    def __getitem__(self, index):
+        return self.questions[index]
+
+    def __iter__(self):
+        return iter(self.questions)
+
+    def get(self, question_id):
+        """Return the question with the given id, or None."""
+        index = self.index_by_id.get(question_id)
+        return None if index is None else self.questions[index]
+
+    def build_row(self, answers, timestamp):
+        """Build a response row in header order from a dict of answers."""
+        row = [
+            answers.get('username', 'Unknown'),
+            answers.get('first_name', 'Unknown'),
+            answers.get('last_name', 'Unknown'),
+            answers.get('user_id', 'Unknown'),
+            timestamp
+        ]
+        for q in self.questions:
+            response = answers.get(q.id, '')
+            if isinstance(response, list):
+                response = ', '.join(response)
+            row.append(response)
+        return row
+
+    @classmethod
+    def from_dict(cls, data, version=1, source_path=None):
+        """Validate parsed questions.json content and compile it.
+
+        Raises:
+            ValueError: If the data does not describe a valid quiz.
+        """
+        if not isinstance(data, dict) or 'quiz' not in data or not isinstance(data['quiz'], list):
+            logger.error("Invalid questions.json format: must have a 'quiz' list")
+            raise ValueError("Invalid questions.json format")
+
+        questions = []
+        seen_ids = set()
+        for index, q in enumerate(data['quiz']):
+            if not isinstance(q, dict):
+                logger.error(f"Invalid question format - not a dict: {q}")
+                raise ValueError("Invalid question format")
+
+            for required_field in ['id', 'question', 'type']:
+                if required_field not in q:
+                    logger.error(f"Question missing required field '{required_field}': {q}")
+                    raise ValueError(f"Question missing required field '{required_field}'")
+
+            if q['type'] in CHOICE_TYPES and not q.get('options'):
+                logger.error(f"Multiple choice/select question missing options: {q}")
+                raise ValueError("Multiple choice/select question missing options")
+
+            if q['id'] in seen_ids:
+                logger.error(f"Duplicate question id: {q['id']}")
+                raise ValueError(f"Duplicate question id '{q['id']}'")
+            seen_ids.add(q['id'])
+
+            # Interned so every session and schema version shares one copy of each option
+            region_states = MappingProxyType({
+                sys.intern(region): tuple(sys.intern(state) for state in states)
+                for region, states in q.get('region_states', {}).items()
+            })
+            questions.append(Question(
+                index=index,
+                id=q['id'],
+                text=q['question'],
+                type=q['type'],
+                options=tuple(sys.intern(option) for option in q.get('options', ())),
+                description=q.get('description'),
+                required=bool(q.get('required', False)),
+                dynamic=bool(q.get('dynamic', False)),
+                region_states=region_states
+            ))
+
+        return cls(questions, version=version, source_path=source_path)
+
+    @classmethod
+    def from_file(cls, path, version=1):
+        """Load, validate and compile a questions.json file."""
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls.from_dict(data, version=version, source_path=path)
+
+class QuizSchemaRegistry:
+    """Holds the current QuizSchema and recent versions for hot reloading.
+
+    A reload parses and validates the file into a fresh schema before swapping
+    it in with a single assignment, so readers never see a half-built schema.
+    Sessions hold the schema they started on and keep using it to the end.
+    Recent schemas are also kept by fingerprint so a stored session can be
+    matched with the questions it was answering.
+    """
+
+    def __init__(self, path, keep_versions=10):
+        """Initialize the registry and load the first schema.
+
+        Args:
+            path: Path to questions.json.
+            keep_versions: Number of old schemas kept for restoring sessions.
+        """
+        self.path = path
+        self.keep_versions = keep_versions
+        self._lock = threading.Lock()
+        self._file_signature = self._signature()
+        self.current = QuizSchema.from_file(path, version=1)
+        self._schemas = OrderedDict([(self.current.fingerprint, self.current)])
+
+    def _signature(self):
+        """Return a cheap fingerprint of the file used to detect edits."""
+        stat = os.stat(self.path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def get(self, fingerprint=None):
+        """Return the current schema, or the kept schema with ``fingerprint`` (None if there is none)."""
+        if fingerprint is None:
+            return self.current
+        return self._schemas.get(fingerprint)
+
+    def reload(self):
+        """Parse the file into a new schema and swap it in if it is valid.
+
+        Returns:
+            The new schema, or None if the file failed validation.
+        """
+        with self._lock:
+            try:
+                # Remember the signature even if parsing fails, so a broken edit
+                # is reported once rather than on every change check
+                self._file_signature = self._signature()
+                schema = QuizSchema.from_file(self.path, version=self.current.version + 1)
+            except Exception as e:
+                logger.error(f"Not reloading {self.path}, keeping version {self.current.version}: {str(e)}")
+                return None
+
+            self._schemas[schema.fingerprint] = schema
+            self._schemas.move_to_end(schema.fingerprint)
+            while len(self._schemas) > self.keep_versions:
+                self._schemas.popitem(last=False)
+            self.current = schema
+            logger.info(f"Reloaded {len(schema)} questions as schema version {schema.version}")
+            return schema
+
+    def check_for_changes(self):
+        """Reload the schema if the file changed since the last load.
+
+        Returns:
+            The new schema if one was loaded, otherwise None.
+        """
+        try:
+            if self._signature() == self._file_signature:
+                return None
+        except OSError as e:
+            logger.error(f"Cannot check {self.path} for changes: {str(e)}")
+            return None
+        return self.reload()
@@ -0,0 +1,134 @@
+import sys
+import time
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+class QuizSession:
+    """One user's progress through the quiz, kept small so idle sessions stay cheap.
+
+    Answers live in a list indexed by question position rather than a dict
+    keyed by question ID. Choice answers are the schema's own interned option
+    strings, so sessions share them instead of holding copies. User details
+    (name, username, ID) are not stored; they come from the update when the
+    response is saved.
+
+    The session holds the schema it started on. Stored copies key answers by
+    question ID and carry the schema's fingerprint, because positions and
+    version numbers mean nothing once questions.json has changed or the
+    process has restarted.
+    """
+
+    __slots__ = ('current_question', 'answers', 'start_time', 'schema', 'selected_mask')
+
+    def __init__(self, schema, start_time=None):
+        """Start a session on a schema.
+
+        Args:
+            schema: QuizSchema the session is pinned to.
+            start_time: Epoch seconds the quiz started at. Defaults to now.
+        """
+        self.current_question = 0
+        self.answers = [None] * len(schema)
+        self.start_time = time.time() if start_time is None else start_time
+        self.schema = schema
+        # Multi-select options toggled on the current question, bit i for option i
+        self.selected_mask = 0
+
+    def get(self, schema, question_id, default=None):
+        """Return the answer to a question by ID."""
+        index = schema.index_by_id.get(question_id)
+        if index is None or index >= len(self.answers) or self.answers[index] is None:
+            return default
+        return self.answers[index]
+
+    def set_answer(self, index, value):
+        """Record the answer to the question at ``index``."""
+        if index >= len(self.answers):
+            self.answers.extend([None] * (index + 1 - len(self.answers)))
+        self.answers[index] = value
+
+    def answers_dict(self, schema):
+        """Return the answers keyed by question ID (unanswered questions omitted)."""
+        return {q.id: answer for q, answer in zip(schema, self.answers) if answer is not None}
+
+    def to_dict(self):
+        """Return a JSON-friendly copy for the session store."""
+        return {
+            'current_question': self.current_question,
+            'answers': self.answers_dict(self.schema),
+            'start_time': self.start_time,
+            'schema_fingerprint': self.schema.fingerprint,
+            'selected_mask': self.selected_mask
+        }
+
+    @classmethod
+    def from_dict(cls, data, schema):
+        """Rebuild a session on ``schema`` from ``to_dict()`` output or an older layout.
+
+        When the stored fingerprint is the schema's, the session resumes
+        exactly where it was. Otherwise the answers are matched to the
+        schema's questions by ID, answers that are no longer valid options are
+        dropped, and the session resumes at the first unanswered question.
+        Sessions that stored answers by position without a fingerprint cannot
+        be matched and start over.
+
+        The oldest layout keyed answers by question ID (alongside the user's
+        details), kept an ISO start time and listed multi-select choices in
+        ``selected_options``.
+        """
+        session = cls(schema, start_time=_epoch(data.get('start_time')))
+        same_schema = data.get('schema_fingerprint') == schema.fingerprint
+
+        answers = data.get('answers') or {}
+        if isinstance(answers, dict):
+            items = ((schema.index_by_id.get(question_id), value) for question_id, value in answers.items())
+        else:
+            items = ()
+            if answers:
+                logger.warning("Discarding a stored session with answers by position and no schema fingerprint")
+        for index, value in items:
+            if index is None or value is None:
+                continue
+            if not same_schema and not _still_valid(schema, index, value):
+                continue
+            if isinstance(value, str) and value in schema.option_sets[index]:
+                value = sys.intern(value)
+            session.answers[index] = value
+
+        if same_schema:
+            session.current_question = data.get('current_question', 0)
+            session.selected_mask = data.get('selected_mask', 0)
+        else:
+            session.current_question = next(
+                (index for index, answer in enumerate(session.answers) if answer is None), len(schema)
+            )
+            logger.info(
+                f"Restored a session saved on other questions ({data.get('schema_fingerprint')}) onto "
+                f"{schema.fingerprint}: kept {len(session.answers_dict(schema))} answer(s), "
+                f"resuming at question {session.current_question}"
+            )
+        return session
+
+def _still_valid(schema, index, value):
+    """Return True if ``value`` is a possible answer to the schema's question at ``index``."""
+    question = schema[index]
+    if not question.is_choice:
+        return True
+    if question.is_multi_select:
+        if isinstance(value, list):
+            return bool(value) and all(option in schema.option_sets[index] for option in value)
+        return schema.selections.mask_of(index, value) != 0
+    return value in schema.option_sets[index]
+
+def _epoch(value):
+    """Convert a stored start time (epoch seconds or ISO string) to epoch seconds."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value).timestamp()
+        except ValueError:
+            pass
+    return None
@@ -0,0 +1,389 @@
+import time
+import heapq
+import logging
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from telegram import Bot
+from telegram.error import BadRequest, RetryAfter
+from utils.metrics import API_CALL_SECONDS, OUTBOUND_WAIT_SECONDS
+from utils.tracing import TRACER
+
+logger = logging.getLogger(__name__)
+
+# Lower values are sent first
+PRIORITY_HIGH = 0    # callback answers: the user's button spinner waits on them
+PRIORITY_NORMAL = 1  # next questions and replies
+PRIORITY_LOW = 2     # completion messages
+PRIORITY_NAMES = ('high', 'normal', 'low')
+
+_local = threading.local()
+
+@contextmanager
+def priority(level):
+    """Send the outbound calls made on this thread inside the block at ``level``."""
+    previous = getattr(_local, 'priority', None)
+    _local.priority = level
+    try:
+        yield
+    finally:
+        _local.priority = previous
+
+def current_priority(default=PRIORITY_NORMAL):
+    """Return the priority set by an enclosing ``priority()`` block, or ``default``."""
+    level = getattr(_local, 'priority', None)
+    return default if level is None else level
+
+class TokenBucket:
+    """Allows ``rate`` calls per second on average with bursts of up to ``burst`` calls."""
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated', 'blocked_until')
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+        self.blocked_until = 0.0
+
+    def wait_time(self, now):
+        """Return the seconds until a call may be made (0 if one may be made now)."""
+        if self.blocked_until > now:
+            return self.blocked_until - now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def is_idle(self, now):
+        """True when the bucket is full again and can be forgotten."""
+        return self.blocked_until <= now and self.tokens + (now - self.updated) * self.rate >= self.burst
+
+class _Request:
+    __slots__ = ('priority', 'seq', 'chat_id', 'answer', 'call', 'args', 'kwargs', 'future', 'enqueued', 'retries')
+
+    def __init__(self, priority, seq, chat_id, call, args, kwargs, answer=False):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.answer = answer
+        self.call = call
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.enqueued = time.monotonic()
+        self.retries = 0
+
+class OutboundScheduler:
+    """Paces outgoing Telegram API calls with a global and a per-chat token bucket.
+
+    Calls are queued by priority and released as soon as both the global
+    bucket and the chat's bucket allow it; a throttled chat does not hold up
+    other chats. Released calls run on a small thread pool. Each chat's calls
+    are sent one at a time in the order they were queued, so callers that do
+    not wait for a result still see their messages and edits arrive in
+    order. Callback query answers are paced by a bucket of their own, so
+    they never use up the global message limit or wait for it. A call
+    rejected with RetryAfter (HTTP 429) pauses its chat (or every chat, for
+    calls without one, or every answer) for the time Telegram asks and is
+    queued again.
+    """
+
+    def __init__(self, global_rate=30.0, chat_rate=1.0, chat_burst=3, max_workers=8, max_retries=3,
+                 max_idle_chats=10000, global_burst=None, answer_rate=30.0):
+        """Initialize the scheduler.
+
+        Args:
+            global_rate: Calls per second across all chats (Telegram allows about 30).
+            chat_rate: Calls per second to a single chat (Telegram allows about 1).
+            chat_burst: Calls a chat may receive back to back before pacing applies.
+            max_workers: Calls that may be in flight at once.
+            max_retries: Times a call is retried after RetryAfter before failing.
+            max_idle_chats: Number of chat buckets kept before idle ones are pruned.
+            global_burst: Calls that may go out back to back across all chats.
+                Defaults to one second's worth of ``global_rate``.
+            answer_rate: Callback query answers per second, counted apart from ``global_rate``.
+        """
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.max_idle_chats = max_idle_chats
+        now = time.monotonic()
+        self._global = TokenBucket(global_rate, global_burst or max(1.0, global_rate), now)
+        self._answers = TokenBucket(answer_rate, max(1.0, answer_rate), now)
+        self._chats = {}
+        # Heap of (priority, seq, request) ready to be sent, and of
+        # (ready_at, priority, seq, request) waiting for their chat's bucket
+        self._queue = []
+        self._deferred = []
+        # chat_id -> calls not yet finished, in order; only the first is in the heaps or in flight
+        self._chat_calls = {}
+        self._held = 0
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stopping = False
+        self.stats = {'queued': 0, 'sent': 0, 'failed': 0, 'throttled': 0, 'retry_after': 0}
+        # Per priority: [calls, total queue wait, max queue wait]
+        self.waits = [[0, 0.0, 0.0] for _ in PRIORITY_NAMES]
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='outbound')
+        self._thread = threading.Thread(target=self._run, name='outbound-scheduler', daemon=True)
+        self._thread.start()
+
+    def submit(self, chat_id, level, call, /, *args, **kwargs):
+        """Queue ``call(*args, **kwargs)`` and return a Future for its result.
+
+        Args:
+            chat_id: Chat the call targets, or None for calls only limited globally.
+            level: PRIORITY_HIGH, PRIORITY_NORMAL or PRIORITY_LOW.
+        """
+        with self._cond:
+            request = _Request(level, next(self._seq), chat_id, call, args, kwargs)
+            self.stats['queued'] += 1
+            calls = self._chat_calls.get(chat_id) if chat_id is not None else None
+            if calls:
+                # Sent once the chat's earlier calls have finished
+                calls.append(request)
+                self._held += 1
+                return request.future
+            if chat_id is not None:
+                self._chat_calls[chat_id] = deque([request])
+            heapq.heappush(self._queue, (level, request.seq, request))
+            self._cond.notify()
+        return request.future
+
+    def submit_answer(self, call, /, *args, **kwargs):
+        """Queue a callback query answer at PRIORITY_HIGH and return a Future for its result.
+
+        Answers only wait for their own bucket, not for the global limit.
+        """
+        with self._cond:
+            request = _Request(PRIORITY_HIGH, next(self._seq), None, call, args, kwargs, answer=True)
+            self.stats['queued'] += 1
+            heapq.heappush(self._queue, (PRIORITY_HIGH, request.seq, request))
+            self._cond.notify()
+        return request.future
+
+    def call(self, chat_id, call, /, *args, level=None, **kwargs):
+        """Queue a call and wait for its result (or exception)."""
+        if level is None:
+            level = current_priority()
+        # Includes the time spent queued behind the rate limits
+        with TRACER.span(f"telegram.{getattr(call, '__name__', 'call')}"):
+            return self.submit(chat_id, level, call, *args, **kwargs).result()
+
+    def pending(self, chat_id):
+        """Return the Future of the last call queued for ``chat_id``, or None if all have finished."""
+        with self._cond:
+            calls = self._chat_calls.get(chat_id)
+            return calls[-1].future if calls else None
+
+    def depth(self):
+        """Return the number of calls waiting to be sent."""
+        with self._cond:
+            return len(self._queue) + len(self._deferred) + self._held
+
+    def get_stats(self):
+        """Return counters plus queue depth and queue wait per priority."""
+        stats = dict(self.stats)
+        stats['queue_depth'] = self.depth()
+        for name, (count, total, longest) in zip(PRIORITY_NAMES, self.waits):
+            stats[f'wait_mean_{name}'] = total / count if count else 0.0
+            stats[f'wait_max_{name}'] = longest
+        return stats
+
+    def _chat_bucket(self, chat_id, now):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.max_idle_chats:
+                self._chats = {key: b for key, b in self._chats.items() if not b.is_idle(now)}
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, now)
+        return bucket
+
+    def _next_request(self):
+        """Wait for a request both buckets allow, take its tokens and return it (None when stopped)."""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                while self._deferred and self._deferred[0][0] <= now:
+                    _, level, seq, request = heapq.heappop(self._deferred)
+                    heapq.heappush(self._queue, (level, seq, request))
+                if not self._queue:
+                    # Calls held behind one in flight are queued when it finishes
+                    if self._stopping and not self._deferred and not self._chat_calls:
+                        return None
+                    self._cond.wait(self._deferred[0][0] - now if self._deferred else None)
+                    continue
+                level, seq, request = self._queue[0]
+                limit = self._answers if request.answer else self._global
+                wait = limit.wait_time(now)
+                if wait > 0:
+                    if request.answer:
+                        # Messages behind it may still go out under the global limit
+                        heapq.heappop(self._queue)
+                        heapq.heappush(self._deferred, (now + wait, level, seq, request))
+                        self.stats['throttled'] += 1
+                        continue
+                    self._cond.wait(wait)
+                    continue
+                heapq.heappop(self._queue)
+                if request.chat_id is not None:
+                    bucket = self._chat_bucket(request.chat_id, now)
+                    wait = bucket.wait_time(now)
+                    if wait > 0:
+                        # Park it until the chat may receive again; other chats go first
+                        heapq.heappush(self._deferred, (now + wait, level, seq, request))
+                        self.stats['throttled'] += 1
+                        continue
+                    bucket.take()
+                limit.take()
+                waits = self.waits[request.priority]
+                waited = now - request.enqueued
+                waits[0] += 1
+                waits[1] += waited
+                waits[2] = max(waits[2], waited)
+                OUTBOUND_WAIT_SECONDS.labels(PRIORITY_NAMES[request.priority]).observe(waited)
+                return request
+
+    def _run(self):
+        while True:
+            request = self._next_request()
+            if request is None:
+                return
+            self._pool.submit(self._execute, request)
+
+    def _execute(self, request):
+        started = time.perf_counter()
+        try:
+            try:
+                result = request.call(*request.args, **request.kwargs)
+            finally:
+                API_CALL_SECONDS.labels('telegram', getattr(request.call, '__name__', 'call')).observe(
+                    time.perf_counter() - started
+                )
+        except RetryAfter as e:
+            self.stats['retry_after'] += 1
+            if request.retries >= self.max_retries:
+                self.stats['failed'] += 1
+                self._finish(request)
+                request.future.set_exception(e)
+                return
+            request.retries += 1
+            logger.warning(f"Telegram asked to retry after {e.retry_after}s (chat {request.chat_id})")
+            with self._cond:
+                now = time.monotonic()
+                if request.answer:
+                    bucket = self._answers
+                elif request.chat_id is None:
+                    bucket = self._global
+                else:
+                    bucket = self._chat_bucket(request.chat_id, now)
+                bucket.blocked_until = max(bucket.blocked_until, now + e.retry_after)
+                heapq.heappush(self._queue, (request.priority, next(self._seq), request))
+                self._cond.notify()
+        except Exception as e:
+            self.stats['failed'] += 1
+            self._finish(request)
+            request.future.set_exception(e)
+        else:
+            self.stats['sent'] += 1
+            self._finish(request)
+            request.future.set_result(result)
+
+    def _finish(self, request):
+        """Release the next call queued for the request's chat."""
+        if request.chat_id is None:
+            return
+        with self._cond:
+            calls = self._chat_calls[request.chat_id]
+            calls.popleft()
+            if calls:
+                following = calls[0]
+                self._held -= 1
+                heapq.heappush(self._queue, (following.priority, following.seq, following))
+            else:
+                del self._chat_calls[request.chat_id]
+            self._cond.notify()
+
+    def stop(self, timeout=30):
+        """Send every queued call, then stop."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        self._pool.shutdown(wait=True)
+        logger.info(f"Outbound scheduler stopped: {self.get_stats()}")
+
+def _chat_id(args, kwargs):
+    return kwargs['chat_id'] if 'chat_id' in kwargs else (args[0] if args else None)
+
+def _not_modified(error):
+    return isinstance(error, BadRequest) and 'not modified' in str(error).lower()
+
+def _detach(future, name, chat_id):
+    """Log a queued call's failure, and add it to the current trace, once it finishes."""
+    trace = TRACER.current()
+    started = time.perf_counter()
+
+    def finished(future):
+        error = future.exception()
+        if trace is not None:
+            # Includes the time spent queued behind the rate limits
+            trace.record(f"telegram.{name}", started, time.perf_counter() - started,
+                         type(error).__name__ if error else None)
+        if error is not None and not _not_modified(error):
+            logger.error(f"Telegram {name} for chat {chat_id} failed: {str(error)}")
+
+    future.add_done_callback(finished)
+    return future
+
+class RateLimitedMixin:
+    """Routes a bot's outgoing message calls through ``self.scheduler``.
+
+    The calls are queued and return a Future at once instead of the API
+    result, so a handler never waits on the rate limits; nothing in the bot
+    uses the sent Message. Each chat's calls are still sent in order.
+    Failures are logged rather than raised to the caller.
+
+    Mixed into telegram.Bot by RateLimitedBot, and into the benchmark's stub bot.
+    """
+
+    scheduler = None
+
+    def send_message(self, *args, **kwargs):
+        chat_id = _chat_id(args, kwargs)
+        future = self.scheduler.submit(chat_id, current_priority(), super().send_message, *args, **kwargs)
+        return _detach(future, 'send_message', chat_id)
+
+    def edit_message_text(self, *args, **kwargs):
+        # text is the first positional argument here, so chat_id is only ever a keyword
+        chat_id = kwargs.get('chat_id')
+        future = self.scheduler.submit(chat_id, current_priority(), super().edit_message_text, *args, **kwargs)
+        return _detach(future, 'edit_message_text', chat_id)
+
+    def answer_callback_query(self, *args, **kwargs):
+        # Not a chat message: sent ahead of everything else, under the answers' own limit
+        future = self.scheduler.submit_answer(super().answer_callback_query, *args, **kwargs)
+        return _detach(future, 'answer_callback_query', None)
+
+class RateLimitedBot(RateLimitedMixin, Bot):
+    """telegram.Bot that paces send_message, edit_message_text and answer_callback_query.
+
+    Those three return a Future instead of the API result; see RateLimitedMixin.
+    """
+
+    def __init__(self, token, scheduler=None, **kwargs):
+        """Initialize the bot.
+
+        Args:
+            token: Telegram bot token.
+            scheduler: OutboundScheduler to use. Defaults to one with Telegram's documented limits.
+            **kwargs: Passed to telegram.Bot.
+        """
+        super().__init__(token, **kwargs)
+        self.scheduler = scheduler or OutboundScheduler()
@@ -0,0 +1,177 @@
+import logging
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class Section:
+    """A block of the completion message: a heading followed by one line per channel."""
+    key: str
+    heading: str
+    line: str = "\n• {name}: {link}"
+
+# Message blocks in the order they appear after the state line
+SECTIONS = (
+    Section('general', "\n\nImportant general channels:"),
+    Section('topics', "\n\nBased on your interests, we recommend these topic channels:"),
+    Section('leadership', "\n\nLeadership application channels:"),
+    Section('social', "\n\nFollow us on social media:"),
+    Section('linktree', "", "\n\nAll our social links: {link}"),
+    Section('secure', "", "\n\nSecure communication: {link}"),
+)
+
+# (question id, option) -> channel. A question id of None means every user gets
+# the channel; a channel listed under several options is recommended once.
+# An integer link is a forum topic ID, resolved through the TopicDirectory.
+RULES = (
+    (None, None, 'general', "Mental Health Check In", 227321),
+    (None, None, 'general', "Public Announcements", 465),
+    (None, None, 'general', "Official Media & Information", 202409),
+    (None, None, 'general', "Open Discussion", 8684),
+
+    ('beliefs', "Healthcare Rights", 'topics', "Healthcare Advocacy", "https://t.me/c/2399831251/123456"),
+    ('beliefs', "Environmental Issues", 'topics', "Environmental Action", "https://t.me/c/2399831251/234567"),
+    ('beliefs', "Government Reform", 'topics', "Government Reform", "https://t.me/c/2399831251/345678"),
+    ('beliefs', "Economic Justice", 'topics', "Economic Justice", "https://t.me/c/2399831251/456789"),
+    ('activism_type', "Online Advocacy", 'topics', "Digital Activism", "https://t.me/c/2399831251/567890"),
+    ('activism_type', "Direct Action/Protest", 'topics', "Direct Action Planning", "https://t.me/c/2399831251/678901"),
+    ('activism_type', "Policy/Legislative", 'topics', "Policy Working Group", "https://t.me/c/2399831251/789012"),
+    ('skills', "Social Media", 'topics', "Content Creation", "https://t.me/c/2399831251/890123"),
+    ('skills', "Writing/Content", 'topics', "Content Creation", "https://t.me/c/2399831251/890123"),
+    ('skills', "Tech/IT", 'topics', "Tech Team", "https://t.me/c/2399831251/901234"),
+    ('skills', "Event Planning", 'topics', "Event Coordination", "https://t.me/c/2399831251/012345"),
+) + tuple(
+    ('leadership', option, 'leadership', name, link)
+    for option in ("Yes, I'm ready to lead", "Maybe, I'd like to learn first")
+    for name, link in (
+        ("General Leadership", 13132),
+        ("Veterans, Educators & Nurses", 289114),
+        ("Marginalized/Underrepresented Communities", 231957),
+    )
+) + (
+    (None, None, 'social', "BlueSky", "https://bsky.app/profile/voicesignited.bsky.social"),
+    (None, None, 'social', "TikTok", "https://www.tiktok.com/@voices_united"),
+    (None, None, 'social', "Substack", "https://voicesignited.substack.com/"),
+    (None, None, 'social', "YouTube", "https://www.youtube.com/@VoicesIgnited"),
+    (None, None, 'social', "Instagram", "https://www.instagram.com/voicesignited"),
+    (None, None, 'linktree', "Linktree", "https://linktr.ee/voices_ignited"),
+    ('encrypted_communication', "Yes", 'secure', "Keybase", "keybase://team-page/quiz_team"),
+)
+
+COMPLETION_HEADER = (
+    "Thank you for completing the Voices Ignited questionnaire! \n\n"
+    "Welcome to the group! Here are some links to get you started:\n"
+)
+
+class RecommendationIndex:
+    """Completion message builder compiled from a rule table.
+
+    Each distinct channel gets an ID in table order and its message line is
+    formatted once. Rules are inverted into question id -> option -> channel
+    IDs, so building a message is one dictionary lookup per selected option
+    of the few questions that have rules, however many channels exist.
+    Matching channel lines are then joined once, grouped by section.
+    """
+
+    def __init__(self, rules=RULES, sections=SECTIONS, topics=None):
+        """Compile the rule table.
+
+        Args:
+            rules: (question id, option, section key, channel name, link) tuples.
+                A question id of None applies the rule to every user. A link
+                given as an int is a topic ID looked up in ``topics``; rules
+                whose topic is missing or closed are left out.
+            sections: Sections in message order.
+            topics: TopicDirectory providing topic links and state group links.
+        """
+        self.sections = tuple(sections)
+        section_order = {section.key: position for position, section in enumerate(self.sections)}
+        channel_ids = {}
+        # Per channel ID: (section position, formatted line)
+        self._channels = []
+        always = set()
+        # question id -> option -> channel IDs
+        self._index = {}
+        for question_id, option, section_key, name, link in rules:
+            if section_key not in section_order:
+                raise ValueError(f"Rule for {name!r} names unknown section {section_key!r}")
+            if isinstance(link, int):
+                topic = topics.get(link) if topics is not None else None
+                if topic is None:
+                    logger.warning(f"Recommendation {name!r} points at unknown or closed topic {link}")
+                    continue
+                link = topic.link
+            key = (section_key, name, link)
+            channel_id = channel_ids.get(key)
+            if channel_id is None:
+                section = self.sections[section_order[section_key]]
+                channel_id = channel_ids[key] = len(self._channels)
+                self._channels.append((section_order[section_key], section.line.format(name=name, link=link)))
+            if question_id is None:
+                always.add(channel_id)
+            else:
+                targets = self._index.setdefault(question_id, {}).setdefault(option, [])
+                if channel_id not in targets:
+                    targets.append(channel_id)
+        self._always = frozenset(always)
+        self._index = {
+            question_id: {option: tuple(ids) for option, ids in options.items()}
+            for question_id, options in self._index.items()
+        }
+        self.state_lines = {
+            state: f"\n• Your local state group: {link}"
+            for state, link in (topics.state_links if topics is not None else {}).items()
+        }
+        logger.info(f"Compiled {len(self._channels)} recommendation channel(s) from {len(rules)} rule(s)")
+
+    def __len__(self):
+        return len(self._channels)
+
+    def unmatched_rules(self, schema):
+        """Return (question id, option) pairs in the rules that the schema cannot produce."""
+        unmatched = []
+        for question_id, options in self._index.items():
+            index = schema.index_by_id.get(question_id)
+            for option in options:
+                if index is None or option not in schema.option_sets[index]:
+                    unmatched.append((question_id, option))
+        return unmatched
+
+    def channels_for(self, session, schema):
+        """Return the IDs of the channels recommended for a session's answers, in table order."""
+        selected = set(self._always)
+        for question_id, options in self._index.items():
+            answer = session.get(schema, question_id)
+            if answer is None:
+                continue
+            index = schema.index_by_id[question_id]
+            question = schema[index]
+            if question.is_multi_select:
+                chosen = schema.selections.selected(question, schema.selections.mask_of(index, answer))
+            else:
+                chosen = (answer,)
+            for option in chosen:
+                selected.update(options.get(option, ()))
+        return sorted(selected)
+
+    def state_line(self, session, schema):
+        """Return the line pointing the user at their state group, or regional resources."""
+        line = self.state_lines.get(session.get(schema, 'state'))
+        if line is not None:
+            return line
+        region = session.get(schema, 'region')
+        if region:
+            return f"\n• Your region ({region}) resources: https://t.me/c/2399831251/regional_resources"
+        return "\n• State & regional resources: https://t.me/c/2399831251/state_resources"
+
+    def completion_text(self, session, schema):
+        """Build the completion message for a finished session."""
+        parts = [COMPLETION_HEADER, self.state_line(session, schema)]
+        current = None
+        for channel_id in sorted(self.channels_for(session, schema), key=lambda i: self._channels[i][0]):
+            position, line = self._channels[channel_id]
+            if position != current:
+                current = position
+                parts.append(self.sections[position].heading)
+            parts.append(line)
+        return "".join(parts)
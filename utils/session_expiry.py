@@ -0,0 +1,110 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+class SessionExpiry:
+    """Drops quiz sessions that went idle, and the oldest ones beyond a cap.
+
+    Every update touches its user's entry in an OrderedDict kept in
+    last-activity order, so the least recently active user is always first.
+    A session is evicted when nobody touched it for ``ttl`` seconds (checked
+    by ``sweep``, run periodically from the job queue) or, immediately, when
+    tracking a new user would exceed ``max_sessions``. Evicting removes the
+    user's entry from the dispatcher's user_data and from the session store,
+    so abandoned quizzes do not accumulate over a long uptime.
+    """
+
+    def __init__(self, ttl=86400.0, max_sessions=10000, timer=time.monotonic):
+        """Initialize the expiry policy.
+
+        Args:
+            ttl: Seconds of inactivity after which a session is dropped.
+            max_sessions: Sessions kept at most; the least recently active go first.
+            timer: Clock used for activity times (monotonic seconds).
+        """
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.timer = timer
+        self.dispatcher = None
+        # user_id -> time of the last update, least recently active first
+        self._last_seen = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'expired': 0, 'evicted': 0, 'sweeps': 0}
+
+    def __len__(self):
+        return len(self._last_seen)
+
+    def attach(self, dispatcher):
+        """Manage ``dispatcher``'s user_data, including sessions restored from persistence.
+
+        Restored sessions have no known activity time, so they get a full TTL from now.
+        """
+        self.dispatcher = dispatcher
+        now = self.timer()
+        with self._lock:
+            for user_id in list(dispatcher.user_data):
+                self._last_seen.setdefault(user_id, now)
+        self._evict_overflow()
+
+    def touch(self, user_id):
+        """Record activity from ``user_id``."""
+        with self._lock:
+            self._last_seen[user_id] = self.timer()
+            self._last_seen.move_to_end(user_id)
+        if len(self._last_seen) > self.max_sessions:
+            self._evict_overflow()
+
+    def touch_update(self, update, context):
+        """Handler callback (group -2, ahead of every other handler): record activity for the update's user."""
+        if update is not None and update.effective_user is not None:
+            self.touch(update.effective_user.id)
+
+    def sweep(self):
+        """Evict every session idle for longer than the TTL.
+
+        Returns:
+            Number of sessions evicted.
+        """
+        cutoff = self.timer() - self.ttl
+        expired = []
+        with self._lock:
+            while self._last_seen:
+                user_id, last_seen = next(iter(self._last_seen.items()))
+                if last_seen > cutoff:
+                    break
+                del self._last_seen[user_id]
+                expired.append(user_id)
+            self.stats['sweeps'] += 1
+            self.stats['expired'] += len(expired)
+        for user_id in expired:
+            self._drop(user_id)
+        if expired:
+            logger.info(f"Expired {len(expired)} idle session(s), {len(self._last_seen)} active: {self.stats}")
+        return len(expired)
+
+    def sweep_job(self, context):
+        """Job callback: run ``sweep``."""
+        self.sweep()
+
+    def _evict_overflow(self):
+        evicted = []
+        with self._lock:
+            while len(self._last_seen) > self.max_sessions:
+                user_id, _ = self._last_seen.popitem(last=False)
+                evicted.append(user_id)
+            self.stats['evicted'] += len(evicted)
+        for user_id in evicted:
+            self._drop(user_id)
+        if evicted:
+            logger.info(f"Evicted {len(evicted)} least recently active session(s) over the limit of {self.max_sessions}")
+
+    def _drop(self, user_id):
+        if self.dispatcher is None:
+            return
+        self.dispatcher.user_data.pop(user_id, None)
+        if self.dispatcher.persistence and self.dispatcher.persistence.store_user_data:
+            # An empty session deletes the stored row
+            self.dispatcher.persistence.update_user_data(user_id, {})
@@ -0,0 +1,157 @@
+import os
+import json
+import sqlite3
+import threading
+import logging
+from collections import defaultdict
+from telegram.ext import BasePersistence
+
+logger = logging.getLogger(__name__)
+
+def _snapshot(obj):
+    """Copy session data as plain JSON values; session objects (QuizSession) become their ``to_dict()``."""
+    if hasattr(obj, 'to_dict'):
+        return obj.to_dict()
+    if isinstance(obj, dict):
+        return {key: _snapshot(value) for key, value in list(obj.items())}
+    if isinstance(obj, (list, tuple)):
+        return [_snapshot(item) for item in obj]
+    return obj
+
+class SqliteSessionPersistence(BasePersistence):
+    """Persistence backend that keeps quiz sessions (user_data) in SQLite.
+
+    The dispatcher calls ``update_user_data`` after every update; that call only
+    records the latest copy of the session in memory. A background writer
+    commits all changed sessions in one WAL transaction per ``flush_interval``,
+    so a burst of multi-select toggles costs a single disk sync and no handler
+    ever waits on the disk. On restart ``get_user_data`` restores every stored
+    session, so users resume where they left off.
+    """
+
+    def __init__(self, db_path=None, flush_interval=0.5):
+        """Initialize the persistence backend.
+
+        Args:
+            db_path: Path to the SQLite file. Defaults to 'sessions/sessions.db'.
+            flush_interval: Seconds between background commits of changed sessions.
+        """
+        super().__init__(store_user_data=True, store_chat_data=False, store_bot_data=False)
+        self.db_path = db_path or os.path.join(
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'sessions', 'sessions.db'
+        )
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self.flush_interval = flush_interval
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS user_data ('
+            ' user_id INTEGER PRIMARY KEY,'
+            ' data TEXT NOT NULL'
+            ')'
+        )
+        self._dirty = {}
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._stopping = False
+        self.stats = {'updates': 0, 'commits': 0, 'sessions_written': 0}
+        self._thread = threading.Thread(target=self._run, name='session-writer', daemon=True)
+        self._thread.start()
+        logger.info(f"SqliteSessionPersistence initialized at {self.db_path}")
+
+    @classmethod
+    def replace_bot(cls, obj):
+        """Snapshot session data before the dispatcher hands it to ``update_user_data``.
+
+        BasePersistence deep-copies the data looking for Bot instances, which
+        would copy the whole compiled schema a QuizSession points at on every
+        update. Sessions hold no Bot, so a ``to_dict()`` snapshot is enough.
+        """
+        return _snapshot(obj)
+
+    def insert_bot(self, obj):
+        """Stored sessions are plain JSON and hold no Bot to restore."""
+        return obj
+
+    def get_user_data(self):
+        """Load every stored session."""
+        user_data = defaultdict(dict)
+        with self._write_lock:
+            for user_id, data in self._conn.execute('SELECT user_id, data FROM user_data'):
+                user_data[user_id] = json.loads(data)
+        logger.info(f"Restored {len(user_data)} session(s) from {self.db_path}")
+        return user_data
+
+    def get_chat_data(self):
+        return defaultdict(dict)
+
+    def get_bot_data(self):
+        return {}
+
+    def get_conversations(self, name):
+        return {}
+
+    def update_conversation(self, name, key, new_state):
+        pass
+
+    def update_chat_data(self, chat_id, data):
+        pass
+
+    def update_bot_data(self, data):
+        pass
+
+    def update_user_data(self, user_id, data):
+        """Record the latest session copy; the background writer persists it."""
+        with self._cond:
+            self._dirty[user_id] = data
+            self.stats['updates'] += 1
+            if len(self._dirty) == 1:
+                self._cond.notify()
+
+    def _write_dirty(self):
+        """Commit every changed session in a single transaction."""
+        with self._write_lock:
+            with self._cond:
+                dirty, self._dirty = self._dirty, {}
+            if not dirty:
+                return
+            try:
+                upserts = [(user_id, json.dumps(data)) for user_id, data in dirty.items() if data]
+                deletes = [(user_id,) for user_id, data in dirty.items() if not data]
+                self._conn.execute('BEGIN')
+                self._conn.executemany('INSERT OR REPLACE INTO user_data (user_id, data) VALUES (?, ?)', upserts)
+                self._conn.executemany('DELETE FROM user_data WHERE user_id = ?', deletes)
+                self._conn.execute('COMMIT')
+                self.stats['commits'] += 1
+                self.stats['sessions_written'] += len(dirty)
+            except Exception as e:
+                logger.error(f"Failed to persist {len(dirty)} session(s): {str(e)}", exc_info=True)
+                if self._conn.in_transaction:
+                    self._conn.execute('ROLLBACK')
+                # Keep the failed sessions for the next attempt unless they were updated since
+                with self._cond:
+                    for user_id, data in dirty.items():
+                        self._dirty.setdefault(user_id, data)
+
+    def _run(self):
+        """Writer loop: coalesce updates for ``flush_interval`` seconds, then commit."""
+        while True:
+            with self._cond:
+                while not self._dirty and not self._stopping:
+                    self._cond.wait()
+                if not self._stopping:
+                    self._cond.wait(self.flush_interval)
+                stopping = self._stopping
+            self._write_dirty()
+            if stopping:
+                return
+
+    def flush(self):
+        """Write pending sessions and stop the writer. Called by the Updater on shutdown."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self._thread.join()
+        self._write_dirty()
+        logger.info(f"Session store flushed: {self.stats}")
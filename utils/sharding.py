@@ -0,0 +1,159 @@
+import queue
+import logging
+import threading
+import multiprocessing
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks that a worker is still alive while waiting for room in its queue
+LIVENESS_INTERVAL = 1.0
+
+class ShardRouter:
+    """Routes updates to worker processes by user ID and collects their completed responses.
+
+    Every update from a given user goes to the same worker (``user_id % N``),
+    so each session lives in exactly one process and needs no cross-process
+    locking. Workers send completed response rows back over a shared queue and
+    the front process writes them to the shared sinks (Sheets, CSV, text log)
+    as the single writer. A worker found dead when an update is routed to it
+    is restarted with a fresh queue; updates still queued for it are lost.
+    """
+
+    def __init__(self, num_workers, worker_target, worker_args=(), response_sink=None, max_pending=1000):
+        """Initialize the router.
+
+        Args:
+            num_workers: Number of worker processes.
+            worker_target: Worker entry point, called as
+                ``worker_target(index, update_queue, result_queue, *worker_args)``.
+                It must be a module-level function (workers are spawned).
+            worker_args: Extra picklable arguments for the worker.
+            response_sink: Callable taking (row_data, headers) for rows sent back by workers.
+            max_pending: Maximum number of queued updates per worker.
+        """
+        self.num_workers = num_workers
+        self.worker_target = worker_target
+        self.worker_args = tuple(worker_args)
+        self.response_sink = response_sink
+        self.max_pending = max_pending
+        # Spawn rather than fork so workers never inherit the front process's threads or open databases
+        self._context = multiprocessing.get_context('spawn')
+        self.update_queues = [self._context.Queue(max_pending) for _ in range(num_workers)]
+        self.result_queue = self._context.Queue()
+        self.processes = [self._process(index) for index in range(num_workers)]
+        self._restart_lock = threading.Lock()
+        self._stopping = False
+        self._collector = threading.Thread(target=self._collect, name='shard-collector', daemon=True)
+        self.stats = {'routed': [0] * num_workers, 'rejected': 0, 'responses': 0, 'restarts': 0}
+
+    def _process(self, index):
+        return self._context.Process(
+            target=self.worker_target,
+            args=(index, self.update_queues[index], self.result_queue) + self.worker_args,
+            name=f'shard-worker-{index}'
+        )
+
+    def start(self):
+        """Start the worker processes and the response collector."""
+        for process in self.processes:
+            process.start()
+        self._collector.start()
+        logger.info(f"Started {self.num_workers} shard worker process(es)")
+
+    def shard_for(self, update):
+        """Return the worker index that owns this update's user."""
+        if update.effective_user:
+            key = update.effective_user.id
+        elif update.effective_chat:
+            key = update.effective_chat.id
+        else:
+            key = update.update_id
+        return key % self.num_workers
+
+    def _ensure_worker(self, index):
+        """Restart the worker if it has exited; its queued updates are dropped with the old queue."""
+        if self.processes[index].exitcode is None or self._stopping:
+            return
+        with self._restart_lock:
+            process = self.processes[index]
+            if process.exitcode is None:
+                return
+            old_queue = self.update_queues[index]
+            try:
+                lost = old_queue.qsize()
+            except NotImplementedError:
+                lost = 'unknown'
+            logger.error(
+                f"{process.name} exited with code {process.exitcode}, restarting it; "
+                f"{lost} queued update(s) lost"
+            )
+            # Nothing reads the old queue any more, so don't wait to flush it at exit
+            old_queue.cancel_join_thread()
+            old_queue.close()
+            self.update_queues[index] = self._context.Queue(self.max_pending)
+            self.processes[index] = self._process(index)
+            self.processes[index].start()
+            self.stats['restarts'] += 1
+
+    def submit(self, update):
+        """Route an update, waiting while the worker's queue is full.
+
+        While waiting, the worker is checked every LIVENESS_INTERVAL seconds,
+        so a worker that died with a full queue is restarted rather than
+        blocking the caller forever.
+        """
+        index = self.shard_for(update)
+        data = update.to_dict()
+        while True:
+            self._ensure_worker(index)
+            try:
+                self.update_queues[index].put(data, timeout=LIVENESS_INTERVAL)
+                break
+            except queue.Full:
+                continue
+        self.stats['routed'][index] += 1
+
+    def submit_nowait(self, update):
+        """Route an update without waiting (WebhookServer interface).
+
+        Returns:
+            False if the worker's queue is full and the update was rejected.
+        """
+        index = self.shard_for(update)
+        self._ensure_worker(index)
+        try:
+            self.update_queues[index].put_nowait(update.to_dict())
+        except queue.Full:
+            self.stats['rejected'] += 1
+            return False
+        self.stats['routed'][index] += 1
+        return True
+
+    def _collect(self):
+        """Write rows returned by workers to the shared sinks, one at a time."""
+        while True:
+            item = self.result_queue.get()
+            if item is None:
+                return
+            row_data, headers = item
+            self.stats['responses'] += 1
+            try:
+                self.response_sink(row_data, headers)
+            except Exception as e:
+                logger.error(f"Error saving response from shard worker: {str(e)}", exc_info=True)
+
+    def stop(self, timeout=60):
+        """Ask workers to finish their queues, then stop collecting responses."""
+        self._stopping = True
+        for process, update_queue in zip(self.processes, self.update_queues):
+            # A dead worker's queue may be full and is never read
+            if process.exitcode is None:
+                update_queue.put(None)
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning(f"{process.name} did not stop in time, terminating it")
+                process.terminate()
+        self.result_queue.put(None)
+        self._collector.join(timeout)
+        logger.info(f"Shard router stopped: {self.stats}")
@@ -0,0 +1,107 @@
+import os
+import json
+import sqlite3
+import threading
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+class SheetsOutbox:
+    """Crash-safe, append-only outbox for rows waiting to reach Google Sheets.
+
+    Rows are stored in a SQLite database in WAL mode, keyed by an idempotency
+    key so the same response is never stored (or replayed) twice. Rows are
+    deleted only once the sheet has accepted them.
+    """
+
+    def __init__(self, db_path=None):
+        """Initialize the outbox.
+
+        Args:
+            db_path: Path to the SQLite file. Defaults to 'local_backups/sheets_outbox.db'.
+        """
+        self.db_path = db_path or os.path.join(
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'local_backups', 'sheets_outbox.db'
+        )
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        # WAL + NORMAL survives process crashes; only an OS crash can lose the last commits
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS outbox ('
+            ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+            ' row_key TEXT NOT NULL UNIQUE,'
+            ' row_data TEXT NOT NULL,'
+            ' created_at TEXT NOT NULL,'
+            ' attempts INTEGER NOT NULL DEFAULT 0,'
+            ' last_error TEXT'
+            ')'
+        )
+        logger.info(f"SheetsOutbox initialized at {self.db_path} with {self.count()} pending row(s)")
+
+    def add(self, row_key, row_data):
+        """Durably store a row before it is sent.
+
+        Args:
+            row_key: Idempotency key for the row.
+            row_data: List of cell values.
+
+        Returns:
+            True if the row was stored, False if the key was already present.
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                'INSERT OR IGNORE INTO outbox (row_key, row_data, created_at) VALUES (?, ?, ?)',
+                (row_key, json.dumps(row_data), datetime.now().isoformat())
+            )
+            return cursor.rowcount == 1
+
+    def pending(self, limit=500, exclude=()):
+        """Return the oldest undelivered rows as (row_key, row_data) pairs.
+
+        Args:
+            limit: Maximum number of rows to return.
+            exclude: Keys to skip, e.g. rows already queued in memory.
+        """
+        exclude = set(exclude)
+        with self._lock:
+            cursor = self._conn.execute(
+                'SELECT row_key, row_data FROM outbox ORDER BY id LIMIT ?',
+                (limit + len(exclude),)
+            )
+            rows = [(key, json.loads(data)) for key, data in cursor if key not in exclude]
+        return rows[:limit]
+
+    def mark_delivered(self, row_keys):
+        """Remove rows that the sheet has accepted."""
+        if not row_keys:
+            return
+        with self._lock:
+            self._conn.execute('BEGIN')
+            self._conn.executemany('DELETE FROM outbox WHERE row_key = ?', [(k,) for k in row_keys])
+            self._conn.execute('COMMIT')
+
+    def record_failure(self, row_keys, error=None):
+        """Bump the attempt counter on rows whose delivery failed."""
+        if not row_keys:
+            return
+        with self._lock:
+            self._conn.execute('BEGIN')
+            self._conn.executemany(
+                'UPDATE outbox SET attempts = attempts + 1, last_error = ? WHERE row_key = ?',
+                [(error, k) for k in row_keys]
+            )
+            self._conn.execute('COMMIT')
+
+    def count(self):
+        """Return the number of undelivered rows."""
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM outbox').fetchone()[0]
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
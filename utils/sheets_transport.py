@@ -0,0 +1,164 @@
+import time
+import queue
+import logging
+import datetime
+import threading
+
+logger = logging.getLogger(__name__)
+
+class SheetsTransport:
+    """Thread-safe pool of authorized HTTP clients for googleapiclient requests.
+
+    httplib2.Http objects are not thread-safe, so each request checks one out
+    of the pool and is executed on it (``request.execute(http=...)``), the
+    pattern googleapiclient documents for threads. A checked-out client
+    belongs to one thread until the request returns. Each client keeps its
+    TLS connection open between requests, and the most recently used client
+    is handed out first so warm connections are reused. At most
+    ``pool_size`` requests run at once; further callers wait for a free
+    client.
+
+    The access token is shared by every client and refreshed under a lock
+    once it is within ``refresh_margin`` seconds of expiry, so requests
+    never carry an expired token and concurrent callers refresh it once.
+    """
+
+    def __init__(self, credentials, pool_size=4, refresh_margin=300.0, timeout=30.0, http_factory=None):
+        """Initialize the transport.
+
+        Args:
+            credentials: google.auth credentials shared by every client.
+            pool_size: Maximum number of HTTP clients (and concurrent requests).
+            refresh_margin: Seconds before expiry at which the token is refreshed.
+            timeout: Socket timeout in seconds for each client.
+            http_factory: Callable returning a new httplib2.Http. Defaults to
+                httplib2.Http(timeout=timeout).
+        """
+        self.credentials = credentials
+        self.pool_size = pool_size
+        self.refresh_margin = refresh_margin
+        self.timeout = timeout
+        self._http_factory = http_factory
+        # LIFO: the client used last has the connection most likely still open
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._token_lock = threading.Lock()
+        self.stats = {
+            'requests': 0, 'errors': 0, 'connections_opened': 0, 'connections_reused': 0,
+            'token_refreshes': 0, 'waits': 0, 'max_wait': 0.0
+        }
+
+    def _new_client(self):
+        import httplib2
+        import google_auth_httplib2
+        http = self._http_factory() if self._http_factory else httplib2.Http(timeout=self.timeout)
+        return google_auth_httplib2.AuthorizedHttp(self.credentials, http=http)
+
+    def _checkout(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.pool_size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                return self._new_client()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        started = time.monotonic()
+        client = self._idle.get()
+        waited = time.monotonic() - started
+        with self._lock:
+            self.stats['waits'] += 1
+            self.stats['max_wait'] = max(self.stats['max_wait'], waited)
+        return client
+
+    def _token_expiring(self):
+        credentials = self.credentials
+        if not credentials.token:
+            return True
+        expiry = getattr(credentials, 'expiry', None)
+        if expiry is None:
+            return False
+        # google.auth keeps expiry as a naive UTC datetime
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        return (expiry - now).total_seconds() <= self.refresh_margin
+
+    def _refresh_token(self, http):
+        if not self._token_expiring():
+            return
+        with self._token_lock:
+            # Another thread may have refreshed it while this one waited
+            if not self._token_expiring():
+                return
+            import google_auth_httplib2
+            self.credentials.refresh(google_auth_httplib2.Request(http))
+            with self._lock:
+                self.stats['token_refreshes'] += 1
+            logger.debug("Refreshed the Sheets access token, expires %s", self.credentials.expiry)
+
+    @staticmethod
+    def _open_sockets(http):
+        return {conn.sock for conn in list(http.connections.values()) if getattr(conn, 'sock', None) is not None}
+
+    def execute(self, request, num_retries=0):
+        """Execute a googleapiclient HttpRequest on a pooled client and return its result."""
+        client = self._checkout()
+        healthy = True
+        try:
+            self._refresh_token(client.http)
+            before = self._open_sockets(client.http)
+            try:
+                return request.execute(http=client, num_retries=num_retries)
+            except Exception:
+                healthy = False
+                raise
+            finally:
+                opened = len(self._open_sockets(client.http) - before)
+                with self._lock:
+                    self.stats['requests'] += 1
+                    self.stats['errors'] += not healthy
+                    self.stats['connections_opened'] += opened
+                    self.stats['connections_reused'] += 0 if opened else 1
+        finally:
+            if not healthy:
+                # Never reuse a connection left in an unknown state by a failed request
+                self._close_client(client)
+            self._idle.put(client)
+
+    @staticmethod
+    def _close_client(client):
+        for conn in list(client.http.connections.values()):
+            try:
+                conn.close()
+            except Exception:
+                pass
+        client.http.connections.clear()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['clients'] = self._created
+        stats['idle_clients'] = self._idle.qsize()
+        requests = stats['requests']
+        stats['reuse_ratio'] = stats['connections_reused'] / requests if requests else 0.0
+        return stats
+
+    def close(self):
+        """Close the idle clients' connections."""
+        while True:
+            try:
+                client = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._close_client(client)
+        with self._lock:
+            self._created = 0
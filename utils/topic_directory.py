@@ -0,0 +1,174 @@
+import os
+import re
+import csv
+import logging
+import threading
+from dataclasses import dataclass
+from types import MappingProxyType
+
+logger = logging.getLogger(__name__)
+
+US_STATES = frozenset((
+    "Alabama", "Alaska", "Arizona", "Arkansas", "California",
+    "Colorado", "Connecticut", "Delaware", "Florida", "Georgia",
+    "Hawaii", "Idaho", "Illinois", "Indiana", "Iowa",
+    "Kansas", "Kentucky", "Louisiana", "Maine", "Maryland",
+    "Massachusetts", "Michigan", "Minnesota", "Mississippi", "Missouri",
+    "Montana", "Nebraska", "Nevada", "New Hampshire", "New Jersey",
+    "New Mexico", "New York", "North Carolina", "North Dakota", "Ohio",
+    "Oklahoma", "Oregon", "Pennsylvania", "Rhode Island", "South Carolina",
+    "South Dakota", "Tennessee", "Texas", "Utah", "Vermont",
+    "Virginia", "Washington", "West Virginia", "Wisconsin", "Wyoming"
+))
+
+def normalize_title(title):
+    """Lower-case a title and drop asides in parentheses and extra whitespace.
+
+    "Connecticut (why so hard to spell?)" and "connecticut" both become "connecticut".
+    """
+    return " ".join(re.sub(r"\([^)]*\)", " ", title).split()).casefold()
+
+_STATES_BY_NORMALIZED = MappingProxyType({normalize_title(state): state for state in US_STATES})
+
+@dataclass(frozen=True)
+class Topic:
+    """One forum topic (a row of forum_topics_with_links.csv)."""
+    topic_id: int
+    title: str
+    link: str
+    closed: bool = False
+    pinned: bool = False
+
+class _Snapshot:
+    """Indexes built from one read of the CSV; replaced whole on reload."""
+
+    __slots__ = ('by_id', 'by_title', 'by_normalized', 'state_links', 'pinned')
+
+    def __init__(self, topics):
+        self.by_id = {}
+        self.by_title = {}
+        self.by_normalized = {}
+        state_links = {}
+        pinned = []
+        for topic in topics:
+            self.by_id[topic.topic_id] = topic
+            self.by_title.setdefault(topic.title, topic)
+            normalized = normalize_title(topic.title)
+            self.by_normalized.setdefault(normalized, topic)
+            state = _STATES_BY_NORMALIZED.get(normalized)
+            if state is not None:
+                state_links.setdefault(state, topic.link)
+            if topic.pinned:
+                pinned.append(topic)
+        self.state_links = MappingProxyType(state_links)
+        self.pinned = tuple(pinned)
+
+class TopicDirectory:
+    """Forum topics from forum_topics_with_links.csv, indexed for O(1) lookups.
+
+    One pass over the file builds indexes by topic ID, exact title and
+    normalized title, plus the state name -> link map used for state
+    groups. Closed topics that are not pinned are archived threads and are
+    left out; closed pinned topics (announcements) are read-only but still
+    worth joining, so they stay. A reload builds a fresh set of indexes and
+    swaps it in with one assignment, so readers never see a partial load.
+    """
+
+    def __init__(self, path, include_closed=False):
+        """Load the directory.
+
+        Args:
+            path: Path to forum_topics_with_links.csv.
+            include_closed: Keep closed, unpinned topics too.
+        """
+        self.path = path
+        self.include_closed = include_closed
+        self._lock = threading.Lock()
+        self._file_signature = None
+        self._snapshot = _Snapshot(())
+        self.reload()
+
+    def __len__(self):
+        return len(self._snapshot.by_id)
+
+    def __contains__(self, topic_id):
+        return topic_id in self._snapshot.by_id
+
+    def get(self, topic_id):
+        """Return the topic with this ID, or None."""
+        return self._snapshot.by_id.get(topic_id)
+
+    def find(self, title):
+        """Return the topic with this title, matched exactly first and then normalized, or None."""
+        snapshot = self._snapshot
+        topic = snapshot.by_title.get(title)
+        if topic is None:
+            topic = snapshot.by_normalized.get(normalize_title(title))
+        return topic
+
+    @property
+    def state_links(self):
+        """Read-only mapping of state name (as in questions.json) -> state group link."""
+        return self._snapshot.state_links
+
+    @property
+    def pinned(self):
+        """Pinned topics in file order."""
+        return self._snapshot.pinned
+
+    def _signature(self):
+        stat = os.stat(self.path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _read(self):
+        topics = []
+        with open(self.path, 'r', encoding='utf-8', newline='') as f:
+            for row in csv.DictReader(f):
+                try:
+                    topic = Topic(
+                        topic_id=int(row['topic_id']),
+                        title=row['title'].strip(),
+                        link=row['link'].strip(),
+                        closed=row.get('closed', '').strip().lower() == 'true',
+                        pinned=row.get('pinned', '').strip().lower() == 'true'
+                    )
+                except (KeyError, ValueError, AttributeError) as e:
+                    logger.warning(f"Skipping malformed topic row in {self.path}: {row} ({str(e)})")
+                    continue
+                if topic.closed and not topic.pinned and not self.include_closed:
+                    continue
+                topics.append(topic)
+        return topics
+
+    def reload(self):
+        """Re-read the CSV and swap in new indexes.
+
+        Returns:
+            True if the file was loaded, False if it could not be read (the
+            previous indexes are kept).
+        """
+        with self._lock:
+            try:
+                # Remember the signature even on failure so a broken file is reported once
+                self._file_signature = self._signature()
+                snapshot = _Snapshot(self._read())
+            except Exception as e:
+                logger.error(f"Error loading forum topics from {self.path}: {str(e)}")
+                return False
+            self._snapshot = snapshot
+            logger.info(f"Loaded {len(snapshot.by_id)} forum topics ({len(snapshot.state_links)} state groups)")
+            return True
+
+    def check_for_changes(self):
+        """Reload the CSV if it changed since the last load.
+
+        Returns:
+            True if a new version was loaded.
+        """
+        try:
+            if self._signature() == self._file_signature:
+                return False
+        except OSError as e:
+            logger.error(f"Cannot check {self.path} for changes: {str(e)}")
+            return False
+        return self.reload()
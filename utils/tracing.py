@@ -0,0 +1,235 @@
+import os
+import json
+import time
+import heapq
+import random
+import functools
+import logging
+import itertools
+import threading
+from contextlib import nullcontext
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+class Span:
+    """One timed step of a trace; times are perf_counter seconds."""
+    __slots__ = ('name', 'start', 'duration', 'error', 'children')
+
+    def __init__(self, name, start):
+        self.name = name
+        self.start = start
+        self.duration = None
+        self.error = None
+        self.children = []
+
+    def to_dict(self, origin):
+        data = {
+            'name': self.name,
+            'offset_ms': round((self.start - origin) * 1000, 3),
+            'duration_ms': None if self.duration is None else round(self.duration * 1000, 3),
+        }
+        if self.error:
+            data['error'] = self.error
+        if self.children:
+            data['children'] = [child.to_dict(origin) for child in list(self.children)]
+        return data
+
+class Trace:
+    """Spans recorded while handling one update, rooted at the handler that received it."""
+    __slots__ = ('root', 'attributes', 'started_at')
+
+    def __init__(self, name, attributes):
+        self.attributes = attributes
+        self.started_at = time.time()
+        self.root = Span(name, time.perf_counter())
+
+    @property
+    def duration(self):
+        return self.root.duration
+
+    def record(self, name, start, duration, error=None):
+        """Add a finished span under the root, from any thread.
+
+        Used for work the update hands off, such as sink writes, which may
+        finish after the handler has returned.
+        """
+        span = Span(name, start)
+        span.duration = duration
+        span.error = error
+        self.root.children.append(span)
+
+    def to_dict(self):
+        origin = self.root.start
+        return {
+            'started_at': datetime.fromtimestamp(self.started_at).isoformat(timespec='milliseconds'),
+            'duration_ms': self.root.to_dict(origin)['duration_ms'],
+            'attributes': dict(self.attributes),
+            'spans': self.root.to_dict(origin),
+        }
+
+    def summary(self):
+        """One line: the root duration and the five slowest spans under it at any depth."""
+        spans, pending = [], list(self.root.children)
+        while pending:
+            span = pending.pop()
+            pending.extend(span.children)
+            if span.duration is not None:
+                spans.append(span)
+        children = sorted(spans, key=lambda span: span.duration, reverse=True)
+        steps = ', '.join(f"{child.name} {child.duration * 1000:.1f}" for child in children[:5])
+        attributes = ' '.join(f"{key}={value}" for key, value in self.attributes.items())
+        return f"{self.root.name} {self.duration * 1000:.1f} ms [{attributes}] {steps}".rstrip()
+
+# Returned by trace() and span() when nothing is recorded
+_NOT_TRACED = nullcontext()
+
+class _SpanBlock:
+    __slots__ = ('stack', 'span')
+
+    def __init__(self, stack, name):
+        self.stack = stack
+        self.span = Span(name, time.perf_counter())
+
+    def __enter__(self):
+        self.stack[-1].children.append(self.span)
+        self.stack.append(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        span = self.span
+        span.duration = time.perf_counter() - span.start
+        if exc_type is not None:
+            span.error = exc_type.__name__
+        self.stack.pop()
+
+class _SkippedBlock:
+    """Marks the thread as inside an unsampled update, so nested handlers are not traced either."""
+    __slots__ = ('local',)
+
+    def __init__(self, local):
+        self.local = local
+
+    def __enter__(self):
+        self.local.stack = ()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.local.stack = None
+
+class _TraceBlock:
+    __slots__ = ('tracer', 'trace')
+
+    def __init__(self, tracer, trace):
+        self.tracer = tracer
+        self.trace = trace
+
+    def __enter__(self):
+        local = self.tracer._local
+        local.trace = self.trace
+        local.stack = [self.trace.root]
+        return self.trace
+
+    def __exit__(self, exc_type, exc, tb):
+        root = self.trace.root
+        root.duration = time.perf_counter() - root.start
+        if exc_type is not None:
+            root.error = exc_type.__name__
+        local = self.tracer._local
+        local.trace = None
+        local.stack = None
+        self.tracer._finish(self.trace)
+
+class Tracer:
+    """Traces a sample of updates and keeps the slowest ones.
+
+    ``trace()`` opens a trace on the calling thread; ``span()`` calls made on
+    that thread while it is open become nested spans, and outside a trace
+    they cost one thread-local lookup. Only ``sample_rate`` of the updates
+    are traced, and only the ``keep`` slowest finished traces are held.
+    """
+
+    def __init__(self, sample_rate=1.0, keep=20):
+        self.sample_rate = sample_rate
+        self.keep = keep
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # Min-heap of (duration, seq, trace): the fastest kept trace is replaced first
+        self._slowest = []
+        self._seq = itertools.count()
+        self.stats = {'traced': 0, 'skipped': 0}
+
+    def configure(self, sample_rate=None, keep=None):
+        """Change the sample rate or the number of traces kept."""
+        with self._lock:
+            if sample_rate is not None:
+                self.sample_rate = sample_rate
+            if keep is not None:
+                self.keep = keep
+                while len(self._slowest) > keep:
+                    heapq.heappop(self._slowest)
+
+    def current(self):
+        """The trace open on this thread, or None."""
+        return getattr(self._local, 'trace', None)
+
+    def trace(self, name, **attributes):
+        """Trace the block as a new update, or as a span when a trace is already open."""
+        stack = getattr(self._local, 'stack', None)
+        if stack:
+            return _SpanBlock(stack, name)
+        if stack is not None:
+            # Inside an update that was not sampled
+            return _NOT_TRACED
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            self.stats['skipped'] += 1
+            return _SkippedBlock(self._local)
+        return _TraceBlock(self, Trace(name, attributes))
+
+    def span(self, name):
+        """Time the block as a child of the innermost open span; a no-op outside a trace."""
+        stack = getattr(self._local, 'stack', None)
+        if not stack:
+            return _NOT_TRACED
+        return _SpanBlock(stack, name)
+
+    def traced(self, name):
+        """Decorator form of ``trace()`` for handlers taking (update, context)."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(handler_self, update, context, *args, **kwargs):
+                user = getattr(update, 'effective_user', None)
+                with self.trace(name, update_id=getattr(update, 'update_id', None),
+                                user_id=getattr(user, 'id', None)):
+                    return func(handler_self, update, context, *args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _finish(self, trace):
+        duration = trace.duration
+        with self._lock:
+            self.stats['traced'] += 1
+            if len(self._slowest) < self.keep:
+                heapq.heappush(self._slowest, (duration, next(self._seq), trace))
+            elif self._slowest and duration > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, (duration, next(self._seq), trace))
+
+    def slowest(self, limit=None):
+        """Kept traces, slowest first."""
+        with self._lock:
+            traces = [trace for _, _, trace in sorted(self._slowest, reverse=True)]
+        return traces[:limit] if limit else traces
+
+    def clear(self):
+        with self._lock:
+            self._slowest.clear()
+
+    def dump(self, path):
+        """Write the kept traces to ``path`` as JSON, slowest first; returns how many."""
+        traces = self.slowest()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump([trace.to_dict() for trace in traces], f, indent=2, default=str)
+        return len(traces)
+
+# Process-wide tracer used by the handlers, the outbound scheduler and the completion pipeline
+TRACER = Tracer()
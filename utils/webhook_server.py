@@ -0,0 +1,114 @@
+import json
+import asyncio
+import logging
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+class WebhookServer:
+    """Minimal asyncio HTTP listener that feeds Telegram webhook updates into an AsyncUpdatePipeline.
+
+    Each POST to ``path`` is parsed into an Update and queued without waiting
+    for it to be handled, so Telegram gets a 200 straight away. When the
+    pipeline queue is full the server answers 503 and Telegram retries the
+    update later, which applies backpressure instead of growing memory.
+    Connections are kept alive between requests.
+    """
+
+    def __init__(self, pipeline, bot, listen='127.0.0.1', port=8443, path='/telegram', max_body=1024 * 1024):
+        """Initialize the server.
+
+        Args:
+            pipeline: AsyncUpdatePipeline that processes the updates.
+            bot: Bot instance attached to deserialized updates.
+            listen: Interface to bind to.
+            port: TCP port to bind to; 0 picks a free port.
+            path: URL path that accepts updates. Use a hard-to-guess value in production.
+            max_body: Largest accepted request body in bytes.
+        """
+        self.pipeline = pipeline
+        self.bot = bot
+        self.listen = listen
+        self.port = port
+        self.path = path
+        self.max_body = max_body
+        self.server = None
+        self.stats = {'requests': 0, 'accepted': 0, 'rejected': 0, 'bad_requests': 0}
+
+    async def start(self):
+        """Start listening; ``self.port`` holds the bound port afterwards."""
+        self.server = await asyncio.start_server(self._handle_connection, self.listen, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        logger.info(f"Webhook server listening on {self.listen}:{self.port}{self.path}")
+
+    async def stop(self):
+        """Stop accepting connections."""
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+            logger.info(f"Webhook server stopped: {self.stats}")
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self._respond(writer, 400, 'Bad Request', keep_alive=False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                length = int(headers.get('content-length', '0') or 0)
+                if length > self.max_body:
+                    await self._respond(writer, 413, 'Payload Too Large', keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                status, reason = self._handle_request(method, target, body)
+                await self._respond(writer, status, reason, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            logger.error(f"Error in webhook connection: {str(e)}", exc_info=True)
+        finally:
+            writer.close()
+
+    def _handle_request(self, method, target, body):
+        """Validate a request and queue its update. Returns (status, reason)."""
+        self.stats['requests'] += 1
+        if target != self.path:
+            return 404, 'Not Found'
+        if method != 'POST':
+            return 405, 'Method Not Allowed'
+        try:
+            update = Update.de_json(json.loads(body), self.bot)
+        except Exception as e:
+            self.stats['bad_requests'] += 1
+            logger.warning(f"Rejected malformed webhook update: {str(e)}")
+            return 400, 'Bad Request'
+        if not self.pipeline.submit_nowait(update):
+            self.stats['rejected'] += 1
+            return 503, 'Service Unavailable'
+        self.stats['accepted'] += 1
+        return 200, 'OK'
+
+    async def _respond(self, writer, status, reason, keep_alive):
+        connection = 'keep-alive' if keep_alive else 'close'
+        writer.write(
+            f'HTTP/1.1 {status} {reason}\r\nContent-Length: 0\r\nConnection: {connection}\r\n\r\n'.encode('latin-1')
+        )
+        await writer.drain()